@@ -8,7 +8,6 @@ from stompest.sync import Stomp
 import logging
 
 logging.basicConfig()
-logging.getLogger().setLevel(logging.DEBUG)
 
 # TODO: Read from config file....
 CONFIG = StompConfig("tcp://localhost:61613")
@@ -28,13 +28,13 @@ API
 """
 import functools
 import logging
-import time
 
 from twisted.internet import defer, task, reactor
 
 from stompest.error import StompCancelledError, StompConnectionError, StompFrameError, StompProtocolError, \
     StompAlreadyRunningError
-from stompest.protocol import StompSession, StompSpec
+from stompest.protocol import StompAckBatcher, StompCoarseClock, StompMessageCache, StompSession, StompSpec, commands
+from stompest.trace import StompFrameTracer
 from stompest.util import checkattr, cloneFrame
 
 from .protocol import StompProtocolCreator
@@ -52,9 +52,17 @@ class Stomp(object):
     :param config: A :class:`~.StompConfig` object.
     :param receiptTimeout: When a STOMP frame was sent to the broker and a **RECEIPT** frame was requested, this is the time (in seconds) to wait for the **RECEIPT** frame to arrive. If :obj:`None`, we will wait indefinitely.
     :param heartBeatThresholds: tolerance thresholds (relative to the negotiated heart-beat periods). The default :obj:`None` is equivalent to the content of the class atrribute :attr:`DEFAULT_HEART_BEAT_THRESHOLDS`. Example: ``{'client': 0.6, 'server' 2.5}`` means that the client will send a heart-beat if it had shown no activity for 60 % of the negotiated client heart-beat period and that the client will disconnect if the server has shown no activity for 250 % of the negotiated server heart-beat period.
+    :param ackWindow: If not :obj:`None`, the **ACK** frames for automatically acked messages are batched: this is a :obj:`dict` of keyword arguments for the :class:`~.StompAckBatcher` which decides when the acks are due. Example: ``{'size': 100, 'delay': 0.5}`` means that a subscription with ack mode **client** will send one cumulative **ACK** frame per 100 handled messages, or after at most 0.5 s, whichever comes first. For the ack mode **client-individual**, the **ACK** frames of one window are written at once.
+    :param tracer: A :class:`~.StompFrameTracer` which logs the wire-level traffic. The default :obj:`None` means a tracer which logs all frames.
+    :param clock: The clock of the :attr:`~.async.client.Stomp.session` which measures the heart-beat activity (see :mod:`.protocol.clock`). The default :obj:`None` means a :class:`~.StompCoarseClock` (with the :attr:`~.StompCoarseClock.RESOLUTION` of 1 ms) which is ticked once per incoming frame, per write, and per heart-beat check.
+    :param maxUnacked: The maximum number of in-flight messages (see :attr:`~.StompSession.unacked`). When it is reached, the client stops reading from the wire until messages are acked or nacked. If :obj:`None`, there is no such limit.
+    :param maxUnackedBytes: The same limit for the total body size of all in-flight messages.
+    :param maxReceipts: The maximum number of outstanding receipts (see :attr:`~.StompSession.receipts`). If this limit is exceeded, the client gives up on the oldest receipt, and the operation which waits for it errs back with a :class:`~.StompCancelledError`. If :obj:`None`, there is no such limit.
     
     .. note :: All API methods which may request a **RECEIPT** frame from the broker -- which is indicated by the **receipt** parameter -- will wait for the **RECEIPT** response until this client's **receiptTimeout**. Here, "wait" is to be understood in the asynchronous sense that the method's :class:`twisted.internet.defer.Deferred` result will only call back then. If **receipt** is :obj:`None`, no such header is sent, and the callback will be triggered earlier.
 
+    .. note :: If the failover URI has the option **timeout**, :meth:`~.async.client.Stomp.send` waits until the broker reads again if the write buffer of the connection is full, and errs back with a :class:`~.StompSendTimeout` if this takes longer than the timeout. The connection is not closed, and the frame stays in the write buffer, so do not send it again.
+
     .. seealso :: :class:`~.StompConfig` for how to set configuration options, :class:`~.StompSession` for session state, :mod:`.protocol.commands` for all API options which are documented here.
     """
     _protocolCreatorFactory = StompProtocolCreator
@@ -63,14 +71,23 @@ class Stomp(object):
     MESSAGE_FAILED_HEADER = 'message-failed'
     DEFAULT_HEART_BEAT_THRESHOLDS = {'client': 0.8, 'server': 2.0}
 
-    def __init__(self, config, receiptTimeout=None, heartBeatThresholds=None):
+    def __init__(self, config, receiptTimeout=None, heartBeatThresholds=None, ackWindow=None, tracer=None, clock=None, maxUnacked=None, maxUnackedBytes=None, maxReceipts=None):
         self._config = config
         self._receiptTimeout = receiptTimeout
         self._heartBeatThresholds = heartBeatThresholds or self.DEFAULT_HEART_BEAT_THRESHOLDS
-
-        self._session = StompSession(self._config.version, self._config.check)
+        self._acks = StompAckBatcher(clock=reactor.seconds, **ackWindow) if (ackWindow is not None) else None #@UndefinedVariable
+        self._ackFlush = None
+        self._tracer = tracer or StompFrameTracer()
+
+        clock = clock or StompCoarseClock(resolution=StompCoarseClock.RESOLUTION)
+        self._tick = getattr(clock, 'tick', clock)
+        self._protocolCreator = self._protocolCreatorFactory(self._config.uri, self._config.socketOptions)
+        options = self._protocolCreator.options
+        cache = StompMessageCache(options['maxCacheSize']) if options['trackMessages'] else None
+        self._sendTimeout = None if (options['timeout'] < 0) else (options['timeout'] / 1000.0)
+        self._session = StompSession(self._config.version, self._config.check, receiptTimeout, maxReceipts=maxReceipts, clock=clock, maxUnacked=maxUnacked, maxUnackedBytes=maxUnackedBytes, cache=cache)
         self._protocol = None
-        self._protocolCreator = self._protocolCreatorFactory(self._config.uri)
+        self._paused = False
 
         self.log = logging.getLogger(LOG_CATEGORY)
 
@@ -92,6 +109,16 @@ class Stomp(object):
 
         self._heartBeats = {}
 
+        # hot-standby connection (failover option backup=true)
+        self._backup = None
+        self._backupOpening = None
+        self._backupDelay = None
+
+        # migration to a preferred broker (failover option priorityBackup=true)
+        self._connectedSince = None
+        self._probeTimer = None
+        self._probing = None
+
     @property
     def disconnected(self):
         """This :class:`twisted.internet.defer.Deferred` calls back when the connection to the broker was lost. It will err back when the connection loss was unexpected or caused by another error.
@@ -104,12 +131,24 @@ class Stomp(object):
         """
         return self._session
 
+    @property
+    def failover(self):
+        """The :class:`~.StompFailoverTransport` which chooses the brokers to connect to. Use its :meth:`~.StompFailoverTransport.update` method to change the list of brokers at runtime.
+        """
+        return self._protocolCreator.failover
+
     def sendFrame(self, frame):
         """Send a raw STOMP frame.
 
         .. note :: If we are not connected, this method, and all other API commands for sending STOMP frames except :meth:`~.async.client.Stomp.connect`, will raise a :class:`~.StompConnectionError`. Use this command only if you have to bypass the :class:`~.StompSession` logic and you know what you're doing!
         """
         self._protocol.send(frame)
+        self._tick()
+        self.session.sent()
+
+    def _sendFrames(self, frames):
+        self._protocol.sendFrames(frames)
+        self._tick()
         self.session.sent()
 
     #
@@ -128,6 +167,10 @@ class Stomp(object):
 
         .. note :: Only one connect attempt may be pending at a time. Any other attempt will result in a :class:`~.StompAlreadyRunningError`.
 
+        .. note :: If the failover URI has the option **backup=true**, a second STOMP connection to another broker is established in the background and kept alive with heart-beats. When the connection is lost unexpectedly, the backup connection takes over at once: the active subscriptions are replayed on it, the :attr:`disconnected` :class:`twisted.internet.defer.Deferred` does not fire, and a new backup connection is established.
+
+        .. note :: If the failover URI has the option **priorityBackup=true** and the client is connected to a remote broker, it tries to connect to a local broker every **priorityProbeInterval** ms. If this succeeds (and the client has been connected for at least **priorityDwellTime** ms), it migrates: it stops reading from the current broker, waits for the pending message handlers to complete, disconnects, and replays the active subscriptions on the new connection. The :attr:`disconnected` :class:`twisted.internet.defer.Deferred` does not fire.
+
         .. seealso :: The :mod:`.protocol.failover` and :mod:`~.protocol.session` modules for the details of subscription replay and failover transport.
         """
         frame = self.session.connect(self._config.login, self._config.passcode, headers, versions, host, heartBeats)
@@ -139,8 +182,12 @@ class Stomp(object):
         else:
             raise StompConnectionError('Already connected')
 
+        race = self._protocolCreator.race if self._protocolCreator.options['race'] else None
         try:
-            self._protocol = yield self._protocolCreator.connect(connectTimeout, self.session.version, self._onFrame, self._onConnectionLost)
+            if race:
+                self._protocol, connectedFrame = yield race(connectTimeout, connectedTimeout, frame, self.session.version, self._onFrame, self._onConnectionLost, self._config.contentLength, self._tracer, self._sendTimeout)
+            else:
+                self._protocol = yield self._protocolCreator.connect(connectTimeout, self.session.version, self._onFrame, self._onConnectionLost, self._config.contentLength, self._tracer, self._sendTimeout)
         except Exception as e:
             self.log.error('Endpoint connect failed')
             raise
@@ -148,16 +195,33 @@ class Stomp(object):
         self._disconnected = defer.Deferred()
         self._disconnectReason = None
 
+        started = reactor.seconds()
         try:
             with self._connecting(None, self.log) as connected:
-                self.sendFrame(frame)
+                if race:
+                    self.session.sent()
+                    self._onFrame(connectedFrame)
+                else:
+                    self.sendFrame(frame)
                 yield wait(connected, connectedTimeout, StompCancelledError('STOMP broker did not answer on time [timeout=%s]' % connectedTimeout))
         except Exception as e:
             self.log.error('Could not establish STOMP session. Disconnecting ...')
+            if not race:
+                self._protocolCreator.failover.failed(self._protocol.broker)
             yield self.disconnect(failure=e)
 
+        if not race: # the race has measured the handshake itself
+            self._protocolCreator.failover.established(self._protocol.broker, reactor.seconds() - started)
+
         self._replay()
 
+        self._connectParameters = (headers, versions, host, heartBeats)
+        self._backupParameters = (connectTimeout, connectedTimeout, frame)
+        if self._protocolCreator.options['backup']:
+            self._backupDelay = None
+            self._openBackup()
+        self._scheduleProbe()
+
         defer.returnValue(self)
 
     @connected
@@ -174,6 +238,7 @@ class Stomp(object):
         if self._disconnecting:
             raise StompAlreadyRunningError('Already disconnecting')
         self._disconnecting = True
+        self._stopProbe()
         self._disconnect(receipt, failure, timeout)
         return self.disconnected
 
@@ -196,6 +261,7 @@ class Stomp(object):
                     self.log.info('All handlers complete. Resuming disconnect ...')
 
             if self.session.state == self.session.CONNECTED:
+                self._flushAcks(flush=True)
                 frame = self.session.disconnect(receipt)
                 try:
                     self.sendFrame(frame)
@@ -219,17 +285,22 @@ class Stomp(object):
 
         Send a **SEND** frame.
         """
+        protocol = self._protocol
         self.sendFrame(self.session.send(destination, body, headers, receipt))
+        yield protocol.drained()
         yield self._waitForReceipt(receipt)
 
     @connected
     @defer.inlineCallbacks
-    def ack(self, frame, receipt=None):
-        """ack(frame, receipt=None)
+    def ack(self, frame, receipt=None, trusted=False):
+        """ack(frame, receipt=None, trusted=False)
 
         Send an **ACK** frame for a received **MESSAGE** frame.
+
+        :param trusted: See :meth:`~.StompSession.ack`.
         """
-        self.sendFrame(self.session.ack(frame, receipt))
+        self.sendFrame(self.session.ack(frame, receipt, trusted))
+        self._throttle()
         yield self._waitForReceipt(receipt)
 
     @connected
@@ -240,8 +311,34 @@ class Stomp(object):
         Send a **NACK** frame for a received **MESSAGE** frame.
         """
         self.sendFrame(self.session.nack(frame, receipt))
+        if self._acks is not None:
+            full = self._acks.discard(frame) # the batched acks of later messages must not wait for this one
+            self._scheduleAcks(0 if full else None)
+        self._throttle()
         yield self._waitForReceipt(receipt)
 
+    @connected
+    @defer.inlineCallbacks
+    def ackAll(self, receipt=None):
+        """ackAll(receipt=None)
+
+        Ack all in-flight messages in one write (including those whose acks are batched).
+
+        .. seealso :: :meth:`~.StompSession.ackAll`
+        """
+        yield self._all(self.session.ackAll, receipt)
+
+    @connected
+    @defer.inlineCallbacks
+    def nackAll(self, receipt=None):
+        """nackAll(receipt=None)
+
+        Nack all in-flight messages in one write (including those whose acks are batched).
+
+        .. seealso :: :meth:`~.StompSession.nackAll`
+        """
+        yield self._all(self.session.nackAll, receipt)
+
     @connected
     @defer.inlineCallbacks
     def begin(self, transaction=None, receipt=None):
@@ -291,9 +388,11 @@ class Stomp(object):
         """
         if not callable(handler):
             raise ValueError('Cannot subscribe (handler is missing): %s' % handler)
+        headers = dict(headers or {})
+        ackMode = headers.setdefault(StompSpec.ACK_HEADER, self.DEFAULT_ACK_MODE)
         frame, token = self.session.subscribe(destination, headers, receipt, {'handler': handler, 'errorDestination': errorDestination, 'onMessageFailed': onMessageFailed})
-        ack = ack and (frame.headers.setdefault(StompSpec.ACK_HEADER, self.DEFAULT_ACK_MODE) in StompSpec.CLIENT_ACK_MODES)
-        self._subscriptions[token] = {'destination': destination, 'handler': self._createHandler(handler), 'ack': ack, 'errorDestination': errorDestination, 'onMessageFailed': onMessageFailed}
+        ack = ack and (ackMode in StompSpec.CLIENT_ACK_MODES)
+        self._subscriptions[token] = {'destination': destination, 'handler': self._createHandler(handler), 'ack': ack, 'ackMode': ackMode, 'errorDestination': errorDestination, 'onMessageFailed': onMessageFailed}
         self.sendFrame(frame)
         yield self._waitForReceipt(receipt)
         defer.returnValue(token)
@@ -313,6 +412,9 @@ class Stomp(object):
         except:
             self.log.warning('Cannot unsubscribe (subscription id unknown): %s=%s' % token)
             raise
+        if self._acks:
+            frames = self._acks.remove(token)
+            frames and self._sendFrames([self.session.ack(f, trusted=True) for f in frames])
         self.sendFrame(frame)
         yield self._waitForReceipt(receipt)
 
@@ -320,6 +422,7 @@ class Stomp(object):
     # callbacks for received STOMP frames
     #
     def _onFrame(self, frame):
+        self._tick()
         self.session.received()
         if not frame:
             return
@@ -331,6 +434,8 @@ class Stomp(object):
 
     def _onConnected(self, frame):
         self.session.connected(frame)
+        self._connectedSince = reactor.seconds()
+        self.failover.advertised(frame.headers)
         self.log.info('Connected to stomp broker [session=%s]' % self.session.id)
         self._connecting[None].callback(None)
         self._beats()
@@ -365,12 +470,16 @@ class Stomp(object):
         except:
             self.log.error('[%s] Ignoring message (no handler found): %s' % (messageId, frame.info()))
             defer.returnValue(None)
+        self._throttle()
+
+        if subscription['ack'] and (self._acks is not None):
+            self._acks.delivered(token, frame, subscription['ackMode'])
 
         with self._messages(messageId, self.log):
             try:
                 yield subscription['handler'](self, frame)
                 if subscription['ack']:
-                    self.ack(frame)
+                    self._ack(token, frame, subscription)
             except Exception as e:
                 try:
                     self._onMessageFailed(e, frame, subscription)
@@ -379,7 +488,7 @@ class Stomp(object):
                         self.disconnect(failure=e)
                 finally:
                     if subscription['ack']:
-                        self.ack(frame)
+                        self._ack(token, frame, subscription)
 
     def _onReceipt(self, frame):
         receipt = self.session.receipt(frame)
@@ -434,6 +543,59 @@ class Stomp(object):
     # private helpers
     #
 
+    def _ack(self, token, frame, subscription):
+        if self._acks is None:
+            self.ack(frame, trusted=True)
+            return
+        full = self._acks.completed(token, frame, subscription['ackMode'])
+        self._scheduleAcks(0 if full else None)
+
+    def _flushAcks(self, flush=False):
+        if self._ackFlush and self._ackFlush.active():
+            self._ackFlush.cancel()
+        self._ackFlush = None
+        if self._acks is None:
+            return
+        frames = self._acks.flush() if flush else self._acks.due()
+        if frames:
+            self._sendFrames([self.session.ack(frame, trusted=True) for frame in frames])
+            self._throttle()
+        self._scheduleAcks()
+
+    def _all(self, create, receipt):
+        if self._acks is not None:
+            self._acks.clear() # these messages are in flight as well
+        frames = create(receipt)
+        frames and self._sendFrames(frames)
+        self._throttle()
+        return self._waitForReceipt(receipt)
+
+    def _throttle(self):
+        # stop reading from the wire while too many messages are in flight
+        full = self.session.unacked.full
+        if (full == self._paused) or (not self._protocol):
+            return
+        self._paused = full
+        transport = self._protocol.transport
+        if full:
+            self.log.warning('Too many messages in flight %s: pausing' % self.session.unacked.statistics())
+            transport.pauseProducing()
+        else:
+            self.log.info('Resuming (messages in flight: %d)' % len(self.session.unacked))
+            transport.resumeProducing()
+
+    def _scheduleAcks(self, delay=None):
+        if delay is None:
+            deadline = self._acks.deadline
+            if deadline is None:
+                return
+            delay = max(0, deadline - reactor.seconds()) #@UndefinedVariable
+        if self._ackFlush and self._ackFlush.active():
+            if self._ackFlush.getTime() <= reactor.seconds() + delay: #@UndefinedVariable
+                return
+            self._ackFlush.cancel()
+        self._ackFlush = reactor.callLater(delay, self._flushAcks) #@UndefinedVariable
+
     def _beat(self, which):
         try:
             self._heartBeats.pop(which).cancel()
@@ -456,7 +618,7 @@ class Stomp(object):
         if not heartBeat:
             return -1
         last = {'client': self.session.lastSent, 'server': self.session.lastReceived}[which]
-        elapsed = time.time() - last
+        elapsed = self._tick() - last
         return max((self._heartBeatThresholds[which] * heartBeat / 1000.0) - elapsed, 0)
 
     def _beats(self):
@@ -471,16 +633,26 @@ class Stomp(object):
 
     def _onConnectionLost(self, reason):
         self._protocol = None
+        self._paused = False
         self.log.info('Disconnected: %s' % reason.getErrorMessage())
-        if not self._disconnecting:
+        self._stopProbe()
+        promote = (self._backup is not None) and (not self._disconnecting)
+        if not (self._disconnecting or promote):
             self._disconnectReason = StompConnectionError('Unexpected connection loss [%s]' % reason.getErrorMessage())
-        self.session.close(flush=not self._disconnectReason)
+        self.session.close(flush=not (self._disconnectReason or promote))
+        if self._acks is not None:
+            self._acks.clear() # the broker will redeliver unacked messages anyway
+            self._flushAcks()
         self._beats()
         for operations in (self._connecting, self._messages, self._receipts):
             for waiting in operations.values():
                 if not waiting.called:
                     waiting.errback(StompCancelledError('In-flight operation cancelled (connection lost)'))
                     waiting.addErrback(lambda _: None)
+        if promote:
+            self._promoteBackup()
+            return
+        self._closeBackup()
         if self._disconnectReason:
             self.log.debug('Calling disconnected deferred errback: %s' % self._disconnectReason)
             self._disconnected.errback(self._disconnectReason)
@@ -491,15 +663,193 @@ class Stomp(object):
         self._disconnectReason = None
         self._disconnected = None
 
+    def _openBackup(self, delay=0):
+        if len(self._protocolCreator.failover.brokers()) < 2:
+            self.log.warning('Cannot open a backup connection: there is no other broker')
+            return
+        connectTimeout, connectedTimeout, frame = self._backupParameters
+        opening = self._backupOpening = task.deferLater(reactor, delay, lambda: None)
+        opening.addCallback(lambda _: self._protocolCreator.backup(self._protocol.broker, connectTimeout, connectedTimeout, frame, self.session.version, self._onBackupFrame, self._onBackupConnectionLost, self._config.contentLength, self._tracer, self._sendTimeout))
+        opening.addCallback(self._onBackupConnected)
+        opening.addErrback(self._onBackupFailed)
+
+    def _onBackupConnected(self, result):
+        self._backupOpening = None
+        if result is None:
+            self._onBackupFailed(None)
+            return
+        protocol, frame = result
+        _, _, _, (_, clientHeartBeat) = commands.connected(frame, commands.versions(self.session.version))
+        beats = None
+        if clientHeartBeat:
+            beats = task.LoopingCall(protocol.send, commands.beat(self.session.version))
+            beats.start(self._heartBeatThresholds['client'] * clientHeartBeat / 1000.0, now=False)
+        self._backup = (protocol, frame, beats)
+        self._backupDelay = None
+        self.log.info('Backup connection established [broker=%(host)s:%(port)d]' % protocol.broker)
+
+    def _onBackupFailed(self, failure):
+        self._backupOpening = None
+        if failure is not None:
+            if failure.check(defer.CancelledError):
+                return
+            self.log.warning('Could not open backup connection [%s]' % failure.getErrorMessage())
+        options = self._protocolCreator.options
+        delay = options['initialReconnectDelay'] if (self._backupDelay is None) else (self._backupDelay * options['backOffMultiplier'])
+        self._backupDelay = min(delay, options['maxReconnectDelay'])
+        self._openBackup(self._backupDelay / 1000.0)
+
+    def _onBackupFrame(self, frame):
+        if frame and (frame.command == StompSpec.ERROR):
+            self.log.warning('Backup connection received %s' % frame.info())
+            self._backup[0].loseConnection()
+
+    def _onBackupConnectionLost(self, reason):
+        self.log.warning('Backup connection lost [%s]' % reason.getErrorMessage())
+        self._closeBackup()
+        self._onBackupFailed(None)
+
+    def _closeBackup(self):
+        if self._backupOpening is not None:
+            self._backupOpening.cancel()
+        if self._backup is None:
+            return
+        protocol, _, beats = self._backup
+        self._backup = None
+        if (beats is not None) and beats.running:
+            beats.stop()
+        protocol._onConnectionLost = lambda _: None
+        protocol.send(commands.disconnect())
+        protocol.loseConnection()
+
+    def _promoteBackup(self):
+        protocol, frame, beats = self._backup
+        self._backup = None
+        if (beats is not None) and beats.running:
+            beats.stop()
+        self.log.info('Promoting backup connection [broker=%(host)s:%(port)d]' % protocol.broker)
+        if self._takeOver(protocol, frame):
+            self._openBackup()
+            self._scheduleProbe()
+
+    def _takeOver(self, protocol, frame):
+        # continue the session on a protocol which has already received its CONNECTED frame
+        protocol._onFrame = self._onFrame
+        protocol._onConnectionLost = self._onConnectionLost
+        self._protocol = protocol
+        headers, versions, host, heartBeats = self._connectParameters
+        self.session.connect(self._config.login, self._config.passcode, headers, versions, host, heartBeats)
+        try:
+            with self._connecting(None, self.log):
+                self.session.sent()
+                self._onFrame(frame)
+        except Exception as e:
+            self.log.error('Could not take over connection [%s]' % e)
+            protocol.loseConnection()
+            return False
+        self._replay()
+        return True
+
+    def _scheduleProbe(self, delay=None):
+        self._stopProbe()
+        interval = self._protocolCreator.options['priorityProbeInterval'] / 1000.0
+        if not (interval and self._protocol and self.failover.preferred(self._protocol.broker)):
+            return
+        self._probeTimer = reactor.callLater(interval if (delay is None) else delay, self._probe) #@UndefinedVariable
+
+    def _stopProbe(self):
+        if (self._probeTimer is not None) and self._probeTimer.active():
+            self._probeTimer.cancel()
+        self._probeTimer = None
+        if self._probing is not None:
+            self._probing.cancel()
+
+    def _probe(self):
+        self._probeTimer = None
+        remaining = self._protocolCreator.options['priorityDwellTime'] / 1000.0 - (reactor.seconds() - self._connectedSince)
+        if remaining > 0:
+            self._scheduleProbe(remaining)
+            return
+        connectTimeout, connectedTimeout, frame = self._backupParameters
+        lost = [] # the new connection is useless if it is lost or receives an ERROR frame before the migration
+
+        def onFrame(frame):
+            if frame and (frame.command == StompSpec.ERROR):
+                lost.append(frame)
+
+        probing = self._probing = self._protocolCreator.preferred(self._protocol.broker, connectTimeout, connectedTimeout, frame, self.session.version, onFrame, lost.append, self._config.contentLength, self._tracer, self._sendTimeout)
+        probing.addCallback(self._migrate, lost)
+        probing.addErrback(self._onProbeFailed)
+
+    def _onProbeFailed(self, failure):
+        self._probing = None
+        if failure.check(defer.CancelledError):
+            return
+        self.log.warning('Could not probe preferred brokers [%s]' % failure.getErrorMessage())
+        self._scheduleProbe()
+
+    @defer.inlineCallbacks
+    def _migrate(self, result, lost):
+        self._probing = None
+        if result is None:
+            self._scheduleProbe()
+            return
+        protocol, frame = result
+        current = self._protocol
+        self.log.info('Preferred broker %(host)s:%(port)d is available: migrating ...' % protocol.broker)
+        current.transport.pauseProducing() # no more messages from the current broker
+        if self._messages:
+            self.log.info('Waiting for outstanding message handlers to finish ...')
+            timeout = self._protocolCreator.options['priorityProbeInterval'] / 1000.0
+            try:
+                yield task.cooperate(iter([wait(handler, timeout, StompCancelledError('Handlers did not finish in time')) for handler in self._messages.values()])).whenDone()
+            except StompCancelledError as e:
+                self.log.warning('Migration cancelled [%s]' % e)
+        if self._messages or lost or self._disconnecting or (self._protocol is not current):
+            protocol._onConnectionLost = lambda _: None
+            protocol.send(commands.disconnect())
+            protocol.loseConnection()
+            if self._protocol is current:
+                if not self._paused:
+                    current.transport.resumeProducing()
+                self._scheduleProbe()
+            return
+        self._flushAcks(flush=True)
+        current._onFrame = lambda _: None
+        current._onConnectionLost = lambda _: None
+        current.send(self.session.disconnect())
+        current.loseConnection()
+        self.session.close(flush=False)
+        for waiting in self._receipts.values():
+            if not waiting.called:
+                waiting.errback(StompCancelledError('In-flight operation cancelled (migrating to another broker)'))
+                waiting.addErrback(lambda _: None)
+        self._paused = False
+        self._closeBackup()
+        if self._takeOver(protocol, frame):
+            if self._protocolCreator.options['backup']:
+                self._openBackup()
+            self._scheduleProbe()
+
     def _replay(self):
         for (destination, headers, receipt, context) in self.session.replay():
             self.log.info('Replaying subscription: %s' % headers)
             self.subscribe(destination, headers=headers, receipt=receipt, **context)
+        messages = self.session.resend()
+        if messages:
+            self.log.info('Sending %d unconfirmed message(s) again' % len(messages))
+            self._sendFrames(messages)
 
     @defer.inlineCallbacks
     def _waitForReceipt(self, receipt):
         if receipt is None:
             defer.returnValue(None)
         with self._receipts(receipt, self.log) as receiptArrived:
+            self._dropReceipts()
             timeout = self._receiptTimeout
             yield wait(receiptArrived, timeout, StompCancelledError('Receipt did not arrive on time: %s [timeout=%s]' % (receipt, timeout)))
+
+    def _dropReceipts(self):
+        for receipt in self.session.droppedReceipts():
+            if (receipt in self._receipts) and (not self._receipts[receipt].called):
+                self._receipts[receipt].errback(StompCancelledError('Receipt was given up on (too many outstanding receipts): %s' % receipt))
@@ -1,9 +1,13 @@
+import collections
 import logging
 
 from twisted.internet import defer, reactor, task
+from twisted.python import failure
 from twisted.internet.protocol import Factory, Protocol
 
-from stompest.protocol import StompFailoverTransport, StompParser
+from stompest.error import StompCancelledError, StompConnectionError, StompProtocolError, StompSendTimeout
+from stompest.protocol import StompFailoverTransport, StompParser, StompSocketOptions, StompSpec
+from stompest.trace import StompFrameTracer
 
 from .util import endpointFactory
 
@@ -13,7 +17,15 @@ class StompProtocol(Protocol):
     #
     # twisted.internet.Protocol interface overrides
     #
+    def connectionMade(self):
+        if self._sendTimeout is not None: # let the transport tell us when its write buffer is full
+            self.transport.registerProducer(self, True)
+
     def connectionLost(self, reason):
+        waiters, self._waiters = self._waiters, []
+        for (waiter, timer) in waiters:
+            timer.cancel()
+            waiter.errback(StompConnectionError('Connection lost before the write buffer was drained'))
         try:
             self._onConnectionLost(reason)
         finally:
@@ -26,29 +38,72 @@ class StompProtocol(Protocol):
             frame = self._parser.get()
             if frame is None:
                 break
-            if self.log.isEnabledFor(logging.DEBUG):
-                self.log.debug('Received %s' % frame.info())
+            self.tracer.received(frame)
             try:
                 self._onFrame(frame)
             except Exception as e:
                 self.log.error('Unhandled error in frame handler: %s' % e)
 
-    def __init__(self, version, onFrame, onConnectionLost):
+    #
+    # twisted.internet.interfaces.IPushProducer interface
+    #
+    def pauseProducing(self):
+        self._paused = True
+
+    def resumeProducing(self):
+        self._paused = False
+        waiters, self._waiters = self._waiters, []
+        for (waiter, timer) in waiters:
+            timer.cancel()
+            waiter.callback(None)
+
+    def stopProducing(self):
+        pass
+
+    def __init__(self, version, onFrame, onConnectionLost, contentLength=False, tracer=None, sendTimeout=None):
         self._onFrame = onFrame
         self._onConnectionLost = onConnectionLost
 
-        # leave the used logger public in case the user wants to override it
+        # leave the used logger and frame tracer public in case the user wants to override them
         self.log = logging.getLogger(LOG_CATEGORY)
+        self.tracer = tracer or StompFrameTracer()
 
         self._parser = StompParser(version)
+        self._contentLength = contentLength
+
+        # the transport pauses us while the broker does not read
+        self._sendTimeout = sendTimeout
+        self._paused = False
+        self._waiters = []
+
+        # the broker this protocol is connected to (set by the StompProtocolCreator)
+        self.broker = None
 
     #
     # user interface
     #
     def send(self, frame):
-        if self.log.isEnabledFor(logging.DEBUG):
-            self.log.debug('Sending %s' % frame.info())
-        self.transport.write(str(frame))
+        self.tracer.sending(frame)
+        self.transport.write(frame.render(self._contentLength))
+
+    def sendFrames(self, frames):
+        for frame in frames:
+            self.tracer.sending(frame)
+        self.transport.write(''.join(frame.render(self._contentLength) for frame in frames))
+
+    def drained(self):
+        """Returns a :class:`twisted.internet.defer.Deferred` which calls back as soon as the write buffer of the transport is not full (that is, immediately unless the broker has stopped reading). If this takes longer than **sendTimeout** seconds, it errs back with a :class:`~.StompSendTimeout` (the buffered data is still written when the broker resumes reading)."""
+        if not self._paused:
+            return defer.succeed(None)
+        waiter = defer.Deferred()
+
+        def expire():
+            self._waiters.remove(entry)
+            waiter.errback(StompSendTimeout('Write buffer not drained within %s seconds' % self._sendTimeout))
+
+        entry = (waiter, reactor.callLater(self._sendTimeout, expire))
+        self._waiters.append(entry)
+        return waiter
 
     def loseConnection(self):
         self.transport.loseConnection()
@@ -70,26 +125,171 @@ class StompProtocolCreator(object):
     failoverFactory = StompFailoverTransport
 
     @classmethod
-    def endpointFactory(cls, broker, timeout=None):
-        return endpointFactory(broker, timeout)
+    def endpointFactory(cls, broker, timeout=None, socketOptions=None):
+        return endpointFactory(broker, timeout, socketOptions)
 
-    def __init__(self, uri):
+    def __init__(self, uri, socketOptions=None):
         self._failover = self.failoverFactory(uri)
+        self._socketOptions = StompSocketOptions(self._failover.options, socketOptions)
         self.log = logging.getLogger(LOG_CATEGORY)
 
+    @property
+    def failover(self):
+        """The :class:`~.StompFailoverTransport` which chooses the brokers and keeps their health statistics."""
+        return self._failover
+
+    @property
+    def options(self):
+        """The options of the failover URI."""
+        return self._failover.options
+
     @defer.inlineCallbacks
     def connect(self, timeout, *args, **kwargs):
         for (broker, delay) in self._failover:
             yield self._sleep(delay)
-            endpoint = self.endpointFactory(broker, timeout)
+            endpoint = self.endpointFactory(broker, timeout, self._socketOptions)
             self.log.info('Connecting to %(host)s:%(port)s ...' % broker)
+            started = reactor.seconds()
             try:
                 protocol = yield endpoint.connect(self.protocolFactory(*args, **kwargs))
             except Exception as e:
                 self.log.warning('%s [%s]' % ('Could not connect to %(host)s:%(port)d' % broker, e))
+                self._failover.failed(broker)
             else:
+                self._failover.connected(broker, reactor.seconds() - started)
+                protocol.broker = broker
                 defer.returnValue(protocol)
 
+    @defer.inlineCallbacks
+    def race(self, timeout, connectedTimeout, frame, version, onFrame, onConnectionLost, *args, **kwargs):
+        """Connect to the brokers of each reconnect attempt concurrently and send them the **CONNECT** frame **frame**. The first protocol which receives a **CONNECTED** frame wins, all others are disconnected. Calls back with a tuple (protocol, **CONNECTED** frame), where the protocol hands all further frames and its connection loss to **onFrame** and **onConnectionLost**."""
+        for (brokers, delay) in self._failover.rounds():
+            yield self._sleep(delay)
+            result = yield self._raceRound(brokers, timeout, connectedTimeout, frame, version, onFrame, onConnectionLost, *args, **kwargs)
+            if result is not None:
+                defer.returnValue(result)
+
+    def backup(self, exclude, timeout, connectedTimeout, frame, version, onFrame, onConnectionLost, *args, **kwargs):
+        """Establish a hot-standby STOMP connection like a single round of :meth:`race`, but skip the broker **exclude** (which the primary connection is connected to). Calls back with :obj:`None` if no broker was available."""
+        brokers = [broker for broker in self._failover.brokers() if broker != exclude]
+        return self._raceRound(brokers, timeout, connectedTimeout, frame, version, onFrame, onConnectionLost, *args, **kwargs)
+
+    def preferred(self, current, timeout, connectedTimeout, frame, version, onFrame, onConnectionLost, *args, **kwargs):
+        """Like :meth:`backup`, but only try the brokers which have a higher priority than the broker **current** (see :meth:`~.StompFailoverTransport.preferred`)."""
+        brokers = self._failover.preferred(current)
+        return self._raceRound(brokers, timeout, connectedTimeout, frame, version, onFrame, onConnectionLost, *args, **kwargs)
+
+    def _raceRound(self, brokers, timeout, connectedTimeout, frame, version, onFrame, onConnectionLost, *args, **kwargs):
+        # Start a connect attempt for the next broker whenever all pending attempts have failed, or when the latest
+        # one has been pending for raceStagger ms. Keep the first protocol which completes the STOMP handshake.
+        stagger = self._failover.options['raceStagger'] / 1000.0
+        brokers = collections.deque(brokers)
+        attempts = {} # handshake -> broker
+        timer = [None]
+        winner = []
+
+        def cancel(_):
+            winner.append(None)
+            brokers.clear()
+            if timer[0] is not None:
+                timer[0].cancel()
+                timer[0] = None
+            for attempt in list(attempts):
+                attempt.cancel()
+
+        result = defer.Deferred(cancel)
+
+        def start():
+            timer[0] = None
+            if not brokers:
+                if not attempts:
+                    result.callback(None)
+                return
+            broker = brokers.popleft()
+            handshake = self._handshake(broker, timeout, connectedTimeout, frame, version, *args, **kwargs)
+            attempts[handshake] = broker
+            handshake.addBoth(finished, handshake)
+            if brokers and (not winner) and (handshake in attempts):
+                timer[0] = reactor.callLater(stagger, start)
+
+        def finished(value, handshake):
+            broker = attempts.pop(handshake)
+            if winner: # a cancelled loser
+                return
+            if isinstance(value, failure.Failure):
+                self._failover.failed(broker)
+                self.log.warning('%s [%s]' % ('Could not connect to %(host)s:%(port)d' % broker, value.getErrorMessage()))
+                if timer[0] is not None:
+                    timer[0].cancel()
+                start()
+                return
+            protocol, _ = value
+            winner.append(protocol)
+            protocol._onFrame = onFrame
+            protocol._onConnectionLost = onConnectionLost
+            if timer[0] is not None:
+                timer[0].cancel()
+                timer[0] = None
+            for (loser, broker) in attempts.items():
+                self.log.info('Cancelling connect attempt to %(host)s:%(port)d' % broker)
+                loser.cancel()
+            result.callback(value)
+
+        start()
+        return result
+
+    def _handshake(self, broker, timeout, connectedTimeout, frame, version, *args, **kwargs):
+        state = {}
+
+        def cancel(_):
+            if 'protocol' in state:
+                state['protocol'].loseConnection()
+            else:
+                state['connecting'].cancel()
+
+        def stop():
+            timer = state.pop('timer', None)
+            if (timer is not None) and timer.active():
+                timer.cancel()
+
+        def fail(reason):
+            stop()
+            if not handshake.called:
+                handshake.errback(reason)
+            state['protocol'].loseConnection()
+
+        def onFrame(frame):
+            if handshake.called:
+                return
+            if frame.command != StompSpec.CONNECTED:
+                fail(StompProtocolError('Received %s' % frame.info()))
+                return
+            stop()
+            self._failover.established(broker, reactor.seconds() - state['started'])
+            handshake.callback((state['protocol'], frame))
+
+        def onConnectionLost(reason):
+            stop()
+            if not handshake.called:
+                handshake.errback(reason)
+
+        def connected(protocol):
+            state['protocol'] = protocol
+            protocol.broker = broker
+            now = reactor.seconds()
+            self._failover.connected(broker, now - state.pop('started'))
+            state['started'] = now
+            if connectedTimeout is not None:
+                state['timer'] = reactor.callLater(connectedTimeout, fail, StompCancelledError('STOMP broker did not answer on time [timeout=%s]' % connectedTimeout))
+            protocol.send(frame)
+
+        handshake = defer.Deferred(cancel)
+        self.log.info('Connecting to %(host)s:%(port)s ...' % broker)
+        state['started'] = reactor.seconds()
+        state['connecting'] = self.endpointFactory(broker, timeout, self._socketOptions).connect(self.protocolFactory(version, onFrame, onConnectionLost, *args, **kwargs))
+        state['connecting'].addCallbacks(connected, lambda reason: handshake.called or handshake.errback(reason))
+        return handshake
+
     def _sleep(self, delay):
         if not delay:
             return
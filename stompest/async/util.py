@@ -3,7 +3,9 @@ import contextlib
 import functools
 
 from twisted.internet import defer, reactor, task
-from twisted.internet.endpoints import clientFromString
+from twisted.internet.endpoints import TCP4ClientEndpoint, clientFromString
+from twisted.internet.interfaces import IStreamClientEndpoint
+from zope.interface import implementer
 
 from stompest.error import StompAlreadyRunningError, StompNotRunningError
 
@@ -83,10 +85,29 @@ def exclusive(f):
 
     return _exclusive
 
-def endpointFactory(broker, timeout=None):
-    timeout = (':timeout=%d' % timeout) if timeout else ''
-    locals().update(broker)
-    return clientFromString(reactor, '%(protocol)s:host=%(host)s:port=%(port)d%(timeout)s' % locals())
+def endpointFactory(broker, timeout=None, socketOptions=None):
+    if not socketOptions:
+        timeout = (':timeout=%d' % timeout) if timeout else ''
+        locals().update(broker)
+        return clientFromString(reactor, '%(protocol)s:host=%(host)s:port=%(port)d%(timeout)s' % locals())
+    kwargs = {'timeout': timeout} if timeout else {}
+    endpoint = TCP4ClientEndpoint(reactor, broker['host'], broker['port'], bindAddress=socketOptions.bindAddress, **kwargs)
+    return _TunedEndpoint(endpoint, socketOptions)
+
+@implementer(IStreamClientEndpoint)
+class _TunedEndpoint(object):
+    # Twisted endpoints do not expose the socket before it connects, so the socket options are set as soon as the
+    # connection is made (before any frame is written); only the local address is bound beforehand.
+    def __init__(self, endpoint, socketOptions):
+        self._endpoint = endpoint
+        self._socketOptions = socketOptions
+
+    def connect(self, protocolFactory):
+        return self._endpoint.connect(protocolFactory).addCallback(self._tune)
+
+    def _tune(self, protocol):
+        self._socketOptions.apply(protocol.transport.getHandle(), bind=False)
+        return protocol
 
 def sendToErrorDestinationAndRaise(client, failure, frame, errorDestination):
     client.sendToErrorDestination(failure, frame, errorDestination)
@@ -6,14 +6,18 @@ class StompConfig(object):
     :param passcode: The passcode for the STOMP brokers. The default is :obj:`None`, which means that no **passcode** header will be sent.
     :param version: A valid STOMP protocol version, or :obj:`None` (equivalent to the :attr:`DEFAULT_VERSION` attribute of the :class:`~.StompSpec` class).
     :param check: Decides whether the :class:`~.StompSession` object which is used to represent the STOMP sesion should be strict about the session's state: (e.g., whether to allow calling the session's :meth:`~.StompSession.send` when disconnected).
+    :param contentLength: Decides whether outgoing frames with a non-empty body should automatically carry a **content-length** header (see :meth:`~.StompFrame.render`). This allows the broker to extract message bodies without scanning for the frame delimiter and is required for binary bodies containing NUL bytes.
+    :param socketOptions: A :obj:`dict` of socket tuning options which take precedence over the options of the failover URI with the same names (**receiveBufferSize**, **sendBufferSize**, **tcpNoDelay**, **keepAlive**, **keepAliveIdle**, **keepAliveInterval**, **keepAliveCount**, **localAddress**, see :class:`~.StompFailoverUri`), for instance, ``{'tcpNoDelay': True}``.
 
     .. note :: Login and passcode have to be the same for all brokers because they are not part of the failover URI scheme.
 
     .. seealso :: The :class:`~.StompFailoverTransport` class which tells you which broker to use and how long you should wait to connect to it, the :class:`~.StompFailoverUri` which parses failover transport URIs.
     """
-    def __init__(self, uri, login=None, passcode=None, version=None, check=True):
+    def __init__(self, uri, login=None, passcode=None, version=None, check=True, contentLength=False, socketOptions=None):
         self.uri = uri
         self.login = login
         self.passcode = passcode
         self.version = version
         self.check = check
+        self.contentLength = contentLength
+        self.socketOptions = socketOptions
@@ -13,6 +13,9 @@ class StompConnectionError(StompError):
 class StompConnectTimeout(StompConnectionError):
     """Raised for timeout waiting for connect response from broker."""
 
+class StompSendTimeout(StompError):
+    """Raised for timeout writing a frame to a broker which does not read. The connection is not affected."""
+
 class StompExclusiveOperationError(StompError):
     """Raised for in-flight exclusive operation errors."""
 
@@ -5,8 +5,16 @@
 # TODO: STOMP 1.1 - deal with repeated headers -> http://stomp.github.com/stomp-specification-1.1.html#Repeated_Header_Entries
 
 import commands
+import resolver
+from ack import StompAckBatcher
+from cache import StompMessageCache
+from clock import StompCoarseClock, StompVirtualClock
 from failover import StompFailoverTransport, StompFailoverUri
 from frame import StompFrame
+from inflight import StompInFlightTracker
 from parser import StompParser
+from receipt import StompReceiptTracker
+from router import StompRouter
 from spec import StompSpec
 from session import StompSession
+from sockets import StompSocketOptions
@@ -0,0 +1,188 @@
+"""The :class:`StompAckBatcher` object decides when to acknowledge handled **MESSAGE** frames, such that a client does not have to send one **ACK** frame per message. It is transport agnostic and does not create any frames by itself: it only tells you which **MESSAGE** frames are due to be acked, and you pass them on to :meth:`~.StompSession.ack`.
+
+* For subscriptions with ack mode **client**, the broker considers all messages up to the acked one as acknowledged. The batcher keeps track of the delivery order and of the completed messages per subscription, and it only releases the last message of the longest prefix of completed messages. Thus, only one cumulative **ACK** frame per window is needed.
+* For subscriptions with ack mode **client-individual**, each message must be acked individually. The batcher collects the completed messages, such that all **ACK** frames of a window can be written at once.
+
+A window is full when **size** messages of a subscription have been completed, or when the oldest of them has waited for **delay** seconds.
+
+Example:
+
+>>> from stompest.protocol import StompAckBatcher, StompFrame
+>>> batcher = StompAckBatcher(size=2)
+>>> frames = [StompFrame('MESSAGE', {'message-id': str(i), 'destination': '/queue/test'}) for i in xrange(3)]
+>>> token = ('destination', '/queue/test')
+>>> for frame in frames:
+...     batcher.delivered(token, frame, 'client')
+...
+>>> batcher.completed(token, frames[1])
+False
+>>> batcher.completed(token, frames[0])
+True
+>>> [frame.headers['message-id'] for frame in batcher.due()]
+['1']
+
+"""
+import collections
+import time
+
+from .spec import StompSpec
+
+class StompAckBatcher(object):
+    """This object keeps track of handled **MESSAGE** frames which are still to be acked.
+
+    :param size: The maximum number of completed messages per subscription before an ack is due.
+    :param delay: The maximum time (in seconds) a completed message may wait for its ack. If :obj:`None`, only the **size** limit applies.
+    :param clock: A callable which returns the current time (in seconds).
+    """
+    DEFAULT_SIZE = 100
+    DEFAULT_DELAY = 1.0
+
+    def __init__(self, size=None, delay=None, clock=time.time):
+        self.size = self.DEFAULT_SIZE if (size is None) else size
+        self.delay = delay
+        self._clock = clock
+        self.clear()
+
+    def __len__(self):
+        """The number of completed messages which are still to be acked."""
+        return sum(window.count for window in self._windows.itervalues())
+
+    def clear(self):
+        """Forget about all delivered and completed messages (e.g., when the connection was lost and the broker will redeliver them anyway)."""
+        self._windows = {}
+
+    def remove(self, token):
+        """Forget about all delivered and completed messages of a subscription. Returns the **MESSAGE** frames which were due to be acked."""
+        window = self._windows.pop(token, None)
+        return window.pop() if window else []
+
+    def delivered(self, token, frame, mode):
+        """Notify the batcher that a **MESSAGE** frame was delivered for the subscription identified by **token**. The delivery order is relevant for the ack mode **client** only.
+
+        :param mode: The ack mode of the subscription.
+        """
+        window = self._window(token, mode)
+        if window.cumulative:
+            window.deliver(frame.headers[StompSpec.MESSAGE_ID_HEADER])
+
+    def completed(self, token, frame, mode=StompSpec.ACK_CLIENT_INDIVIDUAL):
+        """Notify the batcher that a **MESSAGE** frame was handled and may be acked. Returns :obj:`True` if the window of this subscription is full.
+
+        :param mode: The ack mode of the subscription (in case it was not specified by a previous call of :meth:`delivered`).
+        """
+        window = self._window(token, mode)
+        window.complete(frame, self._clock())
+        return window.count >= self.size
+
+    def discard(self, frame):
+        """Forget about a delivered **MESSAGE** frame which is not going to be acked via the batcher (e.g., because it was nacked). For the ack mode **client**, the messages which were completed after it are no longer held back. Returns :obj:`True` if this makes the window of its subscription full."""
+        messageId = frame.headers.get(StompSpec.MESSAGE_ID_HEADER)
+        full = False
+        for window in self._windows.itervalues():
+            window.discard(messageId, self._clock())
+            full = full or (window.count >= self.size)
+        return full
+
+    def due(self):
+        """Returns the **MESSAGE** frames whose acks are due (because their window is full or has expired). The windows in question will be reset."""
+        now = self._clock()
+        frames = []
+        for window in self._windows.itervalues():
+            if window.count and ((window.count >= self.size) or ((self.delay is not None) and (now - window.since >= self.delay))):
+                frames.extend(window.pop())
+        return frames
+
+    def flush(self):
+        """Returns the **MESSAGE** frames of all completed messages regardless of their windows. All windows will be reset."""
+        frames = []
+        for window in self._windows.itervalues():
+            frames.extend(window.pop())
+        return frames
+
+    @property
+    def deadline(self):
+        """The earliest time at which a window will expire, or :obj:`None` if no message is waiting (or there is no time limit)."""
+        if self.delay is None:
+            return None
+        pending = [window.since for window in self._windows.itervalues() if window.count]
+        return (min(pending) + self.delay) if pending else None
+
+    def _window(self, token, mode):
+        try:
+            return self._windows[token]
+        except KeyError:
+            window = self._windows[token] = _AckWindow(mode == StompSpec.ACK_CLIENT)
+            return window
+
+class _AckWindow(object):
+    def __init__(self, cumulative):
+        self.cumulative = cumulative
+        self.delivered = collections.deque()
+        self._delivered = set() # the same message ids, for fast lookup
+        self._completed = {}
+        self._frames = []
+        self._prefix = None # the index of the frame in _frames which acks the completed prefix of delivered messages
+        self.count = 0
+        self.since = None
+
+    def deliver(self, messageId):
+        self.delivered.append(messageId)
+        self._delivered.add(messageId)
+
+    def complete(self, frame, now):
+        if not self.cumulative:
+            self._frames.append(frame)
+            self._count(1, now)
+            return
+        messageId = frame.headers[StompSpec.MESSAGE_ID_HEADER]
+        if messageId not in self._delivered: # delivery was not reported, so there's no order to respect
+            self._frames.append(frame)
+            self._count(1, now)
+            return
+        self._completed[messageId] = frame
+        self._advance(now)
+
+    def discard(self, messageId, now):
+        if messageId in self._delivered:
+            self.delivered.remove(messageId)
+            self._delivered.discard(messageId)
+            self._completed.pop(messageId, None)
+            self._advance(now)
+            return
+        indices = [i for (i, f) in enumerate(self._frames) if (i != self._prefix) and (f.headers.get(StompSpec.MESSAGE_ID_HEADER) == messageId)]
+        if not indices: # a prefix frame also acks earlier messages, so it stays
+            return
+        del self._frames[indices[0]]
+        if (self._prefix is not None) and (self._prefix > indices[0]):
+            self._prefix -= 1
+        self.count -= 1
+        if not self.count:
+            self.since = None
+
+    def pop(self):
+        frames, self._frames = self._frames, []
+        self._prefix = None
+        self.count = 0
+        self.since = None
+        return frames
+
+    def _advance(self, now):
+        count = 0
+        while self.delivered and (self.delivered[0] in self._completed):
+            messageId = self.delivered.popleft()
+            self._delivered.discard(messageId)
+            frame = self._completed.pop(messageId)
+            count += 1
+        if not count:
+            return
+        if self._prefix is None: # a later prefix frame acks the earlier one as well, so it takes its place
+            self._prefix = len(self._frames)
+            self._frames.append(frame)
+        else:
+            self._frames[self._prefix] = frame
+        self._count(count, now)
+
+    def _count(self, count, now):
+        if not self.count:
+            self.since = now
+        self.count += count
@@ -0,0 +1,120 @@
+"""The :class:`StompMessageCache` object keeps the **SEND** frames which were written to the broker but not yet confirmed, so that a client can send them again after a failover (failover options *trackMessages* and *maxCacheSize*). A broker processes the frames of a connection in order, so a frame is confirmed by the **RECEIPT** for itself or for any frame which was sent after it. A frame which belongs to a transaction is confirmed by the **COMMIT** (or **ABORT**) of its transaction instead. If the total body size of the cached frames exceeds the limit, the oldest frames are evicted, and the evictions are counted in the :meth:`~StompMessageCache.statistics`.
+
+Example:
+
+>>> from stompest.protocol import StompFrame, StompMessageCache
+>>> cache = StompMessageCache(maxSize=10)
+>>> cache.add(StompFrame('SEND', {'destination': '/queue/test'}, 'hello'))
+[]
+>>> cache.add(StompFrame('SEND', {'destination': '/queue/test'}, 'world'))
+[]
+>>> cache.mark('receipt-1')
+>>> cache.add(StompFrame('SEND', {'destination': '/queue/test'}, '!'))
+[StompFrame(command='SEND', headers={'destination': '/queue/test'}, body='hello')]
+>>> cache.confirm('receipt-1')
+>>> cache.replay()
+[StompFrame(command='SEND', headers={'destination': '/queue/test'}, body='!')]
+>>> sorted(cache.statistics().iteritems())
+[('bytes', 1), ('count', 1), ('evicted', 1), ('evictedBytes', 5)]
+
+"""
+import collections
+import itertools
+
+from .frame import StompFrame
+from .spec import StompSpec
+
+class StompMessageCache(object):
+    """A FIFO cache of unconfirmed **SEND** frames.
+
+    :param maxSize: The maximum total body size (in bytes) of the cached frames.
+    """
+    DEFAULT_MAX_SIZE = 131072
+
+    def __init__(self, maxSize=None):
+        self.maxSize = self.DEFAULT_MAX_SIZE if (maxSize is None) else maxSize
+        self._counter = itertools.count()
+        self._evicted = self._evictedBytes = 0
+        self.clear()
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def bytes(self):
+        """The total body size of the cached frames."""
+        return self._bytes
+
+    def add(self, frame):
+        """Cache a **SEND** frame which is about to be written. Returns the frames which were evicted to respect the **maxSize** limit."""
+        size = len(frame.body)
+        self._frames[next(self._counter)] = (frame, size)
+        self._bytes += size
+        evicted = []
+        while self._bytes > self.maxSize:
+            _, (frame, size) = self._frames.popitem(last=False)
+            self._bytes -= size
+            self._evictedBytes += size
+            evicted.append(frame)
+        self._evicted += len(evicted)
+        return evicted
+
+    def mark(self, receipt):
+        """Record that a frame which requests the receipt **receipt** is about to be written (after all frames which are cached so far)."""
+        self._marks[receipt] = next(self._counter)
+
+    def confirm(self, receipt):
+        """Forget about all frames which were cached before the frame which requested **receipt** (except for the frames of pending transactions)."""
+        mark = self._marks.pop(receipt, None)
+        if mark is None:
+            return
+        frames = self._frames
+        for key in list(frames):
+            if key > mark:
+                break
+            if StompSpec.TRANSACTION_HEADER not in frames[key][0].headers:
+                self._pop(key)
+
+    def commit(self, transaction):
+        """Forget about the frames of a transaction which is committed."""
+        self._discard(transaction)
+
+    def abort(self, transaction):
+        """Forget about the frames of a transaction which is aborted."""
+        self._discard(transaction)
+
+    def replay(self):
+        """Returns the cached frames which have to be sent again on a new connection, in the order in which they were cached. The frames of pending transactions are dropped, because the broker has rolled back these transactions, and the receipt headers are removed, because the receipts were requested on the old connection. The frames remain cached until they are confirmed on the new connection."""
+        frames = collections.OrderedDict()
+        self._bytes = 0
+        for (key, (frame, size)) in self._frames.iteritems():
+            headers = frame.headers
+            if StompSpec.TRANSACTION_HEADER in headers:
+                continue
+            if StompSpec.RECEIPT_HEADER in headers:
+                headers = dict(headers)
+                del headers[StompSpec.RECEIPT_HEADER]
+                frame = StompFrame(frame.command, headers, frame.body)
+            frames[key] = (frame, size)
+            self._bytes += size
+        self._frames = frames
+        self._marks = {}
+        return [frame for (frame, _) in frames.itervalues()]
+
+    def clear(self):
+        """Forget about all cached frames. The eviction counters are not reset."""
+        self._frames = collections.OrderedDict()
+        self._marks = {}
+        self._bytes = 0
+
+    def statistics(self):
+        """Returns a :obj:`dict` with the number of cached frames (**count**), their total body size (**bytes**), and the number (**evicted**) and total body size (**evictedBytes**) of all frames which were evicted because the cache was full."""
+        return {'count': len(self._frames), 'bytes': self._bytes, 'evicted': self._evicted, 'evictedBytes': self._evictedBytes}
+
+    def _discard(self, transaction):
+        for key in [k for (k, (f, _)) in self._frames.iteritems() if f.headers.get(StompSpec.TRANSACTION_HEADER) == transaction]:
+            self._pop(key)
+
+    def _pop(self, key):
+        _, size = self._frames.pop(key)
+        self._bytes -= size
@@ -0,0 +1,99 @@
+"""Clocks for the heart-beat accounting of a :class:`~.StompSession`. A clock is just a callable which returns the current time in seconds. The session records when data was last sent and received in terms of its clock, so heart-beat timeouts computed from :attr:`~.StompSession.lastSent` and :attr:`~.StompSession.lastReceived` have to use the same clock (:attr:`~.StompSession.clock`).
+
+* :func:`monotonic` is the default clock. It is not affected by adjustments of the system time, so a wall-clock jump cannot trigger (or suppress) a heart-beat timeout.
+* A :class:`StompCoarseClock` caches the time of its source and is updated explicitly via :meth:`~StompCoarseClock.tick`. The clients tick it once per API call, read from the wire, or timer event. With a **resolution**, a tick only queries the source when the system time has moved by that much, so that ticking costs little more than :func:`time.time` even where :func:`monotonic` is an expensive call (on Python 2).
+* A :class:`StompVirtualClock` only moves forward when you tell it to, which makes heart-beat logic testable without sleeping.
+
+Example:
+
+>>> from stompest.protocol import StompSession, StompVirtualClock
+>>> clock = StompVirtualClock()
+>>> session = StompSession(clock=clock)
+>>> session.sent()
+>>> clock.advance(2.5)
+>>> session.clock() - session.lastSent
+2.5
+
+"""
+import ctypes
+import ctypes.util
+import os
+import sys
+import time
+
+def _monotonic():
+    try:
+        return time.monotonic
+    except AttributeError:
+        pass
+    if not sys.platform.startswith('linux'):
+        return time.time
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    CLOCK_MONOTONIC = 1
+    try:
+        clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True).clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+    def monotonic():
+        """The time (in seconds) of a clock which cannot go backwards. Only differences between its values are meaningful."""
+        t = timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.pointer(t)):
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return t.tv_sec + t.tv_nsec * 1e-9
+    return monotonic
+
+monotonic = _monotonic()
+
+class StompCoarseClock(object):
+    """A clock which returns the time of its last :meth:`tick`.
+
+    :param source: The clock which is queried on each :meth:`tick`.
+    :param resolution: If not :obj:`None`, a :meth:`tick` only queries **source** if the system time (:func:`time.time`) has moved forward by at least this many seconds since the last query, or if it has gone backwards. The time may then lag behind **source** by up to **resolution** seconds (unless the system time is adjusted, which only causes another query).
+    """
+    RESOLUTION = 0.001 # the resolution of the clients' default clocks
+
+    def __init__(self, source=monotonic, resolution=None):
+        self._source = source
+        self._resolution = resolution
+        self._wall = time.time()
+        self._now = source()
+
+    def __call__(self):
+        return self._now
+
+    def tick(self):
+        """Update the cached time from the source clock, and return it."""
+        if self._resolution is not None:
+            wall = time.time()
+            if 0 <= (wall - self._wall) < self._resolution:
+                return self._now
+            self._wall = wall
+        self._now = self._source()
+        return self._now
+
+class StompVirtualClock(object):
+    """A clock for deterministic tests which stands still unless it is advanced.
+
+    :param now: The initial time (in seconds).
+    """
+    def __init__(self, now=0.0):
+        self._now = now
+
+    def __call__(self):
+        return self._now
+
+    def advance(self, seconds):
+        """Move the clock forward by **seconds**."""
+        if seconds < 0:
+            raise ValueError('Cannot go back in time: %s' % seconds)
+        self._now += seconds
+
+    def tick(self):
+        """Return the current time (a virtual clock is never out of date)."""
+        return self._now
@@ -28,10 +28,9 @@ StompFrame(command='DISCONNECT', headers={'receipt': 'message-12345'}, body='')
 
 .. seealso :: Specification of STOMP protocols `1.0 <http://stomp.github.com//stomp-specification-1.0.html>`_ and `1.1 <http://stomp.github.com//stomp-specification-1.1.html>`_, your favorite broker's documentation for additional STOMP headers.
 """
-import socket
-
 from stompest.error import StompProtocolError
 
+from . import resolver
 from .frame import StompFrame, StompHeartBeat
 from .spec import StompSpec
 
@@ -52,7 +51,7 @@ def connect(login=None, passcode=None, headers=None, versions=None, host=None, h
     :param passcode: The **passcode** header. The default is :obj:`None`, which means that no such header will be added.
     :param headers: Additional STOMP headers.
     :param versions: A list of the STOMP versions we wish to support. The default is :obj:`None`, which means that we will offer the broker to accept any version prior or equal to the default STOMP protocol version.
-    :param host: The **host** header which gives this client a human readable name on the broker side.
+    :param host: The **host** header which gives this client a human readable name on the broker side. The default is :obj:`None`, which means that the (cached) name of the local host will be used.
     :param heartBeats: A pair (client heart-beat, server heart-beat) of integer heart-beat intervals in ms. Both intervals must be non-negative. A client heart-beat of 0 means that no heart-beats will be sent by the client. Similarly, a server heart-beat of 0 means that the client does not expect heart-beats from the server.
     """
     headers = dict(headers or [])
@@ -64,7 +63,7 @@ def connect(login=None, passcode=None, headers=None, versions=None, host=None, h
     if versions != [StompSpec.VERSION_1_0]:
         headers[StompSpec.ACCEPT_VERSION_HEADER] = ','.join(_version(version) for version in versions)
         if host is None:
-            host = socket.gethostbyaddr(socket.gethostname())[0]
+            host = resolver.hostName()
         headers[StompSpec.HOST_HEADER] = host
     if heartBeats:
         if versions == [StompSpec.VERSION_1_0]:
@@ -114,12 +113,9 @@ def subscribe(destination, headers, receipt=None, version=None):
     frame = StompFrame(StompSpec.SUBSCRIBE, dict(headers or []))
     frame.headers[StompSpec.DESTINATION_HEADER] = destination
     _addReceiptHeader(frame, receipt)
-    subscription = None
-    try:
-        subscription = _checkHeader(frame, StompSpec.ID_HEADER, version)
-    except StompProtocolError:
-        if (version != StompSpec.VERSION_1_0):
-            raise
+    subscription = frame.headers.get(StompSpec.ID_HEADER)
+    if (subscription is None) and (version != StompSpec.VERSION_1_0):
+        _checkHeader(frame, StompSpec.ID_HEADER, version)
     token = (StompSpec.DESTINATION_HEADER, destination) if (subscription is None) else (StompSpec.ID_HEADER, subscription)
     return frame, token
 
@@ -132,11 +128,9 @@ def unsubscribe(token, receipt=None, version=None):
     version = _version(version)
     frame = StompFrame(StompSpec.UNSUBSCRIBE, dict([token]))
     _addReceiptHeader(frame, receipt)
-    try:
-        _checkHeader(frame, StompSpec.ID_HEADER, version)
-    except StompProtocolError:
+    if StompSpec.ID_HEADER not in frame.headers:
         if version != StompSpec.VERSION_1_0:
-            raise
+            _checkHeader(frame, StompSpec.ID_HEADER, version)
         _checkHeader(frame, StompSpec.DESTINATION_HEADER)
     return frame
 
@@ -147,9 +141,7 @@ def ack(frame, transactions=None, receipt=None, version=None):
     :param transactions: The ids of currently active transactions --- only if the **frame** is part of one of these transactions, the **transaction** header is included in the ACK frame.
     :param receipt: See :func:`disconnect`.
     """
-    frame = StompFrame(StompSpec.ACK, _ackHeaders(frame, transactions, version))
-    _addReceiptHeader(frame, receipt)
-    return frame
+    return compiled(version).ack(frame, transactions, receipt)
 
 def nack(frame, transactions=None, receipt=None, version=None):
     """Create a **NACK** frame for a received **MESSAGE** frame.
@@ -158,12 +150,7 @@ def nack(frame, transactions=None, receipt=None, version=None):
     :param transactions: The ids of currently active transactions --- only if the **frame** is part of one of these transactions, the **transaction** header is included in the NACK frame.
     :param receipt: See :func:`disconnect`.
     """
-    version = _version(version)
-    if version == StompSpec.VERSION_1_0:
-        raise StompProtocolError('%s not supported (version %s)' % (StompSpec.NACK, version))
-    frame = StompFrame(StompSpec.NACK, _ackHeaders(frame, transactions, version))
-    _addReceiptHeader(frame, receipt)
-    return frame
+    return compiled(version).nack(frame, transactions, receipt)
 
 def begin(transaction, receipt=None):
     """Create a **BEGIN** frame.
@@ -242,26 +229,12 @@ def message(frame, version):
     
     .. seealso :: The :func:`subscribe` command.
     """
-    version = _version(version)
-    _checkCommand(frame, [StompSpec.MESSAGE])
-    _checkHeader(frame, StompSpec.MESSAGE_ID_HEADER)
-    destination = _checkHeader(frame, StompSpec.DESTINATION_HEADER)
-    subscription = None
-    try:
-        subscription = _checkHeader(frame, StompSpec.SUBSCRIPTION_HEADER, version)
-    except StompProtocolError:
-        if version != StompSpec.VERSION_1_0:
-            raise
-    token = (StompSpec.DESTINATION_HEADER, destination) if (subscription is None) else (StompSpec.ID_HEADER, subscription)
-    return token
+    return compiled(version).message(frame)
 
 def receipt(frame, version):
     """Handle a **RECEIPT** frame. Returns the receipt id which you can use to match this receipt to the command that requested it.
     """
-    version = _version(version)
-    _checkCommand(frame, [StompSpec.RECEIPT])
-    _checkHeader(frame, StompSpec.RECEIPT_ID_HEADER)
-    return frame.headers[StompSpec.RECEIPT_ID_HEADER]
+    return compiled(version).receipt(frame)
 
 def error(frame, version):
     """Handle an **ERROR** frame. Does not really do anything except checking that this is an **ERROR** frame.
@@ -278,10 +251,11 @@ def version(version=None):
     """
     if version is None:
         version = StompSpec.DEFAULT_VERSION
-    if version not in StompSpec.VERSIONS:
+    if version not in _VERSIONS:
         raise StompProtocolError('Version is not supported [%s]' % version)
     return version
 _version = version
+_VERSIONS = frozenset(StompSpec.VERSIONS)
 
 def versions(version):
     """Obtain all versions prior or equal to **version**.
@@ -293,23 +267,108 @@ def versions(version):
             break
 _versions = versions
 
-# private helper methods
+# compiled commands
 
-def _ackHeaders(frame, transactions, version):
-    version = _version(version)
-    _checkCommand(frame, [StompSpec.MESSAGE])
-    _checkHeader(frame, StompSpec.MESSAGE_ID_HEADER, version)
-    if version != StompSpec.VERSION_1_0:
-        _checkHeader(frame, StompSpec.SUBSCRIPTION_HEADER, version)
-    keys = [StompSpec.SUBSCRIPTION_HEADER, StompSpec.MESSAGE_ID_HEADER]
+def compiled(version=None, trusted=False):
+    """Obtain the handlers for the commands on the per-message hot path (**ACK**, **NACK**, **MESSAGE**, **RECEIPT**) specialized for one STOMP protocol **version**. The result has the attributes :attr:`version`, :attr:`ack`, :attr:`nack`, :attr:`message`, and :attr:`receipt`. Their signatures are the ones of the corresponding functions of this module minus the **version** parameter. The handlers are built once per version and cached.
+
+    :param trusted: If :obj:`True`, the handlers will skip all checks of the incoming frames (command, mandatory headers). Use this mode only for frames which have been validated before (e.g., a **MESSAGE** frame which was already passed to :func:`message`). Violations of the protocol will then surface as :class:`KeyError` instead of :class:`~.error.StompProtocolError`, if at all.
+
+    >>> from stompest.protocol import commands
+    >>> trusted = commands.compiled('1.1', trusted=True)
+    >>> frame = StompFrame('MESSAGE', {'destination': '/queue/test', 'message-id': '007', 'subscription': '0'})
+    >>> trusted.message(frame)
+    ('id', '0')
+    >>> trusted.ack(frame)
+    StompFrame(command='ACK', headers={'message-id': '007', 'subscription': '0'}, body='')
+
+    """
     try:
-        transaction = frame.headers[StompSpec.TRANSACTION_HEADER]
+        return _COMPILED[(version, trusted)]
     except KeyError:
         pass
-    else:
-        if transaction in set(transactions or []):
-            keys.append(StompSpec.TRANSACTION_HEADER)
-    return dict((key, value) for (key, value) in frame.headers.iteritems() if key in keys)
+    commands = _COMPILED[(version, trusted)] = _CompiledCommands(_version(version), trusted)
+    return commands
+
+_COMPILED = {}
+
+class _CompiledCommands(object):
+    def __init__(self, version, trusted):
+        self.version = version
+        self.trusted = trusted
+        self.ack = self._ack(StompSpec.ACK)
+        self.nack = self._ack(StompSpec.NACK)
+        self.message = self._message()
+        self.receipt = self._receipt()
+
+    def _ack(self, command):
+        version = self.version
+        trusted = self.trusted
+        if version == StompSpec.VERSION_1_0:
+            mandatory, optional = [StompSpec.MESSAGE_ID_HEADER], [StompSpec.SUBSCRIPTION_HEADER]
+        else:
+            mandatory, optional = [StompSpec.MESSAGE_ID_HEADER, StompSpec.SUBSCRIPTION_HEADER], []
+
+        def _ack(frame, transactions=None, receipt=None):
+            headers = frame.headers
+            if not trusted:
+                if frame.command != StompSpec.MESSAGE:
+                    _checkCommand(frame, [StompSpec.MESSAGE])
+                for header in mandatory:
+                    if header not in headers:
+                        _checkHeader(frame, header, version)
+            ackHeaders = dict((header, headers[header]) for header in mandatory)
+            for header in optional:
+                if header in headers:
+                    ackHeaders[header] = headers[header]
+            transaction = headers.get(StompSpec.TRANSACTION_HEADER)
+            if (transaction is not None) and transactions and (transaction in transactions):
+                ackHeaders[StompSpec.TRANSACTION_HEADER] = transaction
+            frame = StompFrame(command)
+            frame.headers = ackHeaders # the header values of a StompFrame are strings already
+            receipt and _addReceiptHeader(frame, receipt)
+            return frame
+
+        if (command == StompSpec.NACK) and (version == StompSpec.VERSION_1_0):
+            def _nack(frame, transactions=None, receipt=None):
+                raise StompProtocolError('%s not supported (version %s)' % (StompSpec.NACK, version))
+            return _nack
+        return _ack
+
+    def _message(self):
+        version = self.version
+        trusted = self.trusted
+        subscriptionMandatory = version != StompSpec.VERSION_1_0
+
+        def _message(frame):
+            headers = frame.headers
+            if not trusted:
+                if frame.command != StompSpec.MESSAGE:
+                    _checkCommand(frame, [StompSpec.MESSAGE])
+                for header in (StompSpec.MESSAGE_ID_HEADER, StompSpec.DESTINATION_HEADER):
+                    if header not in headers:
+                        _checkHeader(frame, header)
+                if subscriptionMandatory and (StompSpec.SUBSCRIPTION_HEADER not in headers):
+                    _checkHeader(frame, StompSpec.SUBSCRIPTION_HEADER, version)
+            subscription = headers.get(StompSpec.SUBSCRIPTION_HEADER)
+            if subscription is None:
+                return (StompSpec.DESTINATION_HEADER, headers[StompSpec.DESTINATION_HEADER])
+            return (StompSpec.ID_HEADER, subscription)
+        return _message
+
+    def _receipt(self):
+        trusted = self.trusted
+
+        def _receipt(frame):
+            if not trusted:
+                if frame.command != StompSpec.RECEIPT:
+                    _checkCommand(frame, [StompSpec.RECEIPT])
+                if StompSpec.RECEIPT_ID_HEADER not in frame.headers:
+                    _checkHeader(frame, StompSpec.RECEIPT_ID_HEADER)
+            return frame.headers[StompSpec.RECEIPT_ID_HEADER]
+        return _receipt
+
+# private helper methods
 
 def _addReceiptHeader(frame, receipt):
     if not receipt:
@@ -1,10 +1,13 @@
 import collections
+import os
 import random
 import re
-import socket
 
 from stompest.error import StompConnectTimeout
 
+from . import resolver
+from .clock import monotonic
+
 class StompFailoverTransport(object):
     """Looping over this object, you can produce a series of tuples (broker, delay in s). When the failover scheme does not allow further failover, a :class:`~.error.StompConnectTimeout` error is raised.
     
@@ -35,11 +38,100 @@ class StompFailoverTransport(object):
     broker: {'host': 'remote1', 'protocol': 'tcp', 'port': 61615}, delay: 0.000000
     timeout: Reconnect timeout: 0 attempts
     
+    The clients report the outcome of each connect attempt via :meth:`connected`, :meth:`established` and :meth:`failed`. From these reports, the failover transport keeps health statistics for each broker (see :meth:`statistics`) which are used by the *strategy* and *circuitBreakerCooldown* options to choose the brokers of the next reconnect attempt.
+    
+    >>> from stompest.protocol import StompVirtualClock
+    >>> clock = StompVirtualClock()
+    >>> failover = StompFailoverTransport('failover:(tcp://remote1:61615,tcp://remote2:61616)?randomize=false,strategy=latency,circuitBreakerCooldown=5000', clock)
+    >>> remote1, remote2 = {'host': 'remote1', 'port': 61615}, {'host': 'remote2', 'port': 61616}
+    >>> failover.connected(remote1, 0.2)
+    >>> failover.connected(remote2, 0.1)
+    >>> brokers, _ = next(failover.rounds())
+    >>> [broker['host'] for broker in brokers]
+    ['remote2', 'remote1']
+    >>> failover.failed(remote2)
+    >>> brokers, _ = next(failover.rounds())
+    >>> [broker['host'] for broker in brokers]
+    ['remote1']
+    >>> clock.advance(5)
+    >>> brokers, _ = next(failover.rounds())
+    >>> [broker['host'] for broker in brokers]
+    ['remote2', 'remote1']
+    
+    The list of brokers may change at runtime, via :meth:`update`, via a file which is watched (option *updateURIsURL*), or via the header :attr:`BROKERS_HEADER` of a **CONNECTED** frame (see :meth:`advertised` and option *updateURIsSupported*). The reconnect attempts and the backoff delay of a running iteration are not affected, the new list is used as of the next reconnect attempt, and brokers which were added come first until a connect attempt to them has been reported.
+    
+    >>> failover = StompFailoverTransport('failover:(tcp://remote1:61615,tcp://remote2:61616)?randomize=false')
+    >>> failover.update('tcp://remote2:61616,tcp://remote3:61617')
+    True
+    >>> [broker['host'] for broker in failover.brokers()]
+    ['remote3', 'remote2']
+    >>> failover.advertised({'connected-brokers': 'tcp://remote2:61616,tcp://remote3:61617'})
+    False
+    
     .. seealso :: The :class:`StompFailoverUri` which parses failover transport URIs.
     """
-    def __init__(self, uri):
+    EWMA_WEIGHT = 0.3
+    BROKERS_HEADER = 'connected-brokers'
+
+    def __init__(self, uri, clock=monotonic):
         self._failoverUri = StompFailoverUri(uri)
         self._maxReconnectAttempts = None
+        self._clock = clock
+        self._health = {}
+        self._added = set()
+        self._watched = None
+
+    def update(self, brokers):
+        """Replace the list of brokers. **brokers** is a list of broker URIs separated by commas or whitespace (in the same format as the brokers of a failover URI). Returns :obj:`True` if the list has changed. The brokers which were not in the list before come first in the next reconnect attempts, until a connect attempt to them has been reported. The health statistics of the brokers which were removed are discarded."""
+        failoverUri = self._failoverUri
+        before = set(map(self._key, failoverUri.brokers))
+        failoverUri.update(brokers)
+        after = set(map(self._key, failoverUri.brokers))
+        self._added = (self._added | (after - before)) & after
+        for key in set(self._health) - after:
+            del self._health[key]
+        return before != after
+
+    def advertised(self, headers):
+        """Report the headers of a **CONNECTED** frame. If the broker advertises the brokers of its cluster in the header :attr:`BROKERS_HEADER` and the option *updateURIsSupported* is set, the list of brokers is updated (see :meth:`update`). Returns :obj:`True` if the list has changed."""
+        brokers = headers.get(self.BROKERS_HEADER)
+        if (not brokers) or (not self.options['updateURIsSupported']):
+            return False
+        return self.update(brokers)
+
+    def connected(self, broker, latency):
+        """Report that the wire-level connection to **broker** was established after **latency** seconds."""
+        self._added.discard(self._key(broker))
+        health = self._get(broker)
+        health.connectLatency = self._average(health.connectLatency, latency)
+
+    def established(self, broker, latency):
+        """Report that the STOMP session with **broker** was established **latency** seconds after the **CONNECT** frame was sent. This resets the broker's failure count."""
+        health = self._get(broker)
+        health.handshakeLatency = self._average(health.handshakeLatency, latency)
+        health.failures = 0
+
+    def failed(self, broker):
+        """Report that a connect attempt to **broker** failed (on the wire level or during the STOMP handshake)."""
+        self._added.discard(self._key(broker))
+        health = self._get(broker)
+        health.failures += 1
+        health.lastFailure = self._clock()
+
+    def statistics(self, broker):
+        """Returns a :obj:`dict` with the health statistics of **broker**: the exponentially weighted moving averages of the wire-level connect latency (**connectLatency**) and of the STOMP handshake latency (**handshakeLatency**), the number of failures since the last successful connect (**failures**), and the time (in seconds) since the last failure (**sinceFailure**). Latencies which were never measured and the time since a failure which never happened are :obj:`None`."""
+        health = self._get(broker)
+        return {
+            'connectLatency': health.connectLatency,
+            'handshakeLatency': health.handshakeLatency,
+            'failures': health.failures,
+            'sinceFailure': None if (health.lastFailure is None) else (self._clock() - health.lastFailure)
+        }
+
+    @property
+    def options(self):
+        """The options of the failover URI (see :class:`StompFailoverUri`)."""
+        return self._failoverUri.options
 
     def __iter__(self):
         self._reset()
@@ -47,16 +139,122 @@ class StompFailoverTransport(object):
             for broker in self._brokers():
                 yield broker, self._delay()
 
+    def brokers(self):
+        """The brokers in the order in which the next reconnect attempt would try them (this does not count as a reconnect attempt)."""
+        return self._brokers()
+
+    def preferred(self, broker):
+        """The brokers which have a higher priority than **broker**, in the order in which the next reconnect attempt would try them. With the option *priorityBackup*, the local brokers have a higher priority than the remote ones. Otherwise, all brokers have the same priority, and the list is empty."""
+        if (not self.options['priorityBackup']) or self._local(broker):
+            return []
+        return [b for b in self._brokers() if self._local(b)]
+
+    def rounds(self):
+        """Like iterating over this object, but produce tuples (list of brokers, delay in s): each reconnect attempt is a round which covers all brokers. This is the iteration scheme of the *race* mode, where the brokers of a round are tried concurrently."""
+        self._reset()
+        while True:
+            yield self._brokers(), self._delay()
+
     def _brokers(self):
         failoverUri = self._failoverUri
         options = failoverUri.options
+        self._watch(options['updateURIsURL'])
         brokers = list(failoverUri.brokers)
         if options['randomize']:
             random.shuffle(brokers)
+        brokers = self._STRATEGIES[options['strategy']](self, brokers)
+        brokers = self._available(brokers, options['circuitBreakerCooldown'] / 1000.0, options['circuitBreakerThreshold'])
+        if self._added:
+            brokers.sort(key=lambda b: self._key(b) not in self._added)
         if options['priorityBackup']:
-            brokers.sort(key=lambda b: b['host'] in failoverUri.LOCAL_HOST_NAMES, reverse=True)
+            brokers.sort(key=self._local, reverse=True)
         return brokers
 
+    def _local(self, broker):
+        return broker['host'] in self._failoverUri.LOCAL_HOST_NAMES
+
+    def _available(self, brokers, cooldown, threshold):
+        # circuit breaker: skip brokers which failed recently (unless all of them did)
+        if not cooldown:
+            return brokers
+        now = self._clock()
+        available = []
+        for broker in brokers:
+            health = self._get(broker)
+            if (health.failures < threshold) or ((now - health.lastFailure) >= cooldown):
+                available.append(broker)
+        return available or brokers
+
+    def _average(self, average, value):
+        return value if (average is None) else (self.EWMA_WEIGHT * value + (1 - self.EWMA_WEIGHT) * average)
+
+    def _watch(self, path):
+        # reread the file only if it has changed, and keep the brokers we know if it is missing or invalid
+        if not path:
+            return
+        if path.startswith('file://'):
+            path = path[len('file://'):]
+        try:
+            stat = os.stat(path)
+            watched = (stat.st_mtime, stat.st_size)
+            if watched == self._watched:
+                return
+            with open(path) as f:
+                brokers = f.read()
+            self._watched = watched
+            self.update(brokers)
+        except (EnvironmentError, ValueError):
+            pass
+
+    def _key(self, broker):
+        return (broker['host'], broker['port'])
+
+    def _get(self, broker):
+        key = self._key(broker)
+        try:
+            return self._health[key]
+        except KeyError:
+            health = self._health[key] = _BrokerHealth()
+            return health
+
+    def _latency(self, broker):
+        health = self._get(broker)
+        latencies = [l for l in (health.connectLatency, health.handshakeLatency) if l is not None]
+        return sum(latencies) if latencies else None
+
+    def _byLatency(self, brokers):
+        # brokers whose latency was never measured come first, so they will be measured
+        return sorted(brokers, key=lambda b: (self._latency(b) is not None, self._latency(b)))
+
+    def _byFailures(self, brokers):
+        now = self._clock()
+        return sorted(brokers, key=lambda b: (self._get(b).failures, -(now - (self._get(b).lastFailure or float('-inf')))))
+
+    def _byWeight(self, brokers):
+        # weighted random order (without replacement): the weight of a broker is the inverse of its latency (the mean
+        # latency for unmeasured brokers), divided by the number of failures since its last successful connect plus one
+        latencies = [self._latency(b) for b in brokers]
+        measured = [l for l in latencies if l is not None]
+        default = (sum(measured) / len(measured)) if measured else 1.0
+        weights = [1.0 / (max(default if (l is None) else l, 1e-6) * (1 + self._get(b).failures)) for (b, l) in zip(brokers, latencies)]
+        brokers, ordered = list(brokers), []
+        while brokers:
+            x = random.random() * sum(weights)
+            for (i, weight) in enumerate(weights):
+                x -= weight
+                if x < 0:
+                    break
+            ordered.append(brokers.pop(i))
+            weights.pop(i)
+        return ordered
+
+    _STRATEGIES = {
+        'default': lambda self, brokers: brokers,
+        'latency': _byLatency,
+        'weighted': _byWeight,
+        'failures': _byFailures
+    }
+
     def _delay(self):
         options = self._failoverUri.options
         self._reconnectAttempts += 1
@@ -77,6 +275,18 @@ class StompFailoverTransport(object):
             self._maxReconnectAttempts = options['maxReconnectAttempts']
         self._reconnectAttempts = -1
 
+class _BrokerHealth(object):
+    __slots__ = ('connectLatency', 'handshakeLatency', 'failures', 'lastFailure')
+
+    def __init__(self):
+        self.connectLatency = self.handshakeLatency = self.lastFailure = None
+        self.failures = 0
+
+class _LocalHostNames(object):
+    # the names of the local host are looked up only when they are needed for the first time
+    def __get__(self, instance, owner):
+        return resolver.localHostNames()
+
 class StompFailoverUri(object):
     """This is a parser for the failover URI scheme used in stompest. The parsed parameters are available in the attributes :attr:`brokers` and :attr:`options`. The Failover transport syntax is very close to the one used in ActiveMQ.
     
@@ -95,7 +305,7 @@ class StompFailoverUri(object):
     >>> print uri.brokers
     [{'host': 'remote1', 'protocol': 'tcp', 'port': 61615}, {'host': 'localhost', 'protocol': 'tcp', 'port': 61616}]
     >>> print uri.options
-    {'initialReconnectDelay': 7, 'maxReconnectDelay': 8, 'backOffMultiplier': 2.0, 'startupMaxReconnectAttempts': 3, 'priorityBackup': False, 'maxReconnectAttempts': 0, 'reconnectDelayJitter': 0, 'useExponentialBackOff': True, 'randomize': False}
+    {'initialReconnectDelay': 7, 'maxReconnectDelay': 8, 'priorityProbeInterval': 30000, 'localAddress': None, 'randomize': False, 'circuitBreakerThreshold': 1, 'startupMaxReconnectAttempts': 3, 'priorityBackup': False, 'strategy': 'default', 'trackMessages': False, 'circuitBreakerCooldown': 0, 'tcpNoDelay': False, 'reconnectDelayJitter': 0, 'maxCacheSize': 131072, 'backOffMultiplier': 2.0, 'updateURIsURL': None, 'useExponentialBackOff': True, 'sendBufferSize': -1, 'receiveBufferSize': -1, 'keepAliveIdle': -1, 'maxReconnectAttempts': 0, 'updateURIsSupported': True, 'keepAliveInterval': -1, 'keepAliveCount': -1, 'race': False, 'timeout': -1, 'raceStagger': 100, 'backup': False, 'priorityDwellTime': 60000, 'keepAlive': False}
     
     **Supported Options:**
     
@@ -113,20 +323,36 @@ class StompFailoverUri(object):
     *reconnectDelayJitter*         int       :obj:`0`      jitter in ms by which reconnect delay is blurred in order to avoid stampeding
     *randomize*                    bool      :obj:`True`   use a random algorithm to choose the the URI to use for reconnect from the list provided
     *priorityBackup*               bool      :obj:`False`  if set, prefer local connections to remote connections
+    *priorityProbeInterval*        int       :obj:`30000`  with *priorityBackup*, how often a client which is connected to a remote broker checks whether a local broker is available again, and if so, migrates to it (in ms, asynchronous client only; :obj:`0` means never)
+    *priorityDwellTime*            int       :obj:`60000`  the minimum time a client stays connected to a broker before it migrates to a preferred one (in ms)
+    *race*                         bool      :obj:`False`  if set, connect to several brokers concurrently and keep the first connection which completes the STOMP handshake (the others are closed)
+    *raceStagger*                  int       :obj:`100`    in *race* mode, how long to wait for a pending connect attempt before the next broker is tried concurrently (in ms)
+    *strategy*                     str       default       the order in which the brokers are tried: **default** (as given, or random if *randomize* is set), **latency** (lowest connect plus handshake latency first), **weighted** (random, weighted by inverse latency and recent failures), **failures** (fewest failures since the last successful connect first)
+    *circuitBreakerCooldown*       int       :obj:`0`      if not :obj:`0`, skip brokers which have failed *circuitBreakerThreshold* times in a row until this cool-down (in ms) after their last failure has expired (unless all brokers are skipped)
+    *circuitBreakerThreshold*      int       :obj:`1`      the number of consecutive failures which trip the circuit breaker
+    *backup*                       bool      :obj:`False`  initialize and hold a second STOMP connection to another broker which takes over immediately when the connection is lost (asynchronous client only)
+    *trackMessages*                bool      :obj:`False`  keep a cache of the messages which were sent but not yet confirmed (by a receipt or a transaction commit), and send them again after a reconnect (see :class:`~.cache.StompMessageCache`)
+    *maxCacheSize*                 int       :obj:`131072` the maximum total body size (in bytes) of the cached messages, if *trackMessages* is enabled (the oldest messages are evicted first)
+    *timeout*                      int       :obj:`-1`     if not :obj:`-1`, the time (in ms) a send operation may take before it fails with a :class:`~.StompSendTimeout` (the connection and the reconnection process are not affected)
+    *updateURIsSupported*          bool      :obj:`True`   accept updates of the list of brokers which the connected broker advertises (see :meth:`StompFailoverTransport.advertised`)
+    *updateURIsURL*                str       :obj:`None`   the path of a local file with a comma-separated list of broker URIs: whenever it has changed, it replaces the list of brokers (as of the next reconnect attempt)
+    *receiveBufferSize*            int       :obj:`-1`     if not :obj:`-1`, the size (in bytes) of the socket receive buffer (**SO_RCVBUF**)
+    *sendBufferSize*               int       :obj:`-1`     if not :obj:`-1`, the size (in bytes) of the socket send buffer (**SO_SNDBUF**)
+    *tcpNoDelay*                   bool      :obj:`False`  if set, disable the Nagle algorithm (**TCP_NODELAY**), so that small frames are not delayed
+    *keepAlive*                    bool      :obj:`False`  if set, enable TCP keepalive (**SO_KEEPALIVE**), which detects dead peers without STOMP heart-beats
+    *keepAliveIdle*                int       :obj:`-1`     if not :obj:`-1`, the idle time (in ms) before the first keepalive probe (**TCP_KEEPIDLE**)
+    *keepAliveInterval*            int       :obj:`-1`     if not :obj:`-1`, the time (in ms) between keepalive probes (**TCP_KEEPINTVL**)
+    *keepAliveCount*               int       :obj:`-1`     if not :obj:`-1`, the number of unanswered keepalive probes after which the connection is dropped (**TCP_KEEPCNT**)
+    *localAddress*                 str       :obj:`None`   the local address (**host** or **host:port**) from which to connect
     =============================  ========= ============= ================================================================
     
     .. seealso :: :class:`StompFailoverTransport`, `failover transport <http://activemq.apache.org/failover-transport-reference.html>`_ of ActiveMQ.
     """
-    LOCAL_HOST_NAMES = set([
-        'localhost',
-        '127.0.0.1',
-        socket.gethostbyname(socket.gethostname()),
-        socket.gethostname(),
-        socket.getfqdn(socket.gethostname())
-    ])
+    LOCAL_HOST_NAMES = _LocalHostNames()
 
     _configurationOption = collections.namedtuple('_configurationOption', ['parser', 'default'])
     _bool = {'true': True, 'false': False}.__getitem__
+    _strategy = {'default': 'default', 'latency': 'latency', 'weighted': 'weighted', 'failures': 'failures'}.__getitem__
 
     _FAILOVER_PREFIX = 'failover:'
     _REGEX_URI = re.compile('^(?P<protocol>tcp)://(?P<host>[^:]+):(?P<port>\d+)$')
@@ -141,11 +367,27 @@ class StompFailoverUri(object):
         , 'reconnectDelayJitter': _configurationOption(int, 0)
         , 'randomize': _configurationOption(_bool, True)
         , 'priorityBackup': _configurationOption(_bool, False)
-        #, 'backup': _configurationOption(_bool, False), # initialize and hold a second transport connection - to enable fast failover
-        #, 'timeout': _configurationOption(int, -1), # enables timeout on send operations (in miliseconds) without interruption of reconnection process
-        #, 'trackMessages': _configurationOption(_bool, False), # keep a cache of in-flight messages that will flushed to a broker on reconnect
-        #, 'maxCacheSize': _configurationOption(int, 131072), # size in bytes for the cache, if trackMessages is enabled
-        #, 'updateURIsSupported': _configurationOption(_bool, True), # determines whether the client should accept updates to its list of known URIs from the connected broker
+        , 'priorityProbeInterval': _configurationOption(int, 30000)
+        , 'priorityDwellTime': _configurationOption(int, 60000)
+        , 'race': _configurationOption(_bool, False)
+        , 'raceStagger': _configurationOption(int, 100)
+        , 'strategy': _configurationOption(_strategy, 'default')
+        , 'circuitBreakerCooldown': _configurationOption(int, 0)
+        , 'circuitBreakerThreshold': _configurationOption(int, 1)
+        , 'backup': _configurationOption(_bool, False)
+        , 'trackMessages': _configurationOption(_bool, False)
+        , 'maxCacheSize': _configurationOption(int, 131072)
+        , 'timeout': _configurationOption(int, -1)
+        , 'updateURIsSupported': _configurationOption(_bool, True)
+        , 'updateURIsURL': _configurationOption(str, None)
+        , 'receiveBufferSize': _configurationOption(int, -1)
+        , 'sendBufferSize': _configurationOption(int, -1)
+        , 'tcpNoDelay': _configurationOption(_bool, False)
+        , 'keepAlive': _configurationOption(_bool, False)
+        , 'keepAliveIdle': _configurationOption(int, -1)
+        , 'keepAliveInterval': _configurationOption(int, -1)
+        , 'keepAliveCount': _configurationOption(int, -1)
+        , 'localAddress': _configurationOption(str, None)
     }
 
     def __init__(self, uri):
@@ -177,6 +419,16 @@ class StompFailoverUri(object):
         except ValueError, msg:
             raise ValueError('invalid uri: %s [%s]' % (self.uri, msg))
 
+    def update(self, brokers):
+        """Replace the :attr:`brokers` by **brokers**, a list of broker URIs separated by commas or whitespace (optionally in brackets)."""
+        uri = brokers.strip()
+        brackets = self._REGEX_BRACKETS.match(uri)
+        uri = brackets.groupdict()['uri'] if brackets else uri
+        try:
+            self._setBrokers(','.join(u for u in re.split(r'[\s,]+', uri) if u))
+        except Exception, msg:
+            raise ValueError('invalid broker(s): %s [%s]' % (brokers, msg))
+
     def _setBrokers(self, uri):
         brackets = self._REGEX_BRACKETS.match(uri)
         uri = brackets.groupdict()['uri'] if brackets else uri
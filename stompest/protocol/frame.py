@@ -1,26 +1,48 @@
 from .spec import StompSpec
 
 class StompFrame(object):
-    """This object represents a STOMP frame which consists of a STOMP :attr:`command`, :attr:`headers`, and a message :attr:`body`. Its string representation (via :meth:`__str__`) renders the wire-level STOMP frame."""
+    """This object represents a STOMP frame which consists of a STOMP :attr:`command`, :attr:`headers`, and a message :attr:`body`. Its string representation (via :meth:`__str__`) renders the wire-level STOMP frame.
+
+    .. seealso :: :meth:`render` for wire-level frames which carry a **content-length** header.
+    """
     INFO_LENGTH = 20
 
+    _KEYS = ('command', 'headers', 'body')
+
     def __init__(self, command='', headers=None, body=''):
         self.command = str(command)
         self.headers = {} if (headers is None) else dict(map(str, item) for item in headers.iteritems())
         self.body = str(body)
+        self._rendered = None
 
     def __eq__(self, other):
-        return all(getattr(self, key) == getattr(other, key) for key in ('command', 'headers', 'body'))
+        return all(getattr(self, key) == getattr(other, key) for key in self._KEYS)
 
     def __iter__(self):
-        return self.__dict__.iteritems()
+        return ((key, getattr(self, key)) for key in self._KEYS)
 
     def __repr__(self):
-        return '%s(%s)' % (self.__class__.__name__, ', '.join("%s=%s" % (key, repr(self.__dict__[key])) for key in ('command', 'headers', 'body')))
+        return '%s(%s)' % (self.__class__.__name__, ', '.join("%s=%s" % (key, repr(self.__dict__[key])) for key in self._KEYS))
 
     def __str__(self):
-        headers = ''.join('%s:%s%s' % (key, value, StompSpec.LINE_DELIMITER) for (key, value) in self.headers.iteritems())
-        return StompSpec.LINE_DELIMITER.join([self.command, headers, '%s%s' % (self.body, StompSpec.FRAME_DELIMITER)])
+        return self.render()
+
+    def render(self, contentLength=False):
+        """Render the wire-level STOMP frame. The result is cached until the frame's :attr:`command`, :attr:`headers`, or :attr:`body` change.
+
+        :param contentLength: If :obj:`True`, a **content-length** header which specifies the number of bytes of a non-empty message body is added to the wire-level frame (unless the frame already has one). The :attr:`headers` of this object are not modified. This allows the receiving side to extract the body without scanning for the frame delimiter, and it is mandatory for binary bodies containing NUL bytes.
+        """
+        rendered = self._rendered
+        if rendered and (rendered[0] == contentLength) and (rendered[1] is self.command) and (rendered[3] is self.body) and (rendered[2] == self.headers):
+            return rendered[4]
+        headers = self.headers
+        if contentLength and self.body and (StompSpec.CONTENT_LENGTH_HEADER not in headers):
+            headers = dict(headers)
+            headers[StompSpec.CONTENT_LENGTH_HEADER] = str(len(self.body))
+        headers = ''.join('%s:%s%s' % (key, value, StompSpec.LINE_DELIMITER) for (key, value) in headers.iteritems())
+        wire = StompSpec.LINE_DELIMITER.join([self.command, headers, '%s%s' % (self.body, StompSpec.FRAME_DELIMITER)])
+        self._rendered = (contentLength, self.command, dict(self.headers), self.body, wire)
+        return wire
 
     def info(self):
         """Produce a log-friendly representation of the frame (show only non-trivial content, and truncate the message to INFO_LENGTH characters.)"""
@@ -48,5 +70,8 @@ class StompHeartBeat(object):
     def __str__(self):
         return StompSpec.LINE_DELIMITER
 
+    def render(self, contentLength=False):
+        return StompSpec.LINE_DELIMITER
+
     def info(self):
         return 'heart-beat'
@@ -0,0 +1,124 @@
+"""The :class:`StompInFlightTracker` object keeps track of the **MESSAGE** frames which a :class:`~.StompSession` has received for subscriptions with a client ack mode (**client** or **client-individual**) and which have not been acked or nacked yet. For each message, it records the message id, the subscription, the time of receipt, and the size of the body. A message handler which forgets to ack thus shows up as a growing number of in-flight messages, and an upper bound on their number or total body size tells a client when to stop reading from the wire (which throttles the broker as well).
+
+Example:
+
+>>> from stompest.protocol import StompFrame, StompInFlightTracker
+>>> now = [0]
+>>> tracker = StompInFlightTracker(maxCount=2, clock=lambda: now[0])
+>>> token = ('destination', '/queue/test')
+>>> for i in xrange(2):
+...     tracker.add(token, StompFrame('MESSAGE', {'message-id': str(i), 'destination': '/queue/test'}, 'hi'))
+...
+>>> tracker.full, tracker.bytes
+(True, 4)
+>>> now[0] = 3
+>>> tracker.oldest()
+3
+>>> [headers['message-id'] for (_, headers) in tracker.remove('0')]
+['0']
+>>> tracker.full
+False
+
+"""
+import collections
+import time
+
+from .spec import StompSpec
+
+class StompInFlightTracker(object):
+    """A registry of received but unacknowledged messages.
+
+    :param maxCount: The maximum number of in-flight messages. If :obj:`None`, there is no such limit.
+    :param maxBytes: The maximum total body size (in bytes) of all in-flight messages. If :obj:`None`, there is no such limit.
+    :param clock: A callable which returns the current time (in seconds).
+    """
+    def __init__(self, maxCount=None, maxBytes=None, clock=time.time):
+        self.maxCount = maxCount
+        self.maxBytes = maxBytes
+        self._clock = clock
+        self.clear()
+
+    def __contains__(self, messageId):
+        return messageId in self._tokens
+
+    def __len__(self):
+        return len(self._tokens)
+
+    @property
+    def bytes(self):
+        """The total body size of all in-flight messages."""
+        return self._bytes
+
+    @property
+    def full(self):
+        """:obj:`True` if the number of in-flight messages or their total body size has reached its limit."""
+        return ((self.maxCount is not None) and (len(self._tokens) >= self.maxCount)) or ((self.maxBytes is not None) and (self._bytes >= self.maxBytes))
+
+    def add(self, token, frame, cumulative=False):
+        """Record a received **MESSAGE** frame for the subscription identified by **token**. Adding a message twice has no effect.
+
+        :param cumulative: Acking (or nacking) a message of this subscription also acks all messages which were received earlier (ack mode **client**).
+        """
+        headers = frame.headers
+        messageId = headers[StompSpec.MESSAGE_ID_HEADER]
+        if messageId in self._tokens:
+            return
+        size = len(frame.body)
+        self._tokens[messageId] = token
+        try:
+            messages = self._messages[token]
+        except KeyError:
+            messages = self._messages[token] = collections.OrderedDict()
+            self._cumulative[token] = cumulative
+        messages[messageId] = (self._clock(), size, headers)
+        self._bytes += size
+
+    def remove(self, messageId):
+        """Forget about an in-flight message because it was acked or nacked (for a cumulative subscription, also forget about the messages received before it). Returns a list of (token, headers) pairs of the messages which are no longer in flight."""
+        try:
+            token = self._tokens[messageId]
+        except KeyError:
+            return []
+        messages = self._messages[token]
+        if not self._cumulative[token]:
+            return [(token, self._pop(token, messages, messageId))]
+        removed = []
+        for key in list(messages):
+            removed.append((token, self._pop(token, messages, key)))
+            if key == messageId:
+                break
+        return removed
+
+    def flush(self):
+        """Forget about all in-flight messages. Returns a list of (token, headers) pairs of the messages which have to be acked (or nacked) to release all in-flight messages: all messages of a subscription, or only its latest message if the subscription is cumulative."""
+        removed = []
+        for (token, messages) in self._messages.iteritems():
+            headers = [headers for (_, _, headers) in messages.itervalues()]
+            removed.extend((token, h) for h in (headers[-1:] if self._cumulative[token] else headers))
+        self.clear()
+        return removed
+
+    def clear(self):
+        """Forget about all in-flight messages (e.g., when the connection was lost and the broker will redeliver them anyway)."""
+        self._tokens = {}
+        self._messages = collections.OrderedDict()
+        self._cumulative = {}
+        self._bytes = 0
+
+    def oldest(self):
+        """The age (in seconds) of the oldest in-flight message, or :obj:`None` if there is none."""
+        received = [next(messages.itervalues())[0] for messages in self._messages.itervalues() if messages]
+        return (self._clock() - min(received)) if received else None
+
+    def statistics(self):
+        """Returns a :obj:`dict` with the number of in-flight messages (**count**), their total body size (**bytes**), and the age of the oldest one (**oldest**)."""
+        return {'count': len(self._tokens), 'bytes': self._bytes, 'oldest': self.oldest()}
+
+    def _pop(self, token, messages, messageId):
+        _, size, headers = messages.pop(messageId)
+        del self._tokens[messageId]
+        self._bytes -= size
+        if not messages:
+            del self._messages[token]
+            del self._cumulative[token]
+        return headers
@@ -49,6 +49,13 @@ class StompParser(object):
         """
         return bool(self._frames)
 
+    def pending(self):
+        """The number of bytes which are still missing of the frame being parsed if its body size is known from a **content-length** header (including the frame delimiter), or :obj:`0` otherwise.
+        """
+        if (self._length < 0) or (self.parse != self._parseBody):
+            return 0
+        return self._length - self._read + 1
+
     def get(self):
         """Return the next frame as a :class:`~.frame.StompFrame` object (if any), or :obj:`None` (otherwise).
         """
@@ -59,11 +66,27 @@ class StompParser(object):
         """Add a byte-stream of wire-level data.
         
         :param data: An iterable of characters. If any character evaluates to :obj:`False`, that stream will no longer be consumed.
+
+        .. note :: If **data** is a string and the frame being parsed announced its body size via a **content-length** header, the body is extracted in one slice instead of character by character.
         """
-        for character in data:
-            if not character:
-                return
-            self.parse(character)
+        if not isinstance(data, str):
+            for character in data:
+                if not character:
+                    return
+                self.parse(character)
+            return
+
+        position, end = 0, len(data)
+        while position < end:
+            remaining = self._length - self._read
+            if (remaining > 0) and (self.parse == self._parseBody):
+                chunk = data[position:position + remaining]
+                self._buffer.write(chunk)
+                self._read += len(chunk)
+                position += len(chunk)
+                continue
+            self.parse(data[position])
+            position += 1
 
     def reset(self):
         """Reset internal state, including all fully or partially parsed frames.
@@ -0,0 +1,125 @@
+"""The :class:`StompReceiptTracker` object keeps track of the receipts a :class:`~.StompSession` is still waiting for. It records when each receipt was requested and, optionally, a deadline after which the receipt is given up on. Expired receipts are found via a heap ordered by deadline, so the cost of an expiry check does not depend on the number of outstanding receipts. An upper bound on the number of outstanding receipts protects long-lived connections against receipts which never arrive.
+
+Example:
+
+>>> from stompest.protocol.receipt import StompReceiptTracker
+>>> now = [0]
+>>> tracker = StompReceiptTracker(timeout=5, clock=lambda: now[0])
+>>> tracker.add('message-1')
+[]
+>>> tracker.add('message-2', timeout=1)
+[]
+>>> now[0] = 2
+>>> tracker.expire()
+['message-2']
+>>> sorted(tracker.statistics().iteritems())
+[('count', 1), ('mean', 2.0), ('oldest', 2)]
+
+"""
+import collections
+import heapq
+import itertools
+import time
+
+from stompest.error import StompProtocolError
+
+class StompReceiptTracker(object):
+    """A registry of outstanding receipts.
+
+    :param timeout: The default time (in seconds) to wait for a receipt. If :obj:`None`, receipts will not expire unless you give them an individual timeout.
+    :param maxSize: The maximum number of outstanding receipts. If this limit is exceeded, the oldest receipt is given up on. If :obj:`None`, there is no such limit.
+    :param clock: A callable which returns the current time (in seconds).
+    """
+    def __init__(self, timeout=None, maxSize=None, clock=time.time):
+        self.timeout = timeout
+        self.maxSize = maxSize
+        self._clock = clock
+        self._counter = itertools.count()
+        self.clear()
+
+    def __contains__(self, receipt):
+        return receipt in self._receipts
+
+    def __iter__(self):
+        return iter(self._receipts)
+
+    def __len__(self):
+        return len(self._receipts)
+
+    def add(self, receipt, timeout=None):
+        """Start waiting for a receipt. Returns the receipts which were dropped to respect the **maxSize** limit.
+
+        :param timeout: An individual timeout for this receipt. The default :obj:`None` means the **timeout** of the tracker.
+        """
+        if receipt in self._receipts:
+            raise StompProtocolError('Duplicate receipt: %s' % receipt)
+        now = self._clock()
+        self.expire(now)
+        self._receipts[receipt] = now
+        self.deadline(receipt, timeout)
+        dropped = []
+        while (self.maxSize is not None) and (len(self._receipts) > self.maxSize):
+            oldest = next(iter(self._receipts))
+            self._pop(oldest)
+            dropped.append(oldest)
+        return dropped
+
+    def remove(self, receipt):
+        """Stop waiting for a receipt (because it has arrived). Returns the time (in seconds) the receipt was outstanding."""
+        try:
+            issued = self._pop(receipt)
+        except KeyError:
+            raise StompProtocolError('Unexpected receipt: %s' % receipt)
+        return self._clock() - issued
+
+    def deadline(self, receipt, timeout):
+        """Set the timeout (in seconds, relative to now) for an outstanding receipt. If :obj:`None`, the tracker's **timeout** is used."""
+        if receipt not in self._receipts:
+            raise StompProtocolError('Unknown receipt: %s' % receipt)
+        timeout = self.timeout if (timeout is None) else timeout
+        if timeout is None:
+            self._deadlines.pop(receipt, None)
+            return
+        entry = (self._clock() + timeout, next(self._counter))
+        self._deadlines[receipt] = entry
+        heapq.heappush(self._heap, entry + (receipt,))
+        self._compact()
+
+    def expire(self, now=None):
+        """Give up on all receipts whose deadline has passed. Returns the expired receipts."""
+        now = self._clock() if (now is None) else now
+        heap, expired = self._heap, []
+        while heap and (heap[0][0] <= now):
+            deadline, counter, receipt = heapq.heappop(heap)
+            if self._deadlines.get(receipt) == (deadline, counter): # otherwise, the entry is stale
+                self._pop(receipt)
+                expired.append(receipt)
+        return expired
+
+    def clear(self):
+        """Forget about all outstanding receipts."""
+        self._receipts = collections.OrderedDict()
+        self._deadlines = {}
+        self._heap = []
+
+    def statistics(self):
+        """Returns a :obj:`dict` with the number of outstanding receipts (**count**), the age (in seconds) of the oldest one (**oldest**) and their mean age (**mean**)."""
+        now = self._clock()
+        count = len(self._receipts)
+        if not count:
+            return {'count': 0, 'oldest': None, 'mean': None}
+        return {
+            'count': count,
+            'oldest': now - next(self._receipts.itervalues()),
+            'mean': (count * now - sum(self._receipts.itervalues())) / float(count)
+        }
+
+    def _compact(self):
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(d, c, r) for (d, c, r) in self._heap if self._deadlines.get(r) == (d, c)]
+            heapq.heapify(self._heap)
+
+    def _pop(self, receipt):
+        issued = self._receipts.pop(receipt)
+        self._deadlines.pop(receipt, None)
+        return issued
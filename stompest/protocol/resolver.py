@@ -0,0 +1,76 @@
+"""This module keeps a process-wide cache of the local host's identity (host name, fully qualified domain name, IP address). The name lookups are performed lazily when they are needed for the first time, and they are repeated only after the cached values have expired. Both the **host** header of the :func:`~.commands.connect` command and the local broker detection of the :class:`~.StompFailoverTransport` (option *priorityBackup*) use this cache, so neither importing :mod:`stompest.protocol` nor a series of reconnects will trigger any DNS lookup beyond the first one.
+
+Example:
+
+>>> from stompest.protocol import resolver
+>>> resolver.hostName()
+'earth.solar-system'
+>>> sorted(resolver.localHostNames())
+['127.0.0.1', '192.168.0.1', 'earth', 'earth.solar-system', 'localhost']
+"""
+import socket
+import threading
+import time
+
+class StompHostResolver(object):
+    """A cache for name lookups of the local host.
+
+    :param ttl: The time (in seconds) the result of a name lookup is valid. The default :obj:`None` is equivalent to the class attribute :attr:`DEFAULT_TTL`.
+    :param clock: A callable which returns the current time (in seconds).
+    """
+    DEFAULT_TTL = 300.0
+
+    def __init__(self, ttl=None, clock=time.time):
+        self.ttl = self.DEFAULT_TTL if (ttl is None) else ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget all cached lookups."""
+        self._cache = {}
+
+    def hostName(self):
+        """The name of the local host as it is seen by the outside world. If the reverse lookup fails, the plain host name is used instead."""
+        return self._get('hostName', self._hostName)
+
+    def localHostNames(self):
+        """A :obj:`frozenset` of all names and addresses under which the local host is known."""
+        return self._get('localHostNames', self._localHostNames)
+
+    def _get(self, key, lookup):
+        value, expires = self._cache.get(key, (None, None))
+        if (expires is not None) and (self._clock() < expires):
+            return value
+        with self._lock: # only one thread performs the lookup
+            value, expires = self._cache.get(key, (None, None))
+            now = self._clock()
+            if (expires is None) or (now >= expires):
+                value = lookup()
+                self._cache[key] = (value, now + self.ttl)
+        return value
+
+    def _hostName(self):
+        try:
+            return socket.gethostbyaddr(socket.gethostname())[0]
+        except socket.error:
+            return socket.gethostname()
+
+    def _localHostNames(self):
+        names = set(['localhost', '127.0.0.1'])
+        for lookup in (socket.gethostname, lambda: socket.gethostbyname(socket.gethostname()), lambda: socket.getfqdn(socket.gethostname())):
+            try:
+                names.add(lookup())
+            except socket.error:
+                pass
+        return frozenset(names)
+
+_resolver = StompHostResolver()
+
+def hostName():
+    """The name of the local host (cached by the process-wide :class:`StompHostResolver`)."""
+    return _resolver.hostName()
+
+def localHostNames():
+    """All names of the local host (cached by the process-wide :class:`StompHostResolver`)."""
+    return _resolver.localHostNames()
@@ -0,0 +1,121 @@
+"""The :class:`StompRouter` object maps concrete destinations to the subscriptions whose (possibly wildcard) destinations match them. Brokers like ActiveMQ deliver **MESSAGE** frames for a subscription to **/topic/foo.>** with the concrete destination, e.g., **/topic/foo.bar**, so for STOMP 1.0 subscriptions without an **id** header, an exact lookup of the destination does not find the subscription.
+
+Destinations are split into segments: everything up to (and including) the last **/** is the first segment, and the rest is split at the **separator** (if the separator is **/** itself, the whole destination is split at it). A segment **anySegment** matches exactly one segment, and a final segment **anyChild** matches one or more segments. The subscription patterns are kept in a trie over the segments, so the cost of a lookup is proportional to the number of segments of the concrete destination rather than to the number of subscriptions. The results of the most recent lookups are cached.
+
+Example:
+
+>>> from stompest.protocol import StompRouter
+>>> router = StompRouter()
+>>> router.add('/topic/foo.>', 'all')
+>>> router.add('/topic/foo.*.baz', 'baz')
+>>> router.match('/topic/foo.bar.baz')
+('all', 'baz')
+>>> router.match('/topic/foo')
+()
+
+"""
+import itertools
+
+class StompRouter(object):
+    """A routing index from destination patterns to subscription tokens.
+
+    :param separator: The separator of destination segments.
+    :param anySegment: The wildcard segment which matches exactly one segment.
+    :param anyChild: The wildcard segment which matches one or more trailing segments. It is only recognized as the last segment of a pattern.
+    :param cacheSize: The maximum number of concrete destinations whose lookup results are cached.
+    """
+    DEFAULT_CACHE_SIZE = 1024
+
+    def __init__(self, separator='.', anySegment='*', anyChild='>', cacheSize=None):
+        self.separator = separator
+        self.anySegment = anySegment
+        self.anyChild = anyChild
+        self.cacheSize = self.DEFAULT_CACHE_SIZE if (cacheSize is None) else cacheSize
+        self._counter = itertools.count()
+        self.clear()
+
+    def __contains__(self, token):
+        return token in self._tokens
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def add(self, pattern, token):
+        """Route all destinations matching **pattern** to **token**."""
+        if token in self._tokens:
+            raise KeyError('Already routed: %s' % (token,))
+        node = self._root
+        for segment in self._segments(pattern):
+            try:
+                node = node.children[segment]
+            except KeyError:
+                child = node.children[segment] = _Node()
+                node = child
+        node.tokens[token] = next(self._counter)
+        self._tokens[token] = pattern
+        self._cache.clear()
+
+    def remove(self, token):
+        """Stop routing to **token**."""
+        pattern = self._tokens.pop(token)
+        path = [self._root]
+        for segment in self._segments(pattern):
+            path.append(path[-1].children[segment])
+        path[-1].tokens.pop(token)
+        for (parent, node, segment) in reversed(zip(path, path[1:], self._segments(pattern))): # prune empty branches
+            if node.tokens or node.children:
+                break
+            del parent.children[segment]
+        self._cache.clear()
+
+    def match(self, destination):
+        """Returns a :obj:`tuple` of all tokens whose pattern matches **destination**, in the order in which they were added."""
+        try:
+            return self._cache[destination]
+        except KeyError:
+            pass
+        anySegment, anyChild = self.anySegment, self.anyChild
+        matches = {}
+        nodes = [self._root]
+        for segment in self._segments(destination):
+            if not nodes:
+                break
+            children = []
+            for node in nodes:
+                child = node.children.get(anyChild)
+                if child is not None:
+                    matches.update(child.tokens)
+                for key in (segment, anySegment):
+                    child = node.children.get(key)
+                    if child is not None:
+                        children.append(child)
+            nodes = children
+        for node in nodes:
+            matches.update(node.tokens)
+        result = tuple(token for (_, token) in sorted((order, token) for (token, order) in matches.iteritems()))
+        if len(self._cache) >= self.cacheSize:
+            self._cache.clear()
+        self._cache[destination] = result
+        return result
+
+    def clear(self):
+        """Forget about all routes."""
+        self._root = _Node()
+        self._tokens = {}
+        self._cache = {}
+
+    def _segments(self, destination):
+        if self.separator == '/':
+            return destination.split('/')
+        prefix, slash, name = destination.rpartition('/')
+        segments = name.split(self.separator)
+        if slash:
+            segments.insert(0, prefix + slash)
+        return segments
+
+class _Node(object):
+    __slots__ = ('children', 'tokens')
+
+    def __init__(self):
+        self.children = {}
+        self.tokens = {}
@@ -26,27 +26,61 @@ StompFrame(command='DISCONNECT', headers={}, body='')
 """
 import commands
 import copy
+import functools
 import itertools
-import time
 import uuid
 
 from stompest.error import StompProtocolError
 
+from clock import monotonic
+from frame import StompFrame
+from inflight import StompInFlightTracker
+from receipt import StompReceiptTracker
+from router import StompRouter
+from spec import StompSpec
+
+def _synchronized(f):
+    @functools.wraps(f)
+    def synchronized(self, *args, **kwargs):
+        lock = self._lock
+        if lock is None:
+            return f(self, *args, **kwargs)
+        with lock:
+            return f(self, *args, **kwargs)
+    return synchronized
+
 class StompSession(object):
     """This object implements an abstract STOMP protocol session.
     
     :param version: The highest (and at the same time default) STOMP protocol version.
     :param check: This flag decides whether the session should accept commands only in the proper session states (:obj:`True`) or in any session state (:obj:`False`).
+    :param receiptTimeout: The time (in seconds) after which a requested **RECEIPT** frame is no longer waited for. If :obj:`None`, the session waits until it is closed.
+    :param maxReceipts: The maximum number of outstanding receipts. If this limit is exceeded, the oldest receipt is given up on (see :meth:`droppedReceipts`). If :obj:`None`, there is no such limit.
+    :param clock: The clock for the heart-beat accounting (:meth:`sent`, :meth:`received`), the receipt deadlines, and the ages of in-flight messages. The default :obj:`None` means :func:`~.clock.monotonic`.
+    :param maxUnacked: The maximum number of in-flight messages (received for a subscription with a client ack mode, but not yet acked or nacked). If :obj:`None`, there is no such limit.
+    :param maxUnackedBytes: The maximum total body size of all in-flight messages. If :obj:`None`, there is no such limit.
+    :param lock: If you share the session between threads, pass a lock (e.g., a :func:`threading.Lock`) which serializes all changes of the session state. The default :obj:`None` means no locking.
+    :param cache: A :class:`~.cache.StompMessageCache` which keeps the **SEND** frames until they are confirmed, so that they can be sent again after a failover (see :meth:`resend`). If :obj:`None`, sent messages are not tracked.
     
+    .. seealso :: The :attr:`receipts` attribute for per-receipt deadlines and statistics on outstanding receipts, the :attr:`unacked` attribute for the in-flight messages, the :attr:`cache` attribute for the unconfirmed messages, and the :mod:`.protocol.clock` module.
     """
     CONNECTING = 'connecting'
     CONNECTED = 'connected'
     DISCONNECTING = 'disconnecting'
     DISCONNECTED = 'disconnected'
 
-    def __init__(self, version=None, check=True):
+    def __init__(self, version=None, check=True, receiptTimeout=None, maxReceipts=None, clock=None, maxUnacked=None, maxUnackedBytes=None, lock=None, cache=None):
+        self._lock = lock
+        self._cache = cache
         self.version = version
+        self._clock = clock or monotonic
         self._check = check
+        self._receiptTimeout = receiptTimeout
+        self._maxReceipts = maxReceipts
+        self._maxUnacked = maxUnacked
+        self._maxUnackedBytes = maxUnackedBytes
+        self._heartBeats = None
+        self._restoredHeartBeats = None
         self._nextSubscription = itertools.count().next
         self._reset()
         self._flush()
@@ -82,14 +116,22 @@ class StompSession(object):
 
     # STOMP commands
 
+    @_synchronized
     def connect(self, login=None, passcode=None, headers=None, versions=None, host=None, heartBeats=None):
-        """Create a **CONNECT** frame and set the session state to :attr:`CONNECTING`."""
+        """Create a **CONNECT** frame and set the session state to :attr:`CONNECTING`.
+        
+        :param heartBeats: The heart-beats to request. If :obj:`None`, no heart-beats are requested, unless this session was :meth:`restore`\ d and has not connected since: then, the heart-beats of the snapshot are requested again.
+        """
         self.__check('connect', [self.DISCONNECTED])
         self._versions = versions
+        if heartBeats is None:
+            heartBeats = self._restoredHeartBeats
+        self._heartBeats = heartBeats
         frame = commands.connect(login, passcode, headers, self._versions, host, heartBeats)
         self._state = self.CONNECTING
         return frame
 
+    @_synchronized
     def disconnect(self, receipt=None):
         """Create a **DISCONNECT** frame and set the session state to :attr:`DISCONNECTING`."""
         self.__check('disconnect', [self.CONNECTED])
@@ -98,22 +140,29 @@ class StompSession(object):
         self._state = self.DISCONNECTING
         return frame
 
+    @_synchronized
     def close(self, flush=True):
         """Clean up the session: Set the state to :attr:`DISCONNECTED`, remove all information related to an eventual broker connection, clear all pending transactions and receipts.
         
-        :param flush: Clear all active subscriptions. This flag controls whether the next :meth:`connect` will replay the currently active subscriptions or will wipe the slate clean.
+        :param flush: Clear all active subscriptions (and the unconfirmed messages in the :attr:`cache`). This flag controls whether the next :meth:`connect` will replay the currently active subscriptions or will wipe the slate clean.
         """
         self._reset()
         if flush:
             self._flush()
+            if self._cache is not None:
+                self._cache.clear()
 
+    @_synchronized
     def send(self, destination, body='', headers=None, receipt=None):
         """Create a **SEND** frame."""
         self.__check('send', [self.CONNECTED])
         frame = commands.send(destination, body, headers, receipt)
+        if self._cache is not None:
+            self._cache.add(frame)
         self._receipt(receipt)
         return frame
 
+    @_synchronized
     def subscribe(self, destination, headers=None, receipt=None, context=None):
         """Create a **SUBSCRIBE** frame and keep track of the subscription assiocated to it. This method returns a token which you have to keep if you wish to match incoming **MESSAGE** frames to this subscription with :meth:`message` or to :meth:`unsubscribe` later.
         
@@ -124,9 +173,10 @@ class StompSession(object):
         if token in self._subscriptions:
             raise StompProtocolError('Already subscribed [%s=%s]' % token)
         self._receipt(receipt)
-        self._subscriptions[token] = (self._nextSubscription(), destination, copy.deepcopy(headers), receipt, context)
+        self._subscribe(token, destination, headers, receipt, context)
         return frame, token
 
+    @_synchronized
     def unsubscribe(self, token, receipt=None):
         """Create an **UNSUBSCRIBE** frame and lose track of the subscription assiocated to it."""
         self.__check('unsubscribe', [self.CONNECTED])
@@ -135,22 +185,44 @@ class StompSession(object):
             self._subscriptions.pop(token)
         except KeyError:
             raise StompProtocolError('No such subscription [%s=%s]' % token)
+        if token in self._router:
+            self._router.remove(token)
         self._receipt(receipt)
         return frame
 
-    def ack(self, frame, receipt=None):
-        """Create an **ACK** frame for a received **MESSAGE** frame."""
+    @_synchronized
+    def ack(self, frame, receipt=None, trusted=False):
+        """Create an **ACK** frame for a received **MESSAGE** frame.
+
+        :param trusted: Skip the validation of the **MESSAGE** frame. Set this flag only if the frame has already been accepted by :meth:`message` (see :func:`~.commands.compiled`).
+        """
         self.__check('ack', [self.CONNECTED])
-        frame = commands.ack(frame, self._transactions, receipt, self.version)
+        ack = commands.compiled(self.version, trusted).ack(frame, self._transactions, receipt)
+        self._unacked.remove(frame.headers.get(StompSpec.MESSAGE_ID_HEADER))
         self._receipt(receipt)
-        return frame
+        return ack
+
+    @_synchronized
+    def nack(self, frame, receipt=None, trusted=False):
+        """Create a **NACK** frame for a received **MESSAGE** frame.
 
-    def nack(self, frame, receipt=None):
-        """Create a **NACK** frame for a received **MESSAGE** frame."""
+        :param trusted: See :meth:`ack`.
+        """
         self.__check('nack', [self.CONNECTED])
-        frame = commands.nack(frame, self._transactions, receipt, self.version)
+        nack = commands.compiled(self.version, trusted).nack(frame, self._transactions, receipt)
+        self._unacked.remove(frame.headers.get(StompSpec.MESSAGE_ID_HEADER))
         self._receipt(receipt)
-        return frame
+        return nack
+
+    @_synchronized
+    def ackAll(self, receipt=None):
+        """Create the **ACK** frames for all in-flight messages (see :attr:`unacked`). Only the latest message of a subscription with ack mode **client** is acked, because this ack is cumulative. If a receipt is requested, it is attached to the last frame (if there is any)."""
+        return self._all('ack', commands.compiled(self.version, True).ack, receipt)
+
+    @_synchronized
+    def nackAll(self, receipt=None):
+        """Create the **NACK** frames for all in-flight messages (see :meth:`ackAll`)."""
+        return self._all('nack', commands.compiled(self.version, True).nack, receipt)
 
     def transaction(self, transaction=None):
         """Generate a transaction id which can be used for :meth:`begin`, :meth:`abort`, and :meth:`commit`.
@@ -159,6 +231,7 @@ class StompSession(object):
         """
         return str(transaction or uuid.uuid4())
 
+    @_synchronized
     def begin(self, transaction=None, receipt=None):
         """Create a **BEGIN** frame and begin an abstract STOMP transaction.
         
@@ -174,6 +247,7 @@ class StompSession(object):
         self._receipt(receipt)
         return frame
 
+    @_synchronized
     def abort(self, transaction, receipt=None):
         """Create an **ABORT** frame to abort a STOMP transaction.
         
@@ -187,9 +261,12 @@ class StompSession(object):
             self._transactions.remove(transaction)
         except KeyError:
             raise StompProtocolError('Transaction unknown: %s' % transaction)
+        if self._cache is not None:
+            self._cache.abort(transaction)
         self._receipt(receipt)
         return frame
 
+    @_synchronized
     def commit(self, transaction, receipt=None):
         """Send a **COMMIT** command to commit a STOMP transaction.
         
@@ -203,9 +280,12 @@ class StompSession(object):
             self._transactions.remove(transaction)
         except KeyError:
             raise StompProtocolError('Transaction unknown: %s' % transaction)
+        if self._cache is not None:
+            self._cache.commit(transaction)
         self._receipt(receipt)
         return frame
 
+    @_synchronized
     def connected(self, frame):
         """Handle a **CONNECTED** frame and set the session state to :attr:`CONNECTED`."""
         self.__check('connected', [self.CONNECTING])
@@ -213,27 +293,37 @@ class StompSession(object):
             (self.version, self._server, self._id, (self._serverHeartBeat, self._clientHeartBeat)) = commands.connected(frame, versions=self._versions)
         finally:
             self._versions = None
+        self._restoredHeartBeats = None # the restored heart-beats only apply until the first successful connect
         self._state = self.CONNECTED
 
+    @_synchronized
     def message(self, frame):
         """Handle a **MESSAGE** frame. Returns a token which you can use to match this message to its subscription.
         
-        .. seealso :: The :meth:`subscribe` method.
+        .. note :: A **MESSAGE** frame without a **subscription** header (STOMP 1.0) is matched to the subscriptions by its destination. If there is no subscription to this very destination, the frame is matched to the oldest subscription whose wildcard destination (e.g., **/topic/foo.>**) matches it.
+        
+        .. seealso :: The :meth:`subscribe` method, and the :class:`~.router.StompRouter` for the wildcard syntax.
         """
         self.__check('message', [self.CONNECTED])
-        token = commands.message(frame, self.version)
+        token = commands.compiled(self.version).message(frame)
         if token not in self._subscriptions:
-            raise StompProtocolError('No such subscription [%s=%s]' % token)
+            tokens = (token[0] == StompSpec.DESTINATION_HEADER) and self._router.match(token[1])
+            if not tokens:
+                raise StompProtocolError('No such subscription [%s=%s]' % token)
+            token = tokens[0]
+        mode = (self._subscriptions[token][2] or {}).get(StompSpec.ACK_HEADER, StompSpec.ACK_AUTO)
+        if mode in StompSpec.CLIENT_ACK_MODES:
+            self._unacked.add(token, frame, mode == StompSpec.ACK_CLIENT)
         return token
 
+    @_synchronized
     def receipt(self, frame):
         """Handle a **RECEIPT** frame. Returns the receipt id which you can use to match this receipt to the command that requested it."""
         self.__check('receipt', [self.CONNECTED, self.DISCONNECTING])
-        receipt = commands.receipt(frame, self.version)
-        try:
-            self._receipts.remove(receipt)
-        except KeyError:
-            raise StompProtocolError('Unexpected receipt: %s' % receipt)
+        receipt = commands.compiled(self.version).receipt(frame)
+        self._receipts.remove(receipt)
+        if self._cache is not None:
+            self._cache.confirm(receipt)
         return receipt
 
     # heartbeating
@@ -246,22 +336,31 @@ class StompSession(object):
     def sent(self):
         """Notify the session that data was sent (counts as client heart-beat).
         """
-        self._lastSent = time.time()
+        self._lastSent = self._clock()
 
     def received(self):
         """Notify the session that data was received (counts as server heart-beat).
         """
-        self._lastReceived = time.time()
+        self._lastReceived = self._clock()
+
+    @property
+    def clock(self):
+        """The clock of this session. :attr:`lastSent` and :attr:`lastReceived` are measured with it."""
+        return self._clock
 
     @property
     def lastSent(self):
-        """The last time when data was sent.
+        """The last time when data was sent (measured with the session's :attr:`~.StompSession.clock`).
+        
+        .. note :: This is not an epoch timestamp (the default clock is :func:`~.clock.monotonic`), so only compare it with other readings of the session's clock.
         """
         return self._lastSent
 
     @property
     def lastReceived(self):
-        """The last time when data was received.
+        """The last time when data was received (measured with the session's :attr:`~.StompSession.clock`).
+        
+        .. note :: This is not an epoch timestamp (the default clock is :func:`~.clock.monotonic`), so only compare it with other readings of the session's clock.
         """
         return self._lastReceived
 
@@ -294,34 +393,138 @@ class StompSession(object):
         """The current session state."""
         return self._state
 
+    @property
+    def unacked(self):
+        """The :class:`~.inflight.StompInFlightTracker` which holds the messages which were handled by :meth:`message` but have not been acked or nacked yet. It is reset when the session is closed (the broker will redeliver these messages anyway)."""
+        return self._unacked
+
+    @property
+    def receipts(self):
+        """The :class:`~.receipt.StompReceiptTracker` which holds the outstanding receipts. Use it to set individual deadlines, to expire receipts, or to obtain statistics about them."""
+        return self._receipts
+
+    @_synchronized
+    def droppedReceipts(self):
+        """Returns the receipts which were given up on because the **maxReceipts** limit was exceeded since the last call. A client should fail the operations which are still waiting for them."""
+        dropped, self._droppedReceipts = self._droppedReceipts, []
+        return dropped
+
+    @property
+    def cache(self):
+        """The :class:`~.cache.StompMessageCache` of the **SEND** frames which were not confirmed yet (or :obj:`None`)."""
+        return self._cache
+
     #subscription replay
 
     def replay(self):
         """Flush all active subscriptions and return an iterator over the :meth:`subscribe` parameters (**destinations**, **header**, **receipt**, **context**) which you can consume to replay the subscriptions upon the next :meth:`connect`."""
-        subscriptions = self._subscriptions
-        self._flush()
-        for (_, destination, headers, receipt, context) in sorted(subscriptions.itervalues()):
+        for (_, destination, headers, receipt, context) in self._replay():
             yield destination, headers, receipt, context
 
+    @_synchronized
+    def resend(self):
+        """Returns the **SEND** frames which were not confirmed on the previous connection and have to be sent again after the next :meth:`connect` (see :meth:`~.cache.StompMessageCache.replay`). Without a :attr:`cache`, there are none."""
+        if self._cache is None:
+            return []
+        return self._cache.replay()
+
+    # session snapshot
+
+    SNAPSHOT_FORMAT = 1
+
+    @_synchronized
+    def snapshot(self):
+        """Returns the state of this session which survives a restart of your process: the STOMP protocol version, the requested heart-beats, and the active subscriptions (with their contexts, in the order they were created). The snapshot consists of :obj:`dict`, :obj:`list`, and :obj:`str` objects only, so it is JSON serializable if the subscription contexts are.
+        
+        .. seealso :: The :meth:`restore` method.
+        """
+        return {
+            'format': self.SNAPSHOT_FORMAT,
+            'version': self.version,
+            'heartBeats': list(self._heartBeats) if self._heartBeats else None,
+            'subscriptions': [
+                {'destination': destination, 'headers': copy.deepcopy(headers), 'receipt': receipt, 'context': context}
+                for (_, destination, headers, receipt, context) in sorted(self._subscriptions.itervalues())
+            ]
+        }
+
+    @_synchronized
+    def restore(self, snapshot):
+        """Restore the state of a (disconnected) session from a :meth:`snapshot`. The previous subscriptions of this session are dropped, and the restored ones will be replayed upon the next :meth:`connect` (see :meth:`replay`).
+        
+        **Example:**
+        
+        >>> import json
+        >>> session = StompSession(check=False)
+        >>> _ = session.subscribe('/queue/test', {'ack': 'client-individual'}, context='my context')
+        >>> snapshot = json.dumps(session.snapshot())
+        >>> session = StompSession()
+        >>> session.restore(json.loads(snapshot))
+        >>> list(session.replay())
+        [(u'/queue/test', {u'ack': u'client-individual'}, None, u'my context')]
+        
+        """
+        self.__check('restore', [self.DISCONNECTED])
+        if snapshot.get('format') != self.SNAPSHOT_FORMAT:
+            raise StompProtocolError('Unsupported session snapshot format: %s' % snapshot.get('format'))
+        version = snapshot.get('version')
+        if version is not None:
+            version = commands.version(version)
+            if version not in commands.versions(self.__version):
+                raise StompProtocolError('Unsupported version in session snapshot: %s [version=%s]' % (version, self.__version))
+            self._version = version
+        heartBeats = snapshot.get('heartBeats')
+        self._heartBeats = self._restoredHeartBeats = tuple(heartBeats) if heartBeats else None
+        self._flush()
+        for subscription in snapshot.get('subscriptions', []):
+            destination, headers = subscription['destination'], subscription['headers']
+            _, token = commands.subscribe(destination, headers, None, self.version)
+            if token in self._subscriptions:
+                raise StompProtocolError('Already subscribed [%s=%s]' % token)
+            self._subscribe(token, destination, headers, subscription.get('receipt'), subscription.get('context'))
+
     # helpers
 
     def _flush(self):
-        self._receipts = set()
+        self._receipts = StompReceiptTracker(self._receiptTimeout, self._maxReceipts, self._clock)
+        self._droppedReceipts = []
         self._subscriptions = {}
+        self._router = StompRouter()
         self._transactions = set()
 
+    @_synchronized
+    def _replay(self):
+        subscriptions = self._subscriptions
+        self._flush()
+        return sorted(subscriptions.itervalues())
+
+    def _subscribe(self, token, destination, headers, receipt, context):
+        self._subscriptions[token] = (self._nextSubscription(), destination, copy.deepcopy(headers), receipt, context)
+        if token[0] == StompSpec.DESTINATION_HEADER:
+            self._router.add(destination, token)
+
+    def _all(self, command, create, receipt):
+        self.__check(command, [self.CONNECTED])
+        messages = self._unacked.flush()
+        frames = [create(StompFrame(StompSpec.MESSAGE, headers), self._transactions, None) for (_, headers) in messages]
+        if frames and receipt:
+            frames[-1] = create(StompFrame(StompSpec.MESSAGE, messages[-1][1]), self._transactions, receipt)
+            self._receipt(receipt)
+        return frames
+
     def _receipt(self, receipt):
         if not receipt:
             return
-        if receipt in self._receipts:
-            raise StompProtocolError('Duplicate receipt: %s' % receipt)
-        self._receipts.add(receipt)
+        self._droppedReceipts.extend(self._receipts.add(receipt))
+        if self._cache is not None:
+            self._cache.mark(receipt)
 
     def _reset(self):
         self._id = None
         self._server = None
         self._state = self.DISCONNECTED
         self._lastSent = self._lastReceived = None
+        self._unacked = StompInFlightTracker(self._maxUnacked, self._maxUnackedBytes, self._clock)
         self._clientHeartBeat = self._serverHeartBeat = 0
         self.version = self.__version
         self._versions = None
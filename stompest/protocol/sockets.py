@@ -0,0 +1,59 @@
+"""The :class:`StompSocketOptions` object translates the socket tuning options of a failover URI (which may be overridden by the **socketOptions** of a :class:`~.StompConfig`) into the socket options and the local address which the clients apply to each wire-level connection before it is established. All options default to the settings of your operating system.
+
+Example:
+
+>>> from stompest.protocol import StompFailoverUri, StompSocketOptions
+>>> uri = StompFailoverUri('failover:tcp://remote1:61615?receiveBufferSize=1048576,keepAlive=true,keepAliveIdle=60000')
+>>> options = StompSocketOptions(uri.options, {'tcpNoDelay': True})
+>>> options.socketOptions
+[('SOL_SOCKET', 'SO_RCVBUF', 1048576), ('IPPROTO_TCP', 'TCP_NODELAY', 1), ('SOL_SOCKET', 'SO_KEEPALIVE', 1), ('IPPROTO_TCP', 'TCP_KEEPIDLE', 60)]
+>>> print options.bindAddress
+None
+
+"""
+import socket
+
+class StompSocketOptions(object):
+    """The socket tuning of the wire-level connections.
+
+    :param options: The :attr:`~.StompFailoverUri.options` of a failover URI.
+    :param overrides: A :obj:`dict` of options which take precedence (with the same names and types as the failover URI options).
+    """
+    OPTIONS = ('receiveBufferSize', 'sendBufferSize', 'tcpNoDelay', 'keepAlive', 'keepAliveIdle', 'keepAliveInterval', 'keepAliveCount', 'localAddress')
+
+    def __init__(self, options, overrides=None):
+        options = dict((k, options.get(k)) for k in self.OPTIONS)
+        for (key, value) in (overrides or {}).iteritems():
+            if key not in options:
+                raise ValueError('Unknown socket option: %s' % key)
+            options[key] = value
+        self.options = options
+
+        socketOptions = []
+        for (level, name, key) in (('SOL_SOCKET', 'SO_RCVBUF', 'receiveBufferSize'), ('SOL_SOCKET', 'SO_SNDBUF', 'sendBufferSize')):
+            if options[key] >= 0:
+                socketOptions.append((level, name, options[key]))
+        if options['tcpNoDelay']:
+            socketOptions.append(('IPPROTO_TCP', 'TCP_NODELAY', 1))
+        if options['keepAlive']:
+            socketOptions.append(('SOL_SOCKET', 'SO_KEEPALIVE', 1))
+            for (name, key, scale) in (('TCP_KEEPIDLE', 'keepAliveIdle', 1000), ('TCP_KEEPINTVL', 'keepAliveInterval', 1000), ('TCP_KEEPCNT', 'keepAliveCount', 1)):
+                if options[key] >= 0:
+                    socketOptions.append(('IPPROTO_TCP', name, max(1, options[key] // scale)))
+        self.socketOptions = socketOptions
+
+        self.bindAddress = None
+        if options['localAddress']:
+            host, _, port = options['localAddress'].rpartition(':')
+            self.bindAddress = (host, int(port)) if host else (port, 0)
+
+    def __nonzero__(self):
+        return bool(self.socketOptions or self.bindAddress)
+
+    def apply(self, sock, bind=True):
+        """Set the socket options on the socket **sock**, and bind it to the local address (if any, and if **bind** is set). Options which are not available on your platform are skipped."""
+        for (level, name, value) in self.socketOptions:
+            if hasattr(socket, name):
+                sock.setsockopt(getattr(socket, level), getattr(socket, name), value)
+        if bind and self.bindAddress:
+            sock.bind(self.bindAddress)
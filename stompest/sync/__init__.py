@@ -1 +1,2 @@
-from client import Stomp
\ No newline at end of file
+from client import Stomp
+from selector import StompSelector
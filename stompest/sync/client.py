@@ -21,15 +21,19 @@ API
 """
 import collections
 import contextlib
+import itertools
 import logging
+import select
+import sys
+import threading
 import time
 
-from stompest.error import StompConnectionError, StompProtocolError
-from stompest.protocol import StompFailoverTransport, StompSession
+from stompest.error import StompConnectionError, StompConnectTimeout, StompProtocolError
+from stompest.protocol import StompAckBatcher, StompCoarseClock, StompFailoverTransport, StompMessageCache, StompSession, StompSocketOptions, StompSpec
+from stompest.trace import StompFrameTracer
 from stompest.util import checkattr
 
 from .transport import StompFrameTransport
-from stompest.protocol import commands
 
 LOG_CATEGORY = __name__
 
@@ -39,17 +43,43 @@ class Stomp(object):
     """A synchronous STOMP client. This is the successor of the simple STOMP client in stompest 1.x, but the API is not backward compatible.
 
     :param config: A :class:`~.StompConfig` object
+    :param ackWindow: If not :obj:`None`, :meth:`~.sync.client.Stomp.ack` will batch the **ACK** frames (unless a **RECEIPT** is requested): this is a :obj:`dict` of keyword arguments for the :class:`~.StompAckBatcher` which decides when the acks are due. For subscriptions with ack mode **client**, one cumulative **ACK** frame is sent per window, for the ack mode **client-individual**, the **ACK** frames of one window are written at once. Pending acks are sent when a window is full or has expired (checked whenever you ack or read), by :meth:`~.sync.client.Stomp.flushAcks`, and before disconnecting.
+    :param tracer: A :class:`~.StompFrameTracer` which logs the wire-level traffic. The default :obj:`None` means a tracer which logs all frames. The tracer is available as the attribute :attr:`tracer`.
+    :param clock: The clock of the :attr:`~.sync.client.Stomp.session` which measures the heart-beat activity (see :mod:`.protocol.clock`). The default :obj:`None` means a :class:`~.StompCoarseClock` (with the :attr:`~.StompCoarseClock.RESOLUTION` of 1 ms) which is ticked once per :meth:`~.sync.client.Stomp.canRead`, per read from the wire, and per write (so that a client which only sends has an up-to-date :attr:`~.sync.client.Stomp.lastSent`).
+    :param maxUnacked: The maximum number of in-flight messages (see :attr:`~.StompSession.unacked`). When it is reached, :meth:`~.sync.client.Stomp.canRead` sends all pending batched acks, and if that does not help, it does not read from the wire until you ack or nack. If :obj:`None`, there is no such limit.
+    :param maxUnackedBytes: The same limit for the total body size of all in-flight messages.
+    :param writeBuffer: If not :obj:`None`, outgoing frames are buffered and written at once instead of one system call per frame: this is a :obj:`dict` with the buffer **size** (in bytes, the buffer is written when it is full), the **timeout** (in seconds, the buffer is written when its oldest frame has waited this long), and **cork** (see :meth:`~.sync.client.Stomp.batch`). The buffer is also written by :meth:`~.sync.client.Stomp.flush`, before the client waits for incoming frames (for instance, in :meth:`~.sync.client.Stomp.canRead`), and before disconnecting.
+    
+    .. note :: You may share one client between threads (but connect and disconnect it from one thread only). The session state is protected by a lock, each frame is written as a whole, and only one thread at a time reads from the wire: the frames it reads are queued, so another thread which waits in :meth:`~.sync.client.Stomp.canRead` or :meth:`~.sync.client.Stomp.receiveFrame` picks up the next one.
+    
+    .. note :: If the failover URI has the option **timeout**, a send operation which cannot write its frames within this time (because the broker does not read) raises a :class:`~.StompSendTimeout`. The connection is not closed: the frames which were not written yet are spooled and go out ahead of the next frame you send, so do not send them again.
+    
+    .. note :: Each API command checks that the connection is alive. Reads and writes notice a closed connection anyway, so the check only peeks at the socket if the connection has been idle for at least :attr:`PROBE_INTERVAL` seconds (a class attribute, the default is 1 s; :obj:`0` means that every command costs a system call).
     
     .. seealso :: :class:`~.StompConfig` for how to set session configuration options, :class:`~.StompSession` for session state, :mod:`.protocol.commands` for all API options which are documented here.
     """
     _failoverFactory = StompFailoverTransport
     _transportFactory = StompFrameTransport
 
-    def __init__(self, config):
+    PROBE_INTERVAL = 1.0
+
+    def __init__(self, config, ackWindow=None, tracer=None, clock=None, maxUnacked=None, maxUnackedBytes=None, writeBuffer=None):
         self.log = logging.getLogger(LOG_CATEGORY)
+        self.tracer = tracer or StompFrameTracer()
         self._config = config
-        self._session = StompSession(self._config.version, self._config.check)
+        clock = clock or StompCoarseClock(resolution=StompCoarseClock.RESOLUTION)
+        self._tick = getattr(clock, 'tick', clock)
         self._failover = self._failoverFactory(config.uri)
+        options = self._failover.options
+        cache = StompMessageCache(options['maxCacheSize']) if options['trackMessages'] else None
+        self._session = StompSession(self._config.version, self._config.check, clock=clock, maxUnacked=maxUnacked, maxUnackedBytes=maxUnackedBytes, lock=threading.Lock(), cache=cache)
+        self._acks = StompAckBatcher(**ackWindow) if (ackWindow is not None) else None
+        self._writeBuffer = writeBuffer or {}
+        self._socketOptions = StompSocketOptions(options, config.socketOptions)
+        self._ackLock = threading.Lock()
+        self._ackModes = {}
+        self._readable = threading.Condition(threading.Lock())
+        self._reading = False
         self._transport = None
 
     def connect(self, headers=None, versions=None, host=None, heartBeats=None, connectTimeout=None, connectedTimeout=None):
@@ -74,6 +104,8 @@ class Stomp(object):
         >>> client.session.version
         '1.1'
         
+        .. note :: If the failover URI has the option **race=true**, the brokers of each reconnect attempt are connected to concurrently (a new one every **raceStagger** ms while the previous ones are pending), and the first connection which completes the STOMP handshake wins. The **connectTimeout** and **connectedTimeout** then apply to each broker separately.
+        
         .. seealso :: The :mod:`.protocol.failover` and :mod:`.protocol.session` modules for the details of subscription replay and failover transport.
         """
         try: # preserve existing connection
@@ -83,38 +115,168 @@ class Stomp(object):
         else:
             raise StompConnectionError('Already connected to %s' % self._transport)
 
+        if self._failover.options['race']:
+            self._race(headers, versions, host, heartBeats, connectTimeout, connectedTimeout)
+            return
+
         try:
             for (broker, connectDelay) in self._failover:
-                transport = self._transportFactory(broker['host'], broker['port'], self.session.version)
+                transport = self._createTransport(broker)
                 if connectDelay:
                     self.log.debug('Delaying connect attempt for %d ms' % int(connectDelay * 1000))
                     time.sleep(connectDelay)
                 self.log.info('Connecting to %s ...' % transport)
+                started = time.time()
                 try:
                     transport.connect(connectTimeout)
                 except StompConnectionError as e:
                     self.log.warning('Could not connect to %s [%s]' % (transport, e))
+                    self._failover.failed(broker)
                 else:
                     self.log.info('Connection established')
+                    self._failover.connected(broker, time.time() - started)
                     self._transport = transport
-                    self._connect(headers, versions, host, heartBeats, connectedTimeout)
+                    self._connect(broker, headers, versions, host, heartBeats, connectedTimeout)
                     break
         except StompConnectionError as e:
             self.log.error('Reconnect failed [%s]' % e)
             raise
 
-    def _connect(self, headers, versions, host, heartBeats, timeout):
+    def _connect(self, broker, headers, versions, host, heartBeats, timeout):
         frame = self.session.connect(self._config.login, self._config.passcode, headers, versions, host, heartBeats)
-        self.sendFrame(frame)
-        if not self.canRead(timeout):
-            self.session.disconnect()
-            raise StompProtocolError('STOMP session connect failed [timeout=%s]' % timeout)
-        frame = self.receiveFrame()
-        self.session.connected(frame)
+        started = time.time()
+        try:
+            self.sendFrame(frame)
+            if not self.canRead(timeout):
+                self.session.disconnect()
+                raise StompProtocolError('STOMP session connect failed [timeout=%s]' % timeout)
+            response = self.receiveFrame()
+            self.session.connected(response)
+        except (StompConnectionError, StompProtocolError):
+            self._failover.failed(broker)
+            raise
+        self._failover.established(broker, time.time() - started)
+        self._failover.advertised(response.headers)
+        self._connected()
+
+    def _connected(self):
         self.log.info('STOMP session established with broker %s' % self._transport)
+        frames = []
         for (destination, headers, receipt, _) in self.session.replay():
             self.log.info('Replaying subscription %s' % headers)
-            self.subscribe(destination, headers, receipt)
+            frames.append(self._subscribe(destination, headers, receipt)[0])
+        messages = self.session.resend()
+        if messages:
+            self.log.info('Sending %d unconfirmed message(s) again' % len(messages))
+        self._sendFrames(frames + messages) # all subscriptions and unconfirmed messages in one write
+
+    def _createTransport(self, broker):
+        timeout = self._failover.options['timeout']
+        sendTimeout = None if (timeout < 0) else (timeout / 1000.0)
+        writeBuffer = self._writeBuffer
+        return self._transportFactory(
+            broker['host'], broker['port'], self.session.version, self._config.contentLength, sendTimeout,
+            bufferSize=writeBuffer.get('size', 0), bufferTimeout=writeBuffer.get('timeout'), cork=writeBuffer.get('cork', False),
+            socketOptions=self._socketOptions
+        )
+
+    def _race(self, headers, versions, host, heartBeats, connectTimeout, connectedTimeout):
+        frame = self.session.connect(self._config.login, self._config.passcode, headers, versions, host, heartBeats)
+        try:
+            for (brokers, connectDelay) in self._failover.rounds():
+                if connectDelay:
+                    self.log.debug('Delaying connect attempt for %d ms' % int(connectDelay * 1000))
+                    time.sleep(connectDelay)
+                transport, response = self._raceRound(frame, brokers, connectTimeout, connectedTimeout)
+                if transport is not None:
+                    break
+        except StompConnectionError as e:
+            self.session.close(flush=False)
+            self.log.error('Reconnect failed [%s]' % e)
+            raise
+        self.log.info('Connection established')
+        self._transport = transport
+        self.session.sent()
+        self.session.received()
+        self.session.connected(response)
+        self._failover.advertised(response.headers)
+        self._connected()
+
+    def _raceRound(self, frame, brokers, connectTimeout, connectedTimeout):
+        # Start a connect attempt for the next broker whenever all pending attempts have failed, or when the latest
+        # one has been pending for raceStagger ms. Keep the first transport which completes the STOMP handshake.
+        stagger = self._failover.options['raceStagger'] / 1000.0
+        deadline = lambda timeout: float('inf') if (timeout is None) else (time.time() + timeout)
+        brokers = collections.deque(brokers)
+        connecting, handshaking = {}, {} # transport -> deadline
+        attempts = {} # transport -> (broker, start of the current connect phase)
+        nextAttempt = time.time()
+
+        def fail(transport, reason, lost=False):
+            self.log.warning('Could not connect to %s [%s]' % (transport, reason))
+            broker, _ = attempts.pop(transport)
+            if not lost:
+                self._failover.failed(broker)
+            connecting.pop(transport, None)
+            handshaking.pop(transport, None)
+            try:
+                transport.disconnect()
+            except StompConnectionError:
+                pass
+
+        while brokers or connecting or handshaking:
+            if brokers and ((not (connecting or handshaking)) or (nextAttempt <= time.time())):
+                broker = brokers.popleft()
+                transport = self._createTransport(broker)
+                self.log.info('Connecting to %s ...' % transport)
+                nextAttempt = time.time() + stagger
+                try:
+                    transport.startConnect()
+                except StompConnectionError as e:
+                    self.log.warning('Could not connect to %s [%s]' % (transport, e))
+                    self._failover.failed(broker)
+                else:
+                    connecting[transport] = deadline(connectTimeout)
+                    attempts[transport] = (broker, time.time())
+                continue
+
+            timeout = min([nextAttempt if brokers else float('inf')] + connecting.values() + handshaking.values()) - time.time()
+            timeout = None if (timeout == float('inf')) else max(0, timeout)
+            readable, writable, _ = select.select(list(handshaking), list(connecting), [], timeout)
+            for transport in writable:
+                del connecting[transport]
+                try:
+                    transport.finishConnect()
+                    self.tracer.sending(frame)
+                    transport.send(frame)
+                    transport.flush() # the handshake must not wait in the write buffer
+                except StompConnectionError as e:
+                    fail(transport, e)
+                else:
+                    broker, started = attempts[transport]
+                    attempts[transport] = (broker, time.time())
+                    self._failover.connected(broker, attempts[transport][1] - started)
+                    handshaking[transport] = deadline(connectedTimeout)
+            for transport in readable:
+                try:
+                    response = transport.receive()
+                except StompConnectionError as e:
+                    fail(transport, e)
+                    continue
+                self.tracer.received(response)
+                if response.command != StompSpec.CONNECTED:
+                    fail(transport, 'received %s' % response.info())
+                    continue
+                del handshaking[transport]
+                broker, started = attempts.pop(transport)
+                self._failover.established(broker, time.time() - started)
+                for loser in list(itertools.chain(connecting, handshaking)):
+                    fail(loser, 'lost the race against %s' % transport, lost=True)
+                return transport, response
+            now = time.time()
+            for transport in [t for (t, d) in itertools.chain(connecting.items(), handshaking.items()) if d <= now]:
+                fail(transport, 'timeout')
+        return None, None
 
     @connected
     def disconnect(self, receipt=None):
@@ -124,6 +286,7 @@ class Stomp(object):
         
         .. note :: Calling this method will clear the session's active subscriptions unless you request a **RECEIPT** response from the broker. In the latter case, you have to disconnect the wire-level connection and flush the subscriptions yourself by calling ``self.close(flush=True)``.
         """
+        self.flushAcks()
         self.sendFrame(self.session.disconnect(receipt))
         if not receipt:
             self.close()
@@ -136,7 +299,7 @@ class Stomp(object):
         
         Send a **SEND** frame.
         """
-        self.sendFrame(commands.send(destination, body, headers, receipt))
+        self.sendFrame(self.session.send(destination, body, headers, receipt))
 
     @connected
     def subscribe(self, destination, headers=None, receipt=None):
@@ -144,7 +307,7 @@ class Stomp(object):
         
         Send a **SUBSCRIBE** frame to subscribe to a STOMP destination. This method returns a token which you have to keep if you wish to match incoming **MESSAGE** frames to this subscription or to :meth:`~.sync.client.Stomp.unsubscribe` later.
         """
-        frame, token = self.session.subscribe(destination, headers, receipt)
+        frame, token = self._subscribe(destination, headers, receipt)
         self.sendFrame(frame)
         return token
 
@@ -154,15 +317,37 @@ class Stomp(object):
         
         Send an **UNSUBSCRIBE** frame to terminate an existing subscription.
         """
-        self.sendFrame(self.session.unsubscribe(token, receipt))
+        frame = self.session.unsubscribe(token, receipt)
+        self._ackModes.pop(token, None)
+        if self._acks is not None:
+            with self._ackLock:
+                frames = self._acks.remove(token)
+            self._sendAcks(frames)
+        self.sendFrame(frame)
 
     @connected
     def ack(self, frame, receipt=None):
         """ack(frame, receipt=None)
         
         Send an **ACK** frame for a received **MESSAGE** frame.
+        
+        .. note :: If this client batches its acks (see the **ackWindow** parameter), the **ACK** frame may be sent later.
         """
-        self.sendFrame(self.session.ack(frame, receipt))
+        if (self._acks is None) or receipt:
+            self.sendFrame(self.session.ack(frame, receipt))
+            return
+        token = self.session.message(frame)
+        with self._ackLock:
+            self._acks.completed(token, frame, self._ackModes.get(token, StompSpec.ACK_CLIENT_INDIVIDUAL))
+            frames = self._acks.due()
+        self._sendAcks(frames)
+
+    def flushAcks(self):
+        """Send all pending **ACK** frames (if this client batches its acks)."""
+        if self._acks is not None:
+            with self._ackLock:
+                frames = self._acks.flush()
+            self._sendAcks(frames)
 
     @connected
     def nack(self, headers, receipt=None):
@@ -171,6 +356,31 @@ class Stomp(object):
         Send a **NACK** frame for a received **MESSAGE** frame.
         """
         self.sendFrame(self.session.nack(headers, receipt))
+        if self._acks is not None:
+            with self._ackLock:
+                self._acks.discard(headers) # the batched acks of later messages must not wait for this one
+                frames = self._acks.due()
+            self._sendAcks(frames)
+
+    @connected
+    def ackAll(self, receipt=None):
+        """ackAll(receipt=None)
+        
+        Ack all in-flight messages in one write (including those whose acks are batched).
+        
+        .. seealso :: :meth:`~.StompSession.ackAll`
+        """
+        self._all(self.session.ackAll, receipt)
+
+    @connected
+    def nackAll(self, receipt=None):
+        """nackAll(receipt=None)
+        
+        Nack all in-flight messages in one write (including those whose acks are batched).
+        
+        .. seealso :: :meth:`~.StompSession.nackAll`
+        """
+        self._all(self.session.nackAll, receipt)
 
     @connected
     def begin(self, transaction, receipt=None):
@@ -268,6 +478,11 @@ class Stomp(object):
         .. note :: If you do not flush the subscriptions, they will be replayed upon this client's next :meth:`~.sync.client.Stomp.connect`!
         """
         self.session.close(flush)
+        if self._acks is not None:
+            with self._ackLock:
+                self._acks.clear() # the broker will redeliver unacked messages anyway
+        if flush:
+            self._ackModes.clear()
         try:
             self.__transport and self.__transport.disconnect()
         finally:
@@ -282,22 +497,100 @@ class Stomp(object):
         :param timeout: This is the time (in seconds) to wait for a frame to become available. If :obj:`None`, we will wait indefinitely.
         
         .. note :: If the wire-level connection is not available, this method will raise a :class:`~.StompConnectionError`!
+        
+        .. note :: If the in-flight limit (**maxUnacked** or **maxUnackedBytes**) is reached, no more frames are read from the wire until you ack or nack: this method returns :obj:`False` for a finite **timeout**, and it raises a :class:`~.StompProtocolError` if you wish to wait indefinitely (which would never end).
         """
+        self._tick()
+        if self._acks is not None:
+            with self._ackLock:
+                frames = self._acks.due()
+            self._sendAcks(frames)
         if self._messages:
             return True
+        if self.session.unacked.full:
+            self.flushAcks()
+            if self.session.unacked.full: # too many messages in flight, so we leave the next ones on the wire
+                if timeout is None:
+                    raise StompProtocolError('Too many unacked messages [%(count)d messages, %(bytes)d bytes in flight]' % self.session.unacked.statistics())
+                return False
         deadline = None if (timeout is None) else (time.time() + timeout)
+        with self._readable: # only one thread reads from the wire, the others wait for it to queue a frame
+            while self._reading:
+                timeout = deadline and max(0, deadline - time.time())
+                if timeout == 0:
+                    return bool(self._messages)
+                self._readable.wait(timeout)
+                if self._messages:
+                    return True
+            self._reading = True
+        try:
+            return self._read(deadline)
+        finally:
+            with self._readable:
+                self._reading = False
+                self._readable.notifyAll()
+
+    @connected
+    def fileno(self):
+        """fileno()
+        
+        The file descriptor of the wire-level connection. It changes when the client reconnects.
+        
+        .. note :: A readable file descriptor does not mean that :meth:`~.sync.client.Stomp.receiveFrame` will not block (it may have been a heart-beat), and frames which were already read are not signaled at all. Call :meth:`~.sync.client.Stomp.canRead` with a timeout of :obj:`0`, or wait for many clients at once with a :class:`~.StompSelector`.
+        """
+        return self._transport.fileno()
+
+    def _buffered(self):
+        # frames which are available without waiting for the wire (a cheap test without system call)
+        transport = self.__transport
+        return bool(self._messages) or bool(transport and transport.buffered())
+
+    def _read(self, deadline):
         while True:
             timeout = deadline and max(0, deadline - time.time())
             if not self._transport.canRead(timeout):
                 return False
             frame = self._transport.receive()
-            self.session.received()
-            if self.log.isEnabledFor(logging.DEBUG):
-                self.log.debug('Received %s' % frame.info())
-            if frame: # there's a real STOMP frame on the wire, not a heart-beat
-                self._messages.append(frame)
+            self._tick()
+            if self._received(frame):
                 return True
 
+    def _received(self, frame):
+        self.session.received()
+        self.tracer.received(frame)
+        if not frame: # a heart-beat
+            return False
+        if frame.command == StompSpec.MESSAGE:
+            self._delivered(frame)
+        self._messages.append(frame)
+        return True
+
+    def _feed(self):
+        # one non-blocking read for a StompSelector (a partial frame must not stall the other clients)
+        if not self.__transport:
+            raise StompConnectionError('Not connected')
+        self._drain(sys.maxint, feed=True)
+        return bool(self._messages)
+
+    def _drain(self, maxFrames, feed=False):
+        # queue the frames which were already read from the wire, without system call (unless feed is set)
+        with self._readable:
+            if self._reading: # another thread reads, it will queue them
+                return
+            self._reading = True
+        try:
+            transport = self.__transport
+            received = feed and transport.feed()
+            self._tick()
+            if received:
+                self.session.received()
+            while (len(self._messages) < maxFrames) and transport.buffered() and (not self.session.unacked.full):
+                self._received(transport.receive())
+        finally:
+            with self._readable:
+                self._reading = False
+                self._readable.notifyAll()
+
     def sendFrame(self, frame):
         """Send a raw STOMP frame.
         
@@ -305,18 +598,103 @@ class Stomp(object):
 
         .. note :: If we are not connected, this method, and all other API commands for sending STOMP frames except :meth:`~.sync.client.Stomp.connect`, will raise a :class:`~.StompConnectionError`. Use this command only if you have to bypass the :class:`~.StompSession` logic and you know what you're doing!
         """
-        if self.log.isEnabledFor(logging.DEBUG):
-            self.log.debug('Sending %s' % frame.info())
+        self.tracer.sending(frame)
         self._transport.send(frame)
+        self._tick()
+        self.session.sent()
+
+    @connected
+    def flush(self):
+        """flush()
+        
+        Write all buffered frames now (see the **writeBuffer** parameter).
+        """
+        self._transport.flush()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """A context manager for a section whose frames are buffered and written at once when the section ends (whether or not there is a **writeBuffer**, whose size still applies, though). If the **writeBuffer** has the option **cork**, the socket is corked (**TCP_CORK**) until then, so that even the writes of a full buffer only go out in full TCP segments.
+        
+        **Example:**
+        
+        >>> with client.batch():
+        ...     for body in bodies:
+        ...         client.send('/queue/test', body)
+        
+        """
+        with self._transport.batch():
+            yield
+
+    def _all(self, create, receipt):
+        if self._acks is not None:
+            with self._ackLock:
+                self._acks.clear() # these messages are in flight as well
+        self._sendFrames(create(receipt))
+
+    def _sendAcks(self, frames):
+        self._sendFrames([self.session.ack(frame, trusted=True) for frame in frames])
+
+    def _sendFrames(self, frames):
+        if not frames:
+            return
+        for frame in frames:
+            self.tracer.sending(frame)
+        self._transport.sendFrames(frames)
+        self._tick()
         self.session.sent()
 
+    def _subscribe(self, destination, headers, receipt):
+        frame, token = self.session.subscribe(destination, headers, receipt)
+        self._ackModes[token] = frame.headers.get(StompSpec.ACK_HEADER, StompSpec.ACK_AUTO)
+        return frame, token
+
+    def _delivered(self, frame):
+        try:
+            token = self.session.message(frame)
+        except StompProtocolError:
+            return
+        if self._acks is not None:
+            with self._ackLock:
+                self._acks.delivered(token, frame, self._ackModes.get(token, StompSpec.ACK_AUTO))
+
     def receiveFrame(self):
         """Fetch the next available frame.
         
         .. note :: If we are not connected, this method will raise a :class:`~.StompConnectionError`. Keep in mind that this method will block forever if there are no frames incoming on the wire. Be sure to use peek with ``self.canRead(timeout)`` before!
         """
-        if self.canRead():
-            return self._messages.popleft()
+        while self.canRead():
+            try:
+                return self._messages.popleft()
+            except IndexError: # another thread took the frame
+                pass
+
+    def receiveFrames(self, maxFrames, timeout=None):
+        """Fetch up to **maxFrames** frames at once. If no frame is available, wait for the next one (as :meth:`~.sync.client.Stomp.canRead` does), and return it together with all frames which arrived with it: the transport reads as much data as there is on the wire, and the frames which were parsed from it are returned without another system call. Returns an empty list if no frame arrives in time.
+        
+        :param maxFrames: The maximum number of frames to return.
+        :param timeout: The time (in seconds) to wait for a frame. If :obj:`None`, we will wait indefinitely.
+        
+        **Example:**
+        
+        >>> while True:
+        ...     frames = client.receiveFrames(100, timeout=1)
+        ...     store(frames) # e.g., in one database transaction
+        ...     for frame in frames:
+        ...         client.ack(frame)
+        
+        .. note :: The in-flight limits (**maxUnacked** and **maxUnackedBytes**) apply: no more frames are read from the wire once they are reached.
+        """
+        frames = []
+        if not self.canRead(timeout):
+            return frames
+        self._drain(maxFrames)
+        messages = self._messages
+        while messages and (len(frames) < maxFrames):
+            try:
+                frames.append(messages.popleft())
+            except IndexError: # another thread took the frame
+                break
+        return frames
 
     @property
     def session(self):
@@ -324,13 +702,19 @@ class Stomp(object):
         """
         return self._session
 
+    @property
+    def failover(self):
+        """The :class:`~.StompFailoverTransport` which chooses the brokers to connect to. Use its :meth:`~.StompFailoverTransport.update` method to change the list of brokers at runtime.
+        """
+        return self._failover
+
     @property
     def _transport(self):
         transport = self.__transport
         if not transport:
             raise StompConnectionError('Not connected')
         try:
-            transport.canRead(0)
+            transport.probe(self.PROBE_INTERVAL)
         except Exception as e:
             self.close(flush=False)
             raise e
@@ -357,8 +741,8 @@ class Stomp(object):
         >>> from stompest.sync import Stomp
         >>> client = Stomp(StompConfig('tcp://localhost:61612', version='1.1'))
         >>> client.connect(heartBeats=(100, 100))
-        >>> start = time.time()
-        >>> elapsed = lambda t = None: (t or time.time()) - start
+        >>> start = client.session.clock()
+        >>> elapsed = lambda t = None: (t or client.session.clock()) - start
         >>> times = lambda: 'elapsed: %.2f, last received: %.2f, last sent: %.2f' % (
         ...     elapsed(), elapsed(client.lastReceived), elapsed(client.lastSent)
         ... )
@@ -384,16 +768,21 @@ class Stomp(object):
         elapsed: 0.50, last received: 0.50, last sent: 0.25
         """
         self.sendFrame(self.session.beat())
+        self._transport.flush() # a heart-beat must not wait in the buffer
 
     @property
     def lastSent(self):
-        """The last time when data was sent.
+        """The last time when data was sent (measured with the session's :attr:`~.StompSession.clock`).
+        
+        .. note :: This is not an epoch timestamp (the default clock is :func:`~.clock.monotonic`), so only compare it with other readings of the session's clock.
         """
         return self.session.lastSent
 
     @property
     def lastReceived(self):
-        """The last time when data was received.
+        """The last time when data was received (measured with the session's :attr:`~.StompSession.clock`).
+        
+        .. note :: This is not an epoch timestamp (the default clock is :func:`~.clock.monotonic`), so only compare it with other readings of the session's clock.
         """
         return self.session.lastReceived
 
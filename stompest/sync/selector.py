@@ -0,0 +1,141 @@
+"""A :class:`StompSelector` lets a single thread service many synchronous clients (hundreds of broker connections) without Twisted. It waits for incoming data on all registered clients at once, using :func:`select.epoll` if available, :func:`select.poll` otherwise (both scale beyond the 1024 file descriptors which :func:`select.select` can handle), reads once (without waiting for the rest of a frame) from the clients whose connections are readable, and returns the clients which have a parsed frame waiting for you.
+
+Example:
+
+.. code-block:: python
+
+    selector = StompSelector()
+    for client in clients:
+        client.connect()
+        client.subscribe('/queue/test', {StompSpec.ACK_HEADER: StompSpec.ACK_CLIENT_INDIVIDUAL})
+        selector.register(client)
+    while True:
+        for client in selector.select(timeout=1):
+            try:
+                frame = client.receiveFrame()
+            except StompConnectionError:
+                continue # the client was unregistered, reconnect and register it again
+            client.ack(frame)
+
+"""
+import math
+import select
+
+from stompest.error import StompConnectionError
+
+class StompSelector(object):
+    """Waits for incoming frames on many :class:`~.sync.client.Stomp` clients.
+
+    :param poller: The polling mechanism (**epoll**, **poll**, or **select**). The default :obj:`None` means the most scalable one which is available on your platform.
+
+    .. note :: A selector is meant to be used by one thread. A client is registered with the file descriptor of its current connection, so register it again after it has reconnected. A client whose connection is lost while the selector reads from it is unregistered and returned by :meth:`select`, so that its :meth:`~.sync.client.Stomp.receiveFrame` raises the :class:`~.StompConnectionError`.
+    """
+    def __init__(self, poller=None):
+        self._poller = _POLLERS[poller or next(name for name in _PREFERENCE if name in _POLLERS)]()
+        self._clients = {}
+
+    def __len__(self):
+        return len(self._clients)
+
+    @property
+    def clients(self):
+        """The registered clients."""
+        return self._clients.values()
+
+    def register(self, client):
+        """Wait for incoming frames on a connected client (again)."""
+        self.unregister(client)
+        fileno = client.fileno()
+        self._poller.register(fileno)
+        self._clients[fileno] = client
+
+    def unregister(self, client):
+        """Forget about a client. This has no effect if it is not registered."""
+        for (fileno, registered) in self._clients.items():
+            if registered is client:
+                self._drop(fileno)
+
+    def select(self, timeout=None):
+        """Wait for incoming frames. Returns the list of clients whose next :meth:`~.sync.client.Stomp.receiveFrame` returns a frame without blocking. This list is empty if no frame arrived within the timeout.
+
+        :param timeout: The time (in seconds) to wait. If :obj:`None`, wait until there is a frame.
+        """
+        while True:
+            ready = [client for client in self._clients.itervalues() if client._buffered()]
+            for fileno in self._poller.poll(0 if ready else timeout):
+                client = self._clients.get(fileno)
+                if client is None:
+                    continue
+                try:
+                    readable = client._feed()
+                except StompConnectionError:
+                    self._drop(fileno)
+                    readable = True
+                if readable and (client not in ready):
+                    ready.append(client)
+            if ready or (timeout is not None):
+                return ready
+
+    def close(self):
+        """Unregister all clients and release the poller. The clients are not disconnected."""
+        for fileno in list(self._clients):
+            self._drop(fileno)
+        self._poller.close()
+
+    def _drop(self, fileno):
+        del self._clients[fileno]
+        try:
+            self._poller.unregister(fileno)
+        except (EnvironmentError, KeyError, ValueError): # the connection is already closed
+            pass
+
+class _EPoll(object):
+    def __init__(self):
+        self._epoll = select.epoll()
+
+    def register(self, fileno):
+        self._epoll.register(fileno, select.EPOLLIN)
+
+    def unregister(self, fileno):
+        self._epoll.unregister(fileno)
+
+    def poll(self, timeout):
+        return [fileno for (fileno, _) in self._epoll.poll(-1 if (timeout is None) else timeout)]
+
+    def close(self):
+        self._epoll.close()
+
+class _Poll(object):
+    def __init__(self):
+        self._poll = select.poll()
+
+    def register(self, fileno):
+        self._poll.register(fileno, select.POLLIN)
+
+    def unregister(self, fileno):
+        self._poll.unregister(fileno)
+
+    def poll(self, timeout):
+        return [fileno for (fileno, _) in self._poll.poll(None if (timeout is None) else int(math.ceil(1000 * timeout)))]
+
+    def close(self):
+        pass
+
+class _Select(object):
+    def __init__(self):
+        self._filenos = set()
+
+    def register(self, fileno):
+        self._filenos.add(fileno)
+
+    def unregister(self, fileno):
+        self._filenos.remove(fileno)
+
+    def poll(self, timeout):
+        return select.select(list(self._filenos), [], [], timeout)[0]
+
+    def close(self):
+        pass
+
+_POLLERS = dict((name, poller) for (name, poller) in [('epoll', _EPoll), ('poll', _Poll), ('select', _Select)] if hasattr(select, name))
+_PREFERENCE = ['epoll', 'poll', 'select']
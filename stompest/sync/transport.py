@@ -1,44 +1,160 @@
+import collections
+import contextlib
+import errno
+import math
+import os
 import select
 import socket
+import threading
 
-from stompest.error import StompConnectionError
+from stompest.error import StompConnectionError, StompError, StompSendTimeout
 from stompest.protocol import StompParser
+from stompest.protocol.clock import StompCoarseClock, monotonic
 
 class StompFrameTransport(object):
+    """The wire-level connection of the synchronous client.
+
+    :param bufferSize: If positive, frames are not written one by one but buffered until their total size reaches this many bytes (or until :meth:`flush`). The buffer is flushed before waiting for incoming data and before disconnecting.
+    :param bufferTimeout: The time (in seconds) after which a buffer which has not reached **bufferSize** is flushed anyway (by a timer thread). If :obj:`None`, the buffer waits for the next explicit or implicit flush.
+    :param noDelay: If not :obj:`None`, enable (or disable) the socket option **TCP_NODELAY**, which switches off the Nagle algorithm, so that small writes are not delayed by the kernel.
+    :param cork: Cork the socket (**TCP_CORK**, where available) during a :meth:`batch`, so that the kernel only sends full TCP segments.
+    :param socketOptions: A :class:`~.StompSocketOptions` object whose socket options and local address are applied before connecting.
+
+    The size of the reads adapts to the traffic: it starts at :attr:`READ_SIZE` and doubles (up to :attr:`MAX_READ_SIZE`) whenever a read fills the whole buffer, and it halves again whenever a read returns less than a quarter of it. If the frame being read announced its body size (**content-length**), the read is at least as large as the rest of the frame.
+    """
     factory = StompParser
 
     READ_SIZE = 4096
+    MAX_READ_SIZE = 1048576
 
-    def __init__(self, host, port, version=None):
+    def __init__(self, host, port, version=None, contentLength=False, sendTimeout=None, bufferSize=0, bufferTimeout=None, noDelay=None, cork=False, socketOptions=None):
         self.host = host
         self.port = port
         self.version = version
+        self.contentLength = contentLength
+        self.sendTimeout = sendTimeout
+        self.bufferSize = bufferSize
+        self.bufferTimeout = bufferTimeout
+        self.noDelay = noDelay
+        self.cork = cork
+        self.socketOptions = socketOptions
 
         self._socket = None
         self._parser = self.factory(self.version)
+        self._pending = collections.deque()
+        self._writeLock = threading.Lock()
+        self._bufferLock = threading.Lock()
+        self._buffered = 0 # bytes which are pending because of buffering
+        self._batches = 0
+        self._timer = None
+        self._clock = StompCoarseClock(resolution=StompCoarseClock.RESOLUTION)
+        self._active = 0 # when data was last read or written (measured with self._clock)
+        self._readSize = self.READ_SIZE
+        self._reads = self._bytesRead = self._writes = 0
 
     def __str__(self):
         return '%s:%d' % (self.host, self.port)
 
     def connect(self, timeout=None):
-        kwargs = {} if (timeout is None) else {'timeout': timeout}
+        error = None
         try:
-            self._socket = socket.create_connection((self.host, self.port), **kwargs)
+            addresses = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)
         except IOError as e:
             raise StompConnectionError('Could not establish connection [%s]' % e)
-        self._parser.reset()
+        for (family, socktype, proto, _, address) in addresses: # like socket.create_connection, but tuned before connecting
+            try:
+                self._socket = self._createSocket(family, socktype, proto)
+                if timeout is not None:
+                    self._socket.settimeout(timeout)
+                self._socket.connect(address)
+                self._configure()
+                break
+            except IOError as e:
+                error = e
+                self._close()
+        else:
+            raise StompConnectionError('Could not establish connection [%s]' % error)
+        self._reset()
+
+    def startConnect(self):
+        """Start a non-blocking connect. Wait until :meth:`fileno` is writable, then complete it with :meth:`finishConnect`."""
+        try:
+            family, socktype, proto, _, address = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)[0]
+            sock = self._createSocket(family, socktype, proto)
+        except IOError as e:
+            raise StompConnectionError('Could not establish connection [%s]' % e)
+        sock.setblocking(0)
+        error = sock.connect_ex(address)
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            sock.close()
+            raise StompConnectionError('Could not establish connection [%s]' % os.strerror(error))
+        self._socket = sock
+        self._reset()
+
+    def finishConnect(self):
+        """Complete a connect which was started by :meth:`startConnect`."""
+        self._check()
+        error = self._socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self._close()
+            raise StompConnectionError('Could not establish connection [%s]' % os.strerror(error))
+        self._socket.setblocking(1)
+        try:
+            self._configure()
+        except IOError as e:
+            self._close()
+            raise StompConnectionError('Could not establish connection [%s]' % e)
+
+    def fileno(self):
+        self._check()
+        return self._socket.fileno()
 
     def canRead(self, timeout=None):
         self._check()
         if self._parser.canRead():
             return True
-        if timeout is None:
-            files, _, _ = select.select([self._socket], [], [])
-        else:
-            files, _, _ = select.select([self._socket], [], [], timeout)
-        return bool(files)
+        if self._pending:
+            self.flush()
+        return _readable(self._socket, timeout)
+
+    def buffered(self):
+        """Tell whether a complete frame has already been read from the wire, so that :meth:`receive` does not block."""
+        return self._parser.canRead()
+
+    def probe(self, interval=0):
+        """Check that the connection is alive. Raises a :class:`~.StompConnectionError` (and disconnects) if the connection has been closed by the broker. This costs a system call (a non-blocking peek at the socket) only if nothing has been read or written for at least **interval** seconds, otherwise, the successful reads and writes prove that the connection is alive."""
+        self._check()
+        now = self._clock.tick()
+        if (now - self._active) < interval:
+            return
+        try:
+            if (not _MSG_DONTWAIT) and (not _readable(self._socket, 0)):
+                data = None
+            else:
+                data = self._socket.recv(1, socket.MSG_PEEK | _MSG_DONTWAIT)
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self._close()
+                raise StompConnectionError('Connection closed [%s]' % e)
+            data = None
+        except AttributeError as e: # the socket was closed by another thread
+            raise StompConnectionError('Connection closed [%s]' % e)
+        if (data == '') and (not self._parser.canRead()): # EOF (frames which were already received may still be read)
+            self._close()
+            raise StompConnectionError('Connection closed [No more data]')
+        self._active = now
 
     def disconnect(self):
+        self._cancelTimer()
+        try:
+            if self._socket and self._pending:
+                self.flush()
+        except StompError: # the connection is broken (or the broker does not read) anyway
+            pass
+        finally:
+            self._close()
+
+    def _close(self):
         try:
             self._socket and self._socket.close()
         except IOError as e:
@@ -47,22 +163,91 @@ class StompFrameTransport(object):
             self._socket = None
 
     def send(self, frame):
-        self._write(str(frame))
+        self._write(frame.render(self.contentLength))
+
+    def sendFrames(self, frames):
+        self._write(''.join(frame.render(self.contentLength) for frame in frames))
+
+    def flush(self):
+        """Write all buffered frames now."""
+        self._check()
+        self._cancelTimer()
+        self._flush()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """A context manager for a section whose frames are buffered (regardless of **bufferTimeout**, and up to **bufferSize** if this is positive) and written at once when the section ends. If **cork** is set, the socket is corked until then."""
+        self._check()
+        with self._bufferLock:
+            self._batches += 1
+            if self._batches == 1:
+                self._setCork(True)
+        try:
+            yield
+        finally:
+            with self._bufferLock:
+                self._batches -= 1
+                last = not self._batches
+            if last:
+                try:
+                    if self._socket:
+                        self.flush()
+                finally:
+                    self._setCork(False)
 
     def receive(self):
         while True:
             frame = self._parser.get()
             if frame is not None:
                 return frame
+            if self._pending:
+                self.flush()
             try:
-                data = self._socket.recv(self.READ_SIZE)
+                data = self._read()
                 if not data:
                     raise StompConnectionError('No more data')
             except (IOError, StompConnectionError) as e:
-                self.disconnect()
+                self._close()
                 raise StompConnectionError('Connection closed [%s]' % e)
+            self._active = self._clock.tick()
             self._parser.add(data)
 
+    def feed(self):
+        """Read once from the wire without waiting for a complete frame, and parse what was read. Returns :obj:`True` if there was any data. Afterwards, :meth:`buffered` tells whether :meth:`receive` does not block."""
+        self._check()
+        try:
+            data = self._read(_MSG_DONTWAIT)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return False
+            self._close()
+            raise StompConnectionError('Connection closed [%s]' % e)
+        except AttributeError as e: # the socket was closed by another thread
+            raise StompConnectionError('Connection closed [%s]' % e)
+        if not data:
+            self._close()
+            raise StompConnectionError('Connection closed [No more data]')
+        self._active = self._clock.tick()
+        self._parser.add(data)
+        return True
+
+    def statistics(self):
+        """Returns a :obj:`dict` with the number of system calls which read from the wire (**reads**), the number of bytes which were read (**bytes**), the current read size (**readSize**), and the number of write operations (**writes**)."""
+        return {'reads': self._reads, 'bytes': self._bytesRead, 'readSize': self._readSize, 'writes': self._writes}
+
+    def _read(self, flags=0):
+        size = self._readSize
+        size = max(size, min(self._parser.pending(), self.MAX_READ_SIZE))
+        data = self._socket.recv(size, flags) # the parser keeps the string, so a reusable buffer would cost an extra copy
+        received = len(data)
+        self._reads += 1
+        self._bytesRead += received
+        if received == size: # the socket has more data for us
+            self._readSize = min(2 * self._readSize, self.MAX_READ_SIZE)
+        elif received < (self._readSize // 4): # chatty traffic does not need a big buffer
+            self._readSize = max(self._readSize // 2, self.READ_SIZE)
+        return data
+
     def _check(self):
         if not self._connected():
             raise StompConnectionError('Not connected')
@@ -71,8 +256,174 @@ class StompFrameTransport(object):
         return self._socket is not None
 
     def _write(self, data):
+        # Each frame is rendered by the calling thread and queued as a whole. Whoever holds the write lock writes
+        # all queued data at once, so concurrent writers neither interleave partial frames nor wait for each other's
+        # rendering, and a thread whose data has already been written by another one returns immediately (or raises
+        # the error of the write which carried its data).
         self._check()
+        write = _Write(data)
+        self._pending.append(write)
+        if (self.bufferSize > 0 or self._batches) and self._buffer(len(data)):
+            return
+        self._flush(write)
+
+    def _buffer(self, size):
+        # Returns True if the data may stay in the buffer for now.
+        with self._bufferLock:
+            self._buffered += size
+            if (self.bufferSize > 0) and (self._buffered >= self.bufferSize):
+                return False
+            if (not self._batches) and (self.bufferTimeout is not None) and (self._timer is None):
+                self._timer = threading.Timer(self.bufferTimeout, self._flushTimed)
+                self._timer.daemon = True
+                self._timer.start()
+            return True
+
+    def _flushTimed(self):
+        with self._bufferLock:
+            self._timer = None
         try:
-            self._socket.sendall(data)
-        except IOError as e:
-            raise StompConnectionError('Could not send to connection [%s]' % e)
+            self._socket and self._flush()
+        except StompError: # the next operation of the client will notice the broken connection (or the spooled data)
+            pass
+
+    def _cancelTimer(self):
+        with self._bufferLock:
+            timer, self._timer = self._timer, None
+        if timer:
+            timer.cancel()
+
+    def _flush(self, write=None):
+        pending = self._pending
+        with self._writeLock:
+            with self._bufferLock:
+                self._buffered = 0
+            if (write is not None) and write.done:
+                write.check()
+                return
+            if not pending:
+                return
+            writes = []
+            while pending:
+                writes.append(pending.popleft())
+            data = ''.join(w.data for w in writes)
+            self._writes += 1
+            sent = len(data)
+            try:
+                if self.sendTimeout is None:
+                    self._socket.sendall(data)
+                else:
+                    sent = self._sendall(data, self.sendTimeout)
+            except (IOError, AttributeError) as e: # AttributeError: the socket was closed by another thread
+                try:
+                    self._close()
+                except StompConnectionError:
+                    pass
+                error = StompConnectionError('Could not send to connection [%s]' % e)
+                for w in writes:
+                    w.finish(error)
+                raise error
+            self._active = self._clock.tick()
+            if sent < len(data):
+                self._spool(writes, sent)
+                raise StompSendTimeout('Could not send to connection within %s seconds [%d of %d bytes spooled]' % (self.sendTimeout, len(data) - sent, len(data)))
+            for w in writes:
+                w.finish()
+
+    def _spool(self, writes, sent):
+        # The data which could not be written in time goes out ahead of the next write, because the broker may already
+        # have received the beginning of a frame: dropping its remainder would corrupt the stream. The writes which are
+        # spooled stay pending (only the thread which hit the deadline sees the timeout), the others are done.
+        for (index, write) in enumerate(writes):
+            if sent < len(write.data):
+                write.data = write.data[sent:]
+                break
+            sent -= len(write.data)
+            write.finish()
+        self._pending.extendleft(reversed(writes[index:]))
+
+    def _createSocket(self, family, socktype, proto):
+        sock = socket.socket(family, socktype, proto)
+        if self.socketOptions:
+            try:
+                self.socketOptions.apply(sock)
+            except:
+                sock.close()
+                raise
+        return sock
+
+    def _configure(self):
+        if self.noDelay is not None:
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self.noDelay))
+
+    def _setCork(self, enabled):
+        if not (self.cork and hasattr(socket, 'TCP_CORK')):
+            return
+        try:
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, int(enabled))
+        except (IOError, AttributeError): # the connection is broken or closed
+            pass
+
+    def _reset(self):
+        self._parser.reset()
+        error = StompConnectionError('Could not send to connection [Connection was reset]')
+        while self._pending:
+            self._pending.popleft().finish(error)
+        self._buffered = 0
+        self._readSize = self.READ_SIZE
+
+    def _sendall(self, data, timeout):
+        # Write without blocking, and only if the socket buffer is full, wait for the socket to become writable until the
+        # deadline. Returns the number of bytes which were written in time.
+        view, sent, deadline = memoryview(data), 0, None
+        while sent < len(data):
+            if _MSG_DONTWAIT:
+                try:
+                    sent += self._socket.send(view[sent:], _MSG_DONTWAIT)
+                    continue
+                except socket.error as e:
+                    if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        raise
+            if deadline is None:
+                deadline = monotonic() + timeout
+            remaining = deadline - monotonic()
+            if (remaining > 0) and _writable(self._socket, remaining):
+                if not _MSG_DONTWAIT: # the socket is writable, so it takes at least part of the data without blocking
+                    sent += self._socket.send(view[sent:])
+                continue
+            break
+        return sent
+
+class _Write(object):
+    # The data of one call to _write, and the outcome of the write which carried it to the wire.
+    __slots__ = ('data', 'done', 'error')
+
+    def __init__(self, data):
+        self.data = data
+        self.done = False
+        self.error = None
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+
+    def check(self):
+        if self.error:
+            raise self.error
+
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0) # the socket stays in blocking mode for the reading thread
+
+def _readable(sock, timeout):
+    return _ready(sock, timeout, False)
+
+def _writable(sock, timeout):
+    return _ready(sock, timeout, True)
+
+def _ready(sock, timeout, write):
+    # poll() is not limited to file descriptors below FD_SETSIZE (1024) like select()
+    if not hasattr(select, 'poll'):
+        readable, writable, _ = select.select([] if write else [sock], [sock] if write else [], [], timeout)
+        return bool(writable if write else readable)
+    poller = select.poll()
+    poller.register(sock, select.POLLOUT if write else select.POLLIN)
+    return bool(poller.poll(None if (timeout is None) else int(math.ceil(1000 * timeout))))
@@ -0,0 +1,106 @@
+import unittest
+
+from stompest.protocol import StompAckBatcher, StompFrame, StompSpec
+
+class StompAckBatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.token = (StompSpec.ID_HEADER, '0')
+        self.frames = [StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(i), StompSpec.SUBSCRIPTION_HEADER: '0'}) for i in xrange(5)]
+
+    def _batcher(self, size=None, delay=None):
+        return StompAckBatcher(size, delay, clock=lambda: self.now)
+
+    def _ids(self, frames):
+        return [frame.headers[StompSpec.MESSAGE_ID_HEADER] for frame in frames]
+
+    def test_cumulative(self):
+        batcher = self._batcher(size=3)
+        for frame in self.frames:
+            batcher.delivered(self.token, frame, StompSpec.ACK_CLIENT)
+        self.assertFalse(batcher.completed(self.token, self.frames[2]))
+        self.assertFalse(batcher.completed(self.token, self.frames[1]))
+        self.assertEquals(len(batcher), 0)
+        self.assertEquals(batcher.due(), [])
+        self.assertTrue(batcher.completed(self.token, self.frames[0]))
+        self.assertEquals(len(batcher), 3)
+        self.assertEquals(self._ids(batcher.due()), ['2'])
+        self.assertEquals(batcher.due(), [])
+
+        self.assertFalse(batcher.completed(self.token, self.frames[3]))
+        self.assertEquals(batcher.due(), [])
+        self.assertEquals(self._ids(batcher.flush()), ['3'])
+        self.assertEquals(batcher.flush(), [])
+
+        self.assertFalse(batcher.completed(self.token, self.frames[4]))
+        self.assertEquals(self._ids(batcher.remove(self.token)), ['4'])
+        self.assertEquals(batcher.remove(self.token), [])
+
+    def test_cumulative_without_delivery_order(self):
+        batcher = self._batcher(size=2)
+        self.assertFalse(batcher.completed(self.token, self.frames[0], StompSpec.ACK_CLIENT))
+        self.assertTrue(batcher.completed(self.token, self.frames[1], StompSpec.ACK_CLIENT))
+        self.assertEquals(self._ids(batcher.due()), ['0', '1']) # without delivery order, neither ack covers the other
+
+    def test_cumulative_keeps_pending_frames(self):
+        batcher = self._batcher(size=10)
+        for frame in self.frames[:3]:
+            batcher.delivered(self.token, frame, StompSpec.ACK_CLIENT)
+        batcher.completed(self.token, self.frames[0])
+        batcher.completed(self.token, self.frames[4]) # delivery not reported
+        batcher.completed(self.token, self.frames[1])
+        self.assertEquals(len(batcher), 3)
+        self.assertEquals(self._ids(batcher.flush()), ['1', '4'])
+
+    def test_discard(self):
+        batcher = self._batcher(size=3)
+        for frame in self.frames:
+            batcher.delivered(self.token, frame, StompSpec.ACK_CLIENT)
+        self.assertFalse(batcher.completed(self.token, self.frames[1]))
+        self.assertFalse(batcher.completed(self.token, self.frames[2]))
+        self.assertFalse(batcher.discard(self.frames[3]))
+        self.assertEquals(len(batcher), 0)
+        self.assertFalse(batcher.discard(self.frames[0])) # nacked, so it no longer holds back the messages after it
+        self.assertEquals(len(batcher), 2)
+        self.assertTrue(batcher.completed(self.token, self.frames[4]))
+        self.assertEquals(self._ids(batcher.due()), ['4'])
+
+        batcher = self._batcher(size=3)
+        batcher.completed(self.token, self.frames[0])
+        batcher.completed(self.token, self.frames[1])
+        batcher.discard(self.frames[0])
+        self.assertEquals(len(batcher), 1)
+        self.assertEquals(self._ids(batcher.flush()), ['1'])
+
+    def test_individual(self):
+        batcher = self._batcher(size=3)
+        for frame in self.frames:
+            batcher.delivered(self.token, frame, StompSpec.ACK_CLIENT_INDIVIDUAL)
+        self.assertFalse(batcher.completed(self.token, self.frames[2]))
+        self.assertFalse(batcher.completed(self.token, self.frames[0]))
+        self.assertTrue(batcher.completed(self.token, self.frames[4]))
+        self.assertEquals(self._ids(batcher.due()), ['2', '0', '4'])
+        batcher.completed(self.token, self.frames[1])
+        batcher.clear()
+        self.assertEquals(batcher.flush(), [])
+
+    def test_delay(self):
+        batcher = self._batcher(size=10, delay=1.0)
+        self.assertEquals(batcher.deadline, None)
+        batcher.completed(self.token, self.frames[0])
+        self.now = 0.5
+        batcher.completed(self.token, self.frames[1])
+        self.assertEquals(batcher.deadline, 1.0)
+        self.assertEquals(batcher.due(), [])
+        self.now = 1.0
+        self.assertEquals(self._ids(batcher.due()), ['0', '1'])
+        self.assertEquals(batcher.deadline, None)
+
+        batcher = self._batcher(size=10)
+        batcher.completed(self.token, self.frames[0])
+        self.assertEquals(batcher.deadline, None)
+        self.now = 1000
+        self.assertEquals(batcher.due(), [])
+
+if __name__ == '__main__':
+    unittest.main()
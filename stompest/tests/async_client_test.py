@@ -1,14 +1,18 @@
 import logging
 
-from twisted.internet import defer, reactor
+from mock import Mock
+
+from twisted.internet import defer, reactor, task
 from twisted.internet.protocol import Factory
 from twisted.python import log
 from twisted.trial import unittest
 
 from stompest.async import Stomp
 from stompest.config import StompConfig
-from stompest.error import StompCancelledError, StompConnectionError, StompConnectTimeout, StompProtocolError
+from stompest.async.protocol import StompProtocol
+from stompest.error import StompCancelledError, StompConnectionError, StompConnectTimeout, StompProtocolError, StompSendTimeout
 
+from stompest.protocol import StompFrame, StompSpec, StompVirtualClock
 from stompest.tests.broker_simulator import BlackHoleStompServer, ErrorOnConnectStompServer, ErrorOnSendStompServer, RemoteControlViaFrameStompServer
 
 observer = log.PythonLoggingObserver()
@@ -117,6 +121,99 @@ class AsyncClientFailoverOnDisconnectTestCase(AsyncClientBaseTestCase):
         except StompProtocolError:
             pass
 
+class AsyncClientRaceTestCase(AsyncClientBaseTestCase):
+    protocols = [BlackHoleStompServer, ErrorOnConnectStompServer, RemoteControlViaFrameStompServer]
+
+    @defer.inlineCallbacks
+    def test_race(self):
+        ports = tuple(c.getHost().port for c in self.connections)
+        config = StompConfig(uri='failover:(tcp://localhost:%d,tcp://localhost:%d,tcp://localhost:%d)?race=true,raceStagger=10,randomize=false' % ports, version='1.1')
+        client = Stomp(config)
+        yield client.connect(connectedTimeout=1)
+        self.assertEquals(client._protocol.transport.getPeer().port, ports[2])
+        self.assertEquals(client.session.version, '1.1')
+        client.disconnect()
+        yield client.disconnected
+
+    @defer.inlineCallbacks
+    def test_race_lost(self):
+        ports = tuple(c.getHost().port for c in self.connections[:2])
+        config = StompConfig(uri='failover:(tcp://localhost:%d,tcp://localhost:%d)?race=true,raceStagger=10,randomize=false' % ports)
+        client = Stomp(config)
+        try:
+            yield client.connect(connectedTimeout=0.1)
+        except StompConnectTimeout:
+            pass
+        else:
+            raise
+
+class AsyncClientBackupTestCase(AsyncClientBaseTestCase):
+    protocols = [RemoteControlViaFrameStompServer, RemoteControlViaFrameStompServer]
+
+    @defer.inlineCallbacks
+    def _waitForBackup(self, client):
+        while client._backup is None:
+            yield task.deferLater(reactor, 0.01, lambda: None)
+        defer.returnValue(client._backup[0].broker['port'])
+
+    @defer.inlineCallbacks
+    def test_promote_backup(self):
+        ports = tuple(c.getHost().port for c in self.connections)
+        config = StompConfig(uri='failover:(tcp://localhost:%d,tcp://localhost:%d)?backup=true,randomize=false' % ports, version='1.1')
+        client = Stomp(config)
+        messages = []
+        yield client.connect()
+        self.assertEquals((yield self._waitForBackup(client)), ports[1])
+        client.subscribe('/queue/bla', lambda client, frame: messages.append(frame), headers={StompSpec.ID_HEADER: '4711'}, ack=False)
+        while not messages:
+            yield task.deferLater(reactor, 0.01, lambda: None)
+
+        disconnected = client.disconnected
+        client.send('/queue/fake', 'shutdown') # the primary connection is lost
+        while len(messages) < 2: # the subscription was replayed on the backup connection
+            yield task.deferLater(reactor, 0.01, lambda: None)
+        self.assertFalse(disconnected.called)
+        self.assertEquals(client._protocol.broker['port'], ports[1])
+        self.assertEquals(client.session.state, client.session.CONNECTED)
+        self.assertEquals((yield self._waitForBackup(client)), ports[0]) # a new backup connection
+
+        client.disconnect()
+        yield disconnected
+        self.assertEquals(client._backup, None)
+        yield task.deferLater(reactor, 0.05, lambda: None) # let the broker notice that the backup connection was closed
+
+class AsyncClientMigrateTestCase(AsyncClientBaseTestCase):
+    @defer.inlineCallbacks
+    def test_migrate_to_preferred_broker(self):
+        factory = Factory()
+        factory.protocol = RemoteControlViaFrameStompServer
+        remote = reactor.listenTCP(0, factory, interface='127.0.0.2') #@UndefinedVariable
+        self.connections.append(remote)
+        local = reactor.listenTCP(0, factory) #@UndefinedVariable
+        port = local.getHost().port
+        yield local.stopListening() # the local broker is down
+
+        uri = 'failover:(tcp://127.0.0.2:%d,tcp://localhost:%d)?priorityBackup=true,priorityProbeInterval=20,priorityDwellTime=100,startupMaxReconnectAttempts=1' % (remote.getHost().port, port)
+        client = Stomp(StompConfig(uri=uri, version='1.1'))
+        messages = []
+        yield client.connect()
+        self.assertEquals(client._protocol.broker['host'], '127.0.0.2')
+        client.subscribe('/queue/bla', lambda client, frame: messages.append(frame), headers={StompSpec.ID_HEADER: '4711'}, ack=False)
+        disconnected = client.disconnected
+
+        started = reactor.seconds()
+        self.connections.append(reactor.listenTCP(port, factory)) #@UndefinedVariable
+        while len(messages) < 2: # the subscription was replayed on the new connection
+            yield task.deferLater(reactor, 0.01, lambda: None)
+        self.assertTrue(reactor.seconds() - started >= 0.1)
+        self.assertEquals(client._protocol.broker['host'], 'localhost')
+        self.assertFalse(disconnected.called)
+        self.assertEquals(client._probeTimer, None) # there is no broker with a higher priority
+
+        client.disconnect()
+        yield disconnected
+        yield task.deferLater(reactor, 0.05, lambda: None)
+
 class AsyncClientReplaySubscriptionTestCase(AsyncClientBaseTestCase):
     protocols = [RemoteControlViaFrameStompServer]
 
@@ -214,6 +311,116 @@ class AsyncClientDisconnectTimeoutTestCase(AsyncClientBaseTestCase):
         self._got_message.callback(None)
         yield self.wait
 
+class AsyncClientMaxReceiptsTestCase(AsyncClientBaseTestCase):
+    protocols = [RemoteControlViaFrameStompServer] # this broker does not send receipts
+
+    @defer.inlineCallbacks
+    def test_dropped_receipt_errs_back(self):
+        port = self.connections[0].getHost().port
+        config = StompConfig(uri='tcp://localhost:%d' % port, version='1.1')
+        client = Stomp(config, maxReceipts=1)
+        yield client.connect()
+        first = client.send('/queue/bla', 'hi', receipt='1')
+        second = client.send('/queue/bla', 'hi', receipt='2')
+        try:
+            yield first
+        except StompCancelledError:
+            pass
+        else:
+            raise
+        self.assertFalse(second.called)
+        second.addErrback(lambda _: None) # disconnecting cancels the wait for the second receipt
+        client.disconnect()
+        yield client.disconnected
+
+class AckCountingStompServer(RemoteControlViaFrameStompServer):
+    def connectionMade(self):
+        RemoteControlViaFrameStompServer.connectionMade(self)
+        self.acks = []
+        self.factory.servers.append(self)
+
+    def handleAck(self, frame):
+        self.acks.append(frame)
+
+class AsyncClientAckWindowTestCase(AsyncClientBaseTestCase):
+    protocols = [AckCountingStompServer]
+
+    def setUp(self):
+        AsyncClientBaseTestCase.setUp(self)
+        self.servers = self.connections[0].factory.servers = []
+
+    @defer.inlineCallbacks
+    def test_ack_window_delay(self):
+        port = self.connections[0].getHost().port
+        config = StompConfig(uri='tcp://localhost:%d' % port, version='1.1')
+        client = Stomp(config, ackWindow={'size': 10, 'delay': 0.01})
+        yield client.connect()
+        self._got_message = defer.Deferred()
+        client.subscribe('/queue/bla', self._on_message, headers={StompSpec.ID_HEADER: 4711, StompSpec.ACK_HEADER: StompSpec.ACK_CLIENT})
+        yield self._got_message
+        acks = self.servers[0].acks
+        self.assertEquals(acks, [])
+        yield task.deferLater(reactor, 0.05, lambda: None)
+        self.assertEquals(len(acks), 1)
+        self.assertEquals(acks[0].headers[StompSpec.MESSAGE_ID_HEADER], '4711')
+        yield client.disconnect()
+
+    def _on_message(self, client, msg):
+        reactor.callLater(0, self._got_message.callback, None) #@UndefinedVariable
+
+class AsyncClientHeartBeatClockTestCase(unittest.TestCase):
+    def test_beat_remaining(self):
+        clock = StompVirtualClock(100.0)
+        client = Stomp(StompConfig('tcp://localhost:61613'), heartBeatThresholds={'client': 0.5, 'server': 2.0}, clock=clock)
+        session = client.session
+        session._clientHeartBeat, session._serverHeartBeat = 1000, 1000
+        session.sent()
+        session.received()
+        self.assertEquals(client._beatRemaining('client'), 0.5)
+        self.assertEquals(client._beatRemaining('server'), 2.0)
+        clock.advance(0.75)
+        self.assertEquals(client._beatRemaining('client'), 0)
+        self.assertEquals(client._beatRemaining('server'), 1.25)
+        session._serverHeartBeat = 0
+        self.assertEquals(client._beatRemaining('server'), -1)
+
+class AsyncClientThrottleTestCase(unittest.TestCase):
+    def test_throttle(self):
+        client = Stomp(StompConfig('tcp://localhost:61613'), maxUnacked=1)
+        client._protocol = Mock()
+        transport = client._protocol.transport
+        frame = StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: '4711'})
+        client.session.unacked.add((StompSpec.DESTINATION_HEADER, '/queue/test'), frame)
+        client._throttle()
+        client._throttle()
+        self.assertEquals(transport.pauseProducing.call_count, 1)
+        client.session.unacked.remove('4711')
+        client._throttle()
+        self.assertEquals(transport.resumeProducing.call_count, 1)
+
+class AsyncProtocolSendTimeoutTestCase(unittest.TestCase):
+    @defer.inlineCallbacks
+    def test_drained(self):
+        protocol = StompProtocol('1.0', Mock(), Mock(), sendTimeout=0.05)
+        protocol.makeConnection(Mock())
+        protocol.transport.registerProducer.assert_called_once_with(protocol, True)
+        yield protocol.drained()
+
+        protocol.pauseProducing() # the write buffer is full
+        drained = protocol.drained()
+        self.assertFalse(drained.called)
+        protocol.resumeProducing()
+        self.assertTrue(drained.called)
+
+        protocol.pauseProducing()
+        try:
+            yield protocol.drained()
+        except StompSendTimeout:
+            pass
+        else:
+            raise
+        self.assertFalse(protocol.transport.loseConnection.called)
+
 if __name__ == '__main__':
     import sys
     from twisted.scripts import trial
@@ -1,11 +1,15 @@
 import logging
 
+import socket
+
 from twisted.internet import defer, reactor, task
 from twisted.internet.defer import CancelledError
+from twisted.internet.protocol import Factory, Protocol
 from twisted.trial import unittest
 
-from stompest.async.util import exclusive, InFlightOperations, wait
+from stompest.async.util import endpointFactory, exclusive, InFlightOperations, wait
 from stompest.error import StompAlreadyRunningError, StompCancelledError
+from stompest.protocol import StompFailoverUri, StompSocketOptions
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -158,6 +162,20 @@ class InFlightOperationsTest(unittest.TestCase):
             self.assertEquals(list(op), [None])
         self.assertEquals(list(op), [])
 
+class EndpointFactoryTest(unittest.TestCase):
+    @defer.inlineCallbacks
+    def test_socket_options(self):
+        port = reactor.listenTCP(0, Factory.forProtocol(Protocol), interface='127.0.0.1') #@UndefinedVariable
+        self.addCleanup(port.stopListening)
+        broker = {'protocol': 'tcp', 'host': '127.0.0.1', 'port': port.getHost().port}
+        options = StompSocketOptions(StompFailoverUri('tcp://localhost:61613?tcpNoDelay=true,keepAlive=true,localAddress=127.0.0.1').options)
+
+        protocol = yield endpointFactory(broker, 1, options).connect(Factory.forProtocol(Protocol))
+        handle = protocol.transport.getHandle()
+        self.assertTrue(handle.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.assertTrue(handle.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+        protocol.transport.loseConnection()
+
 if __name__ == '__main__':
     import sys
     from twisted.scripts import trial
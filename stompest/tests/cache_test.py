@@ -0,0 +1,70 @@
+import unittest
+
+from stompest.protocol import StompFrame, StompMessageCache, StompSession, StompSpec
+
+class StompMessageCacheTest(unittest.TestCase):
+    def _send(self, body, **headers):
+        headers[StompSpec.DESTINATION_HEADER] = '/queue/test'
+        return StompFrame(StompSpec.SEND, headers, body)
+
+    def test_eviction(self):
+        cache = StompMessageCache(maxSize=5)
+        frames = [self._send('x' * i) for i in xrange(4)]
+        for frame in frames[:3]:
+            self.assertEquals(cache.add(frame), [])
+        self.assertEquals(cache.add(frames[3]), frames[:2])
+        self.assertEquals(cache.statistics(), {'count': 2, 'bytes': 5, 'evicted': 2, 'evictedBytes': 1})
+        self.assertEquals(cache.add(self._send('x' * 6)), frames[2:] + [self._send('x' * 6)]) # too large for the cache
+        self.assertEquals(cache.statistics(), {'count': 0, 'bytes': 0, 'evicted': 5, 'evictedBytes': 12})
+        cache.clear()
+        self.assertEquals(cache.statistics()['evicted'], 5)
+
+    def test_confirm(self):
+        cache = StompMessageCache()
+        cache.add(self._send('1'))
+        cache.mark('a')
+        cache.add(self._send('2', transaction='t'))
+        cache.add(self._send('3'))
+        cache.mark('b')
+        cache.add(self._send('4'))
+        cache.confirm('b')
+        self.assertEquals(len(cache), 2) # the transaction is still pending
+        cache.commit('t')
+        self.assertEquals(len(cache), 1)
+        cache.mark('c')
+        self.assertEquals([f.body for f in cache.replay()], ['4'])
+        cache.confirm('c') # marks do not survive a replay
+        cache.confirm('unknown')
+        self.assertEquals(len(cache), 1)
+
+    def test_replay(self):
+        cache = StompMessageCache()
+        cache.add(self._send('1', receipt='r'))
+        cache.add(self._send('2', transaction='t'))
+        cache.add(self._send('3'))
+        cache.abort('t')
+        self.assertEquals(cache.replay(), [self._send('1'), self._send('3')])
+        self.assertEquals(cache.replay(), [self._send('1'), self._send('3')])
+        self.assertEquals(cache.bytes, 2)
+
+    def test_session(self):
+        session = StompSession(StompSpec.VERSION_1_1, cache=StompMessageCache())
+        session.connect()
+        session.connected(StompFrame(StompSpec.CONNECTED, {StompSpec.VERSION_HEADER: StompSpec.VERSION_1_1}))
+        session.send('/queue/test', 'a')
+        session.send('/queue/test', 'b', receipt='4711')
+        session.send('/queue/test', 'c')
+        transaction = session.transaction()
+        session.begin(transaction)
+        session.send('/queue/test', 'd', {StompSpec.TRANSACTION_HEADER: transaction})
+        session.receipt(StompFrame(StompSpec.RECEIPT, {StompSpec.RECEIPT_ID_HEADER: '4711'}))
+        self.assertEquals(len(session.cache), 2)
+
+        session.close(flush=False)
+        self.assertEquals([f.body for f in session.resend()], ['c'])
+        session.close(flush=True)
+        self.assertEquals(session.resend(), [])
+        self.assertEquals(StompSession().resend(), [])
+
+if __name__ == '__main__':
+    unittest.main()
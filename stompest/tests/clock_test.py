@@ -0,0 +1,53 @@
+import unittest
+
+from mock import patch
+
+from stompest.protocol import StompCoarseClock, StompSession, StompVirtualClock
+from stompest.protocol.clock import monotonic
+
+class StompClockTest(unittest.TestCase):
+    def test_monotonic(self):
+        times = [monotonic() for _ in xrange(100)]
+        self.assertEquals(times, sorted(times))
+
+    def test_coarse(self):
+        source = StompVirtualClock(1.0)
+        clock = StompCoarseClock(source)
+        source.advance(1.0)
+        self.assertEquals(clock(), 1.0)
+        self.assertEquals(clock.tick(), 2.0)
+        self.assertEquals(clock(), 2.0)
+
+    def test_coarse_resolution(self):
+        source = StompVirtualClock(1.0)
+        with patch('time.time') as wall:
+            wall.return_value = 100.0
+            clock = StompCoarseClock(source, resolution=0.01)
+            source.advance(1.0)
+            wall.return_value = 100.005
+            self.assertEquals(clock.tick(), 1.0) # not queried within the resolution
+            wall.return_value = 100.01
+            self.assertEquals(clock.tick(), 2.0)
+            source.advance(1.0)
+            wall.return_value = 50.0 # the system time was set back
+            self.assertEquals(clock.tick(), 3.0)
+
+    def test_virtual(self):
+        clock = StompVirtualClock()
+        self.assertEquals(clock(), 0.0)
+        clock.advance(1.5)
+        self.assertEquals(clock.tick(), 1.5)
+        self.assertRaises(ValueError, clock.advance, -1)
+
+    def test_session(self):
+        clock = StompVirtualClock(10.0)
+        session = StompSession(clock=clock)
+        self.assertTrue(session.clock is clock)
+        session.sent()
+        clock.advance(1.0)
+        session.received()
+        self.assertEquals((session.lastSent, session.lastReceived), (10.0, 11.0))
+        self.assertTrue(StompSession().clock is monotonic)
+
+if __name__ == '__main__':
+    unittest.main()
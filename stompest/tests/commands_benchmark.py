@@ -0,0 +1,47 @@
+"""Throughput of the per-message hot path of the commands API (handling of a **MESSAGE** frame and creation of the corresponding **ACK** frame).
+
+Run it with ``python -m stompest.tests.commands_benchmark``.
+"""
+import timeit
+
+from stompest.protocol import StompFrame, StompSession, StompSpec, commands
+
+N = 100000
+
+FRAME = StompFrame(StompSpec.MESSAGE, {
+    StompSpec.MESSAGE_ID_HEADER: 'ID:earth-4711-1234567890-1:1:1:1:1',
+    StompSpec.SUBSCRIPTION_HEADER: '0',
+    StompSpec.DESTINATION_HEADER: '/queue/test',
+    StompSpec.TRANSACTION_HEADER: 'tx'
+}, 'hello')
+TRANSACTIONS = set(['tx'])
+
+def _session():
+    session = StompSession(StompSpec.VERSION_1_1)
+    session.connect()
+    session.connected(StompFrame(StompSpec.CONNECTED, {StompSpec.VERSION_HEADER: StompSpec.VERSION_1_1}))
+    session.subscribe('/queue/test', {StompSpec.ID_HEADER: '0'})
+    return session
+
+def benchmarks():
+    compiled = commands.compiled(StompSpec.VERSION_1_1)
+    trusted = commands.compiled(StompSpec.VERSION_1_1, trusted=True)
+    session = _session()
+    return [
+        ('commands.message', lambda: commands.message(FRAME, StompSpec.VERSION_1_1)),
+        ('compiled.message', lambda: compiled.message(FRAME)),
+        ('trusted.message', lambda: trusted.message(FRAME)),
+        ('commands.ack', lambda: commands.ack(FRAME, TRANSACTIONS, None, StompSpec.VERSION_1_1)),
+        ('compiled.ack', lambda: compiled.ack(FRAME, TRANSACTIONS)),
+        ('trusted.ack', lambda: trusted.ack(FRAME, TRANSACTIONS)),
+        ('session.message + ack', lambda: session.ack(FRAME) and session.message(FRAME)),
+        ('session.message + trusted ack', lambda: session.ack(FRAME, trusted=True) and session.message(FRAME)),
+    ]
+
+def main(n=N):
+    for (name, f) in benchmarks():
+        elapsed = min(timeit.repeat(f, number=n, repeat=3))
+        print '%-32s %10.0f ops/s' % (name, n / elapsed)
+
+if __name__ == '__main__':
+    main()
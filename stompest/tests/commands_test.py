@@ -95,5 +95,48 @@ class CommandsTest(unittest.TestCase):
         self.assertRaises(StompProtocolError, commands.nack, StompFrame(StompSpec.MESSAGE, {StompSpec.SUBSCRIPTION_HEADER: 'hi'}), version='1.1')
         self.assertRaises(StompProtocolError, commands.nack, StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: 'hi'}), version='1.1')
 
+    def test_compiled(self):
+        self.assertRaises(StompProtocolError, commands.compiled, '1.2')
+        self.assertTrue(commands.compiled('1.1') is commands.compiled('1.1'))
+        self.assertEquals(commands.compiled().version, StompSpec.DEFAULT_VERSION)
+
+        frame = StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: 'hi', StompSpec.SUBSCRIPTION_HEADER: 'there', StompSpec.DESTINATION_HEADER: '/queue/bla', StompSpec.TRANSACTION_HEADER: 'man'})
+        for version in StompSpec.VERSIONS:
+            for trusted in (False, True):
+                compiled = commands.compiled(version, trusted)
+                self.assertEquals(compiled.message(frame), commands.message(frame, version))
+                self.assertEquals(compiled.ack(frame, ['man'], '4711'), commands.ack(frame, ['man'], '4711', version))
+        self.assertEquals(commands.compiled('1.1', trusted=True).nack(frame), commands.nack(frame, version='1.1'))
+        self.assertRaises(StompProtocolError, commands.compiled('1.0', trusted=True).nack, frame)
+
+        receipt = StompFrame(StompSpec.RECEIPT, {StompSpec.RECEIPT_ID_HEADER: '4711'})
+        self.assertEquals(commands.compiled('1.1', trusted=True).receipt(receipt), '4711')
+        self.assertEquals(commands.receipt(receipt, '1.1'), '4711')
+        self.assertRaises(StompProtocolError, commands.receipt, StompFrame(StompSpec.RECEIPT, {}), '1.1')
+
+    def test_compiled_trusted_skips_checks(self):
+        frame = StompFrame(StompSpec.CONNECTED, {StompSpec.MESSAGE_ID_HEADER: 'hi', StompSpec.SUBSCRIPTION_HEADER: 'there', StompSpec.DESTINATION_HEADER: '/queue/bla'})
+        self.assertRaises(StompProtocolError, commands.compiled('1.1').ack, frame)
+        self.assertRaises(StompProtocolError, commands.compiled('1.1').message, frame)
+        self.assertEquals(commands.compiled('1.1', trusted=True).ack(frame), StompFrame(command='ACK', headers={'message-id': 'hi', 'subscription': 'there'}))
+        self.assertEquals(commands.compiled('1.1', trusted=True).message(frame), (StompSpec.ID_HEADER, 'there'))
+
+        frame = StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: 'hi', StompSpec.DESTINATION_HEADER: '/queue/bla'})
+        self.assertRaises(StompProtocolError, commands.compiled('1.1').message, frame)
+        self.assertEquals(commands.compiled('1.1', trusted=True).message(frame), (StompSpec.DESTINATION_HEADER, '/queue/bla'))
+
+    def test_message(self):
+        frame = StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: 'hi', StompSpec.DESTINATION_HEADER: '/queue/bla'})
+        self.assertEquals(commands.message(frame, '1.0'), (StompSpec.DESTINATION_HEADER, '/queue/bla'))
+        self.assertRaises(StompProtocolError, commands.message, frame, '1.1')
+        frame.headers[StompSpec.SUBSCRIPTION_HEADER] = '0815'
+        self.assertEquals(commands.message(frame, '1.0'), (StompSpec.ID_HEADER, '0815'))
+        self.assertEquals(commands.message(frame, '1.1'), (StompSpec.ID_HEADER, '0815'))
+        for header in (StompSpec.MESSAGE_ID_HEADER, StompSpec.DESTINATION_HEADER):
+            headers = dict(frame.headers)
+            headers.pop(header)
+            self.assertRaises(StompProtocolError, commands.message, StompFrame(StompSpec.MESSAGE, headers), '1.0')
+        self.assertRaises(StompProtocolError, commands.message, StompFrame(StompSpec.RECEIPT, frame.headers), '1.0')
+
 if __name__ == '__main__':
     unittest.main()
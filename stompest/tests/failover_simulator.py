@@ -0,0 +1,186 @@
+"""A deterministic simulation of the reconnect behavior of the :class:`~.StompFailoverTransport`. A number of simulated clients connect to the brokers of a failover URI while the brokers go down and come back up according to a scripted timeline. All clients share a :class:`~.StompVirtualClock`, and the random choices of the failover transport (options *randomize*, *reconnectDelayJitter* and the strategy **weighted**) are seeded, so a simulation is reproducible and runs much faster than real time.
+
+A client which loses its connection (because its broker goes down) iterates over a fresh failover transport iteration until a connect attempt hits a broker which is up. The result of a simulation reports the time it took to reconnect, the number of connect attempts per reconnect, and the thundering herd, that is, the peak number of clients which reconnect to a broker within a short window (typically right after it has come back, or right after another broker has gone down).
+
+Example:
+
+>>> from stompest.tests.failover_simulator import StompFailoverSimulation, summary
+>>> timeline = [(1.0, 'tcp://remote1:61613', False), (4.0, 'tcp://remote1:61613', True)]
+>>> simulation = StompFailoverSimulation('failover:(tcp://remote1:61613)?initialReconnectDelay=100,useExponentialBackOff=false', timeline, clients=10)
+>>> result = simulation.run()
+>>> summary(result['reconnects'])['max'] < 3.2
+True
+>>> result['herd']['tcp://remote1:61613']
+10
+
+Run some scenarios with ``python -m stompest.tests.failover_simulator``.
+"""
+import heapq
+import itertools
+import random
+
+from stompest.error import StompConnectTimeout
+from stompest.protocol import StompFailoverTransport, StompFailoverUri, StompVirtualClock
+
+class StompFailoverSimulation(object):
+    """A scripted failover scenario.
+
+    :param uri: The failover URI of all clients.
+    :param timeline: A list of events (time in s, broker URI, up) which take the broker with this URI (e.g., **tcp://remote1:61613**) down or bring it back up. Initially, all brokers are up.
+    :param clients: The number of simulated clients. They all connect at time 0.
+    :param connectLatency: The time (in s) a successful connect attempt takes.
+    :param failLatency: The time (in s) a failed connect attempt takes (a refused connection fails fast, a connect timeout takes much longer).
+    :param duration: The time (in s) after which the simulation ends.
+    :param window: The width (in s) of the window in which the thundering herd is measured.
+    :param seed: The seed of the random generator.
+    """
+    def __init__(self, uri, timeline=(), clients=1, connectLatency=0.001, failLatency=0.001, duration=60.0, window=0.01, seed=0):
+        self.uri = uri
+        self.timeline = sorted(timeline)
+        self.clients = clients
+        self.connectLatency = connectLatency
+        self.failLatency = failLatency
+        self.duration = duration
+        self.window = window
+        self.seed = seed
+
+    def run(self):
+        """Run the simulation. Returns a :obj:`dict` with the times (in s) it took to reconnect after a connection loss (**reconnects**, sorted), the connect attempts of each reconnect (**attempts**), the number of reconnects which were given up on because the failover transport did not allow further attempts (**gaveUp**), the peak number of clients per broker which reconnected to it within one **window** (**herd**), and the number of clients which are connected to each broker at the end (**connected**)."""
+        state = random.getstate()
+        random.seed(self.seed)
+        try:
+            return _Simulator(self).run()
+        finally:
+            random.setstate(state)
+
+class _Simulator(object):
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.clock = StompVirtualClock()
+        self.up = dict((_uri(broker), True) for broker in StompFailoverUri(simulation.uri).brokers)
+        self.events = []
+        self.counter = itertools.count()
+        self.hits = dict((broker, []) for broker in self.up)
+        self.connections = dict((broker, []) for broker in self.up)
+        self.reconnects, self.attempts, self.gaveUp = [], [], 0
+
+    def run(self):
+        simulation = self.simulation
+        for (time, broker, up) in simulation.timeline:
+            self.schedule(time, self.toggle, broker, up)
+        clients = [_Client(StompFailoverTransport(simulation.uri, self.clock)) for _ in xrange(simulation.clients)]
+        for client in clients:
+            self.schedule(0, self.connect, client, None)
+        while self.events:
+            time, _, action, args = heapq.heappop(self.events)
+            if time > simulation.duration:
+                break
+            self.clock.advance(time - self.clock())
+            action(*args)
+        connected = dict((broker, len(clients)) for (broker, clients) in self.connections.iteritems())
+        return {
+            'reconnects': sorted(self.reconnects),
+            'attempts': self.attempts,
+            'gaveUp': self.gaveUp,
+            'herd': dict((broker, _peak(times, simulation.window)) for (broker, times) in self.hits.iteritems()),
+            'connected': connected
+        }
+
+    def schedule(self, time, action, *args):
+        heapq.heappush(self.events, (time, next(self.counter), action, args))
+
+    def toggle(self, broker, up):
+        self.up[broker] = up
+        if up:
+            return
+        clients, self.connections[broker] = self.connections[broker], []
+        for client in clients:
+            self.connect(client, self.clock())
+
+    def connect(self, client, lost):
+        client.lost = lost # None for the initial connect
+        client.attempts = 0
+        client.iteration = iter(client.failover)
+        self.next(client)
+
+    def next(self, client):
+        try:
+            broker, delay = next(client.iteration)
+        except StompConnectTimeout:
+            if client.lost is not None:
+                self.attempts.append(client.attempts)
+            self.gaveUp += 1
+            return
+        self.schedule(self.clock() + delay, self.attempt, client, broker)
+
+    def attempt(self, client, broker):
+        client.attempts += 1
+        now = self.clock()
+        if not self.up[_uri(broker)]:
+            self.schedule(now + self.simulation.failLatency, self.failed, client, broker)
+            return
+        latency = self.simulation.connectLatency
+        client.failover.connected(broker, latency)
+        client.failover.established(broker, 0)
+        self.connections[_uri(broker)].append(client)
+        if client.lost is not None:
+            self.hits[_uri(broker)].append(now)
+            self.reconnects.append(now + latency - client.lost)
+            self.attempts.append(client.attempts)
+
+    def failed(self, client, broker):
+        client.failover.failed(broker)
+        self.next(client)
+
+class _Client(object):
+    __slots__ = ('failover', 'iteration', 'lost', 'attempts')
+
+    def __init__(self, failover):
+        self.failover = failover
+        self.iteration = self.lost = None
+        self.attempts = 0
+
+def _uri(broker):
+    return '%(protocol)s://%(host)s:%(port)d' % broker
+
+def _peak(times, window):
+    # the maximum number of times within any window [t, t + window)
+    peak, start = 0, 0
+    for (end, time) in enumerate(times):
+        while time - times[start] >= window:
+            start += 1
+        peak = max(peak, end - start + 1)
+    return peak
+
+def summary(values):
+    """Returns a :obj:`dict` with the **count**, **mean**, **min**, **median**, **p90**, **p99** and **max** of a list of numbers."""
+    values = sorted(values)
+    if not values:
+        return {'count': 0, 'mean': None, 'min': None, 'median': None, 'p90': None, 'p99': None, 'max': None}
+    quantile = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {
+        'count': len(values),
+        'mean': sum(values) / float(len(values)),
+        'min': values[0],
+        'median': quantile(0.5),
+        'p90': quantile(0.9),
+        'p99': quantile(0.99),
+        'max': values[-1]
+    }
+
+SCENARIOS = [
+    ('one broker restarts, no jitter', 'failover:(tcp://remote1:61613)?maxReconnectDelay=5000', [(1.0, 'tcp://remote1:61613', False), (11.0, 'tcp://remote1:61613', True)]),
+    ('one broker restarts, 1 s jitter', 'failover:(tcp://remote1:61613)?maxReconnectDelay=5000,reconnectDelayJitter=1000', [(1.0, 'tcp://remote1:61613', False), (11.0, 'tcp://remote1:61613', True)]),
+    ('failover to second broker', 'failover:(tcp://remote1:61613,tcp://remote2:61613)?randomize=false', [(1.0, 'tcp://remote1:61613', False)]),
+    ('failover to second broker, randomized', 'failover:(tcp://remote1:61613,tcp://remote2:61613)', [(1.0, 'tcp://remote1:61613', False)]),
+]
+
+def main(clients=1000):
+    print '%-40s %8s %8s %8s %8s %8s %8s' % ('scenario', 'median', 'p99', 'max', 'attempts', 'gave up', 'herd')
+    for (name, uri, timeline) in SCENARIOS:
+        result = StompFailoverSimulation(uri, timeline, clients).run()
+        reconnects = summary(result['reconnects'])
+        print '%-40s %7.3fs %7.3fs %7.3fs %8.1f %8d %8d' % (name, reconnects['median'], reconnects['p99'], reconnects['max'], summary(result['attempts'])['mean'], result['gaveUp'], max(result['herd'].itervalues()))
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,19 @@
 import itertools
+import os
+import tempfile
 import unittest
 
 from stompest.error import StompConnectTimeout
+from stompest.protocol.clock import StompVirtualClock
 from stompest.protocol.failover import StompFailoverUri, StompFailoverTransport
+from stompest.tests.failover_simulator import StompFailoverSimulation
 
 class StompFailoverUriTest(unittest.TestCase):
     def test_configuration(self):
         uri = 'tcp://localhost:61613'
         configuration = StompFailoverUri(uri)
         self.assertEquals(configuration.brokers, [{'host': 'localhost', 'protocol': 'tcp', 'port': 61613}])
-        self.assertEquals(configuration.options, {'priorityBackup': False, 'initialReconnectDelay': 10, 'reconnectDelayJitter': 0, 'maxReconnectDelay': 30000, 'backOffMultiplier': 2.0, 'startupMaxReconnectAttempts': 0, 'maxReconnectAttempts':-1, 'useExponentialBackOff': True, 'randomize': True})
+        self.assertEquals(configuration.options, {'priorityBackup': False, 'initialReconnectDelay': 10, 'reconnectDelayJitter': 0, 'maxReconnectDelay': 30000, 'backOffMultiplier': 2.0, 'startupMaxReconnectAttempts': 0, 'maxReconnectAttempts':-1, 'useExponentialBackOff': True, 'randomize': True, 'race': False, 'raceStagger': 100, 'strategy': 'default', 'circuitBreakerCooldown': 0, 'circuitBreakerThreshold': 1, 'backup': False, 'trackMessages': False, 'maxCacheSize': 131072, 'timeout': -1, 'updateURIsSupported': True, 'updateURIsURL': None, 'priorityProbeInterval': 30000, 'priorityDwellTime': 60000, 'receiveBufferSize': -1, 'sendBufferSize': -1, 'tcpNoDelay': False, 'keepAlive': False, 'keepAliveIdle': -1, 'keepAliveInterval': -1, 'keepAliveCount': -1, 'localAddress': None})
 
         uri = 'tcp://123.456.789.0:61616?randomize=true,maxReconnectAttempts=-1,priorityBackup=true'
         configuration = StompFailoverUri(uri)
@@ -93,6 +97,17 @@ class StompFailoverTest(unittest.TestCase):
             (0.04, {'host': 'remote2', 'protocol': 'tcp', 'port': 61616})
         ])
 
+    def test_preferred(self):
+        uri = 'failover:tcp://remote1:61616,tcp://localhost:61616,tcp://127.0.0.1:61615?priorityBackup=true,randomize=false'
+        protocol = StompFailoverTransport(uri)
+        remote1 = {'host': 'remote1', 'protocol': 'tcp', 'port': 61616}
+        localhost = {'host': 'localhost', 'protocol': 'tcp', 'port': 61616}
+        loopback = {'host': '127.0.0.1', 'protocol': 'tcp', 'port': 61615}
+        self.assertEquals(protocol.preferred(remote1), [localhost, loopback])
+        self.assertEquals(protocol.preferred(localhost), [])
+        protocol = StompFailoverTransport(uri.replace('priorityBackup=true', 'priorityBackup=false'))
+        self.assertEquals(protocol.preferred(remote1), [])
+
     def test_randomize(self):
         uri = 'failover:tcp://remote1:61616,tcp://localhost:61616,tcp://127.0.0.1:61615,tcp://remote2:61616?priorityBackup=true,randomize=true,startupMaxReconnectAttempts=3'
         protocol = StompFailoverTransport(uri)
@@ -119,6 +134,111 @@ class StompFailoverTest(unittest.TestCase):
             if (j > 10) and (abs(delay - 0.01) > 0.003):
                 break
 
+    def test_rounds(self):
+        uri = 'failover:(tcp://remote1:61615,tcp://localhost:61616)?randomize=false,startupMaxReconnectAttempts=1,initialReconnectDelay=7,race=true'
+        protocol = StompFailoverTransport(uri)
+        brokers = [{'host': 'remote1', 'protocol': 'tcp', 'port': 61615}, {'host': 'localhost', 'protocol': 'tcp', 'port': 61616}]
+        self._test_failover(protocol.rounds(), [(0, brokers), (0.007, brokers)])
+
+    def test_health(self):
+        clock = StompVirtualClock()
+        uri = 'failover:tcp://remote1:61616,tcp://remote2:61616,tcp://remote3:61616?randomize=false,strategy=%s,circuitBreakerCooldown=1000,circuitBreakerThreshold=2'
+        remote1, remote2, remote3 = ({'host': host, 'protocol': 'tcp', 'port': 61616} for host in ('remote1', 'remote2', 'remote3'))
+        hosts = lambda protocol: [broker['host'] for broker in next(protocol.rounds())[0]]
+
+        protocol = StompFailoverTransport(uri % 'latency', clock)
+        protocol.connected(remote1, 0.3)
+        protocol.established(remote1, 0.1)
+        protocol.connected(remote3, 0.2)
+        self.assertEquals(hosts(protocol), ['remote2', 'remote3', 'remote1'])
+        protocol.connected(remote3, 0.4)
+        self.assertAlmostEquals(protocol.statistics(remote3)['connectLatency'], 0.26)
+        self.assertEquals(hosts(protocol), ['remote2', 'remote3', 'remote1'])
+        protocol.connected(remote2, 1.0)
+        self.assertEquals(hosts(protocol), ['remote3', 'remote1', 'remote2'])
+
+        protocol = StompFailoverTransport(uri % 'failures', clock)
+        protocol.failed(remote1)
+        clock.advance(0.5)
+        protocol.failed(remote2)
+        self.assertEquals(hosts(protocol), ['remote3', 'remote1', 'remote2'])
+        self.assertEquals(protocol.statistics(remote1), {'connectLatency': None, 'handshakeLatency': None, 'failures': 1, 'sinceFailure': 0.5})
+
+        protocol.failed(remote1)
+        self.assertEquals(hosts(protocol), ['remote3', 'remote2'])
+        for broker in (remote2, remote3):
+            protocol.failed(broker)
+            protocol.failed(broker)
+        self.assertEquals(hosts(protocol), ['remote1', 'remote3', 'remote2']) # all circuit breakers are open
+        clock.advance(1)
+        protocol.established(remote2, 0.1)
+        self.assertEquals(hosts(protocol), ['remote2', 'remote1', 'remote3'])
+
+        protocol = StompFailoverTransport(uri % 'weighted', clock)
+        protocol.connected(remote1, 0.001)
+        protocol.connected(remote2, 1.0)
+        protocol.connected(remote3, 1.0)
+        first = [hosts(protocol)[0] for _ in xrange(100)]
+        self.assertTrue(first.count('remote1') > 90)
+
+    def test_update(self):
+        uri = 'failover:(tcp://remote1:61615,tcp://remote2:61616)?randomize=false,startupMaxReconnectAttempts=3,initialReconnectDelay=7,useExponentialBackOff=false'
+        protocol = StompFailoverTransport(uri)
+        remote1, remote2, remote3 = ({'host': 'remote%d' % i, 'protocol': 'tcp', 'port': 61614 + i} for i in (1, 2, 3))
+        rounds = protocol.rounds()
+        self.assertEquals(next(rounds), ([remote1, remote2], 0))
+        self.assertEquals(next(rounds), ([remote1, remote2], 0.007))
+        self.assertTrue(protocol.update('(tcp://remote1:61615, tcp://remote2:61616\ntcp://remote3:61617)'))
+        self.assertEquals(next(rounds), ([remote3, remote1, remote2], 0.007)) # the new broker comes first
+        protocol.failed(remote3)
+        self.assertEquals(next(rounds), ([remote1, remote2, remote3], 0.007))
+        self.assertRaises(StompConnectTimeout, next, rounds) # the reconnect attempts were not reset
+
+        self.assertFalse(protocol.update('tcp://remote3:61617,tcp://remote2:61616,tcp://remote1:61615'))
+        self.assertRaises(ValueError, protocol.update, 'remote4')
+        self.assertEquals(protocol.brokers(), [remote3, remote2, remote1])
+
+        self.assertTrue(protocol.advertised({StompFailoverTransport.BROKERS_HEADER: 'tcp://remote1:61615'}))
+        self.assertEquals(protocol.brokers(), [remote1])
+        self.assertFalse(protocol.advertised({}))
+        protocol = StompFailoverTransport(uri + ',updateURIsSupported=false')
+        self.assertFalse(protocol.advertised({StompFailoverTransport.BROKERS_HEADER: 'tcp://remote3:61617'}))
+        self.assertEquals(protocol.brokers(), [remote1, remote2])
+
+    def test_update_from_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        protocol = StompFailoverTransport('failover:(tcp://remote1:61615)?updateURIsURL=%s' % path)
+        hosts = lambda: [broker['host'] for broker in protocol.brokers()]
+        self.assertEquals(hosts(), ['remote1']) # an empty file is ignored
+        with open(path, 'w') as f:
+            f.write('tcp://remote2:61616,tcp://remote3:61617\n')
+        self.assertEquals(sorted(hosts()), ['remote2', 'remote3'])
+        os.remove(path)
+        self.assertEquals(sorted(hosts()), ['remote2', 'remote3'])
+        open(path, 'w').close()
+
+    def test_simulation(self):
+        timeline = [(1.0, 'tcp://remote1:61613', False), (3.0, 'tcp://remote1:61613', True)]
+        uri = 'failover:(tcp://remote1:61613)?initialReconnectDelay=100,maxReconnectDelay=1000%s'
+        result = StompFailoverSimulation(uri % '', timeline, clients=100, connectLatency=0, failLatency=0).run()
+        self.assertEquals(len(result['reconnects']), 100)
+        for reconnect in (result['reconnects'][0], result['reconnects'][-1]): # attempts at 0, 0.1, 0.3, 0.7, 1.5, 2.5 s after the loss
+            self.assertAlmostEquals(reconnect, 2.5)
+        self.assertEquals(set(result['attempts']), set([6]))
+        self.assertEquals(result['herd'], {'tcp://remote1:61613': 100})
+        self.assertEquals(result['connected'], {'tcp://remote1:61613': 100})
+
+        simulation = StompFailoverSimulation(uri % ',reconnectDelayJitter=500', timeline, clients=100, seed=4711)
+        result = simulation.run()
+        self.assertEquals(simulation.run(), result)
+        self.assertTrue(result['herd']['tcp://remote1:61613'] < 20)
+
+        result = StompFailoverSimulation(uri % ',maxReconnectAttempts=3', timeline, clients=100).run()
+        self.assertEquals(result['gaveUp'], 100)
+        self.assertEquals(result['connected'], {'tcp://remote1:61613': 0})
+
     def _test_failover(self, brokersAndDelays, expectedDelaysAndBrokers):
         for (expectedDelay, expectedBroker) in expectedDelaysAndBrokers:
             broker, delay = brokersAndDelays.next()
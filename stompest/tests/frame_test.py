@@ -36,6 +36,31 @@ DISCONNECT
         self.assertEquals(frame.body, body)
         self.assertEquals(str(frame), 'MESSAGE\ncontent-length:4\n\n\xf0\x00\n\t\x00')
 
+    def test_render_content_length(self):
+        body = binascii.a2b_hex('f0000a09')
+        frame = StompFrame('SEND', {StompSpec.DESTINATION_HEADER: '/queue/world'}, body)
+        self.assertEquals(frame.render(), str(frame))
+        self.assertEquals(frame.render(contentLength=True), str(StompFrame('SEND', {StompSpec.DESTINATION_HEADER: '/queue/world', StompSpec.CONTENT_LENGTH_HEADER: 4}, body)))
+        self.assertEquals(frame.headers, {StompSpec.DESTINATION_HEADER: '/queue/world'})
+
+        frame = StompFrame('SEND', {StompSpec.CONTENT_LENGTH_HEADER: '4'}, body)
+        self.assertEquals(frame.render(contentLength=True), str(frame))
+
+        frame = StompFrame('DISCONNECT')
+        self.assertEquals(frame.render(contentLength=True), str(frame))
+
+    def test_render_cache(self):
+        frame = StompFrame('SEND', {StompSpec.DESTINATION_HEADER: '/queue/world'}, 'hi')
+        wire = str(frame)
+        self.assertTrue(str(frame) is wire)
+        frame.headers['foo'] = 'bar'
+        self.assertEquals(str(frame), str(StompFrame('SEND', {StompSpec.DESTINATION_HEADER: '/queue/world', 'foo': 'bar'}, 'hi')))
+        frame.body = 'there'
+        self.assertEquals(str(frame), str(StompFrame('SEND', {StompSpec.DESTINATION_HEADER: '/queue/world', 'foo': 'bar'}, 'there')))
+        frame.command = 'MESSAGE'
+        self.assertEquals(str(frame), str(StompFrame('MESSAGE', {StompSpec.DESTINATION_HEADER: '/queue/world', 'foo': 'bar'}, 'there')))
+        self.assertEquals(frame.render(contentLength=True), str(StompFrame('MESSAGE', {StompSpec.DESTINATION_HEADER: '/queue/world', 'foo': 'bar', StompSpec.CONTENT_LENGTH_HEADER: 5}, 'there')))
+
     def test_non_string_arguments(self):
         message = {'command': 0, 'headers': {123: 456}, 'body': 789}
         frame = StompFrame(**message)
@@ -0,0 +1,78 @@
+import unittest
+
+from stompest.protocol import StompFrame, StompInFlightTracker, StompSession, StompSpec, commands
+
+class StompInFlightTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.token = (StompSpec.ID_HEADER, '0')
+        self.frames = [StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(i), StompSpec.SUBSCRIPTION_HEADER: '0'}, 'x' * i) for i in xrange(5)]
+
+    def _tracker(self, maxCount=None, maxBytes=None):
+        return StompInFlightTracker(maxCount, maxBytes, clock=lambda: self.now)
+
+    def _ids(self, removed):
+        return [headers[StompSpec.MESSAGE_ID_HEADER] for (_, headers) in removed]
+
+    def test_individual(self):
+        tracker = self._tracker()
+        for frame in self.frames:
+            tracker.add(self.token, frame)
+            self.now += 1
+        tracker.add(self.token, self.frames[0])
+        self.assertEquals((len(tracker), tracker.bytes, tracker.oldest()), (5, 10, 5))
+        self.assertEquals(self._ids(tracker.remove('2')), ['2'])
+        self.assertEquals(self._ids(tracker.remove('2')), [])
+        self.assertEquals(self._ids(tracker.remove('0')), ['0'])
+        self.assertEquals(tracker.statistics(), {'count': 3, 'bytes': 8, 'oldest': 4})
+        self.assertEquals(self._ids(tracker.flush()), ['1', '3', '4'])
+        self.assertEquals(tracker.statistics(), {'count': 0, 'bytes': 0, 'oldest': None})
+
+    def test_cumulative(self):
+        tracker = self._tracker()
+        for frame in self.frames:
+            tracker.add(self.token, frame, cumulative=True)
+        self.assertEquals(self._ids(tracker.remove('2')), ['0', '1', '2'])
+        self.assertEquals(self._ids(tracker.flush()), ['4'])
+
+    def test_limits(self):
+        tracker = self._tracker(maxCount=2)
+        tracker.add(self.token, self.frames[0])
+        self.assertFalse(tracker.full)
+        tracker.add(self.token, self.frames[1])
+        self.assertTrue(tracker.full)
+        tracker = self._tracker(maxBytes=5)
+        tracker.add(self.token, self.frames[4])
+        self.assertFalse(tracker.full)
+        tracker.add(self.token, self.frames[1])
+        self.assertTrue(tracker.full)
+        tracker.remove('4')
+        self.assertFalse(tracker.full)
+
+    def test_session(self):
+        session = StompSession(StompSpec.VERSION_1_1, check=False, maxUnacked=3)
+        _, auto = session.subscribe('/queue/auto', {StompSpec.ID_HEADER: 'auto'})
+        _, client = session.subscribe('/queue/client', {StompSpec.ID_HEADER: 'client', StompSpec.ACK_HEADER: StompSpec.ACK_CLIENT})
+        _, individual = session.subscribe('/queue/individual', {StompSpec.ID_HEADER: 'individual', StompSpec.ACK_HEADER: StompSpec.ACK_CLIENT_INDIVIDUAL})
+        message = lambda i, token: StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(i), StompSpec.SUBSCRIPTION_HEADER: token[1], StompSpec.DESTINATION_HEADER: '/queue/' + token[1]})
+        frames = [message(i, token) for (i, token) in enumerate([auto, client, client, individual, individual])]
+        for frame in frames:
+            session.message(frame)
+        self.assertEquals(len(session.unacked), 4)
+        self.assertTrue(session.unacked.full)
+        session.ack(frames[3])
+        self.assertEquals(len(session.unacked), 3)
+        session.nack(frames[1])
+        self.assertEquals(len(session.unacked), 2)
+        self.assertEquals(session.ackAll(receipt='4711'), [commands.ack(frames[2], version=StompSpec.VERSION_1_1), commands.ack(frames[4], receipt='4711', version=StompSpec.VERSION_1_1)])
+        self.assertTrue('4711' in session.receipts)
+        self.assertEquals(len(session.unacked), 0)
+        self.assertEquals(session.nackAll(receipt='4712'), [])
+        self.assertFalse('4712' in session.receipts)
+
+        session.message(frames[4])
+        session.close(flush=False)
+        self.assertEquals(len(session.unacked), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -120,6 +120,20 @@ class StompParserTest(unittest.TestCase):
 
         self.assertEquals(parser.get(), None)
 
+    def test_binary_body_with_content_length_in_chunks(self):
+        body = 'a\x00b\x00\x00c' * 100
+        frame = StompFrame('MESSAGE', {'x': 'y'}, body)
+        frameBytes = 2 * frame.render(contentLength=True)
+        for size in (1, 7, 100, len(frameBytes)):
+            parser = StompParser()
+            for offset in xrange(0, len(frameBytes), size):
+                parser.add(frameBytes[offset:offset + size])
+            for _ in xrange(2):
+                frame_ = parser.get()
+                self.assertEquals(frame_.body, body)
+                self.assertEquals(frame_.headers, {'x': 'y', 'content-length': str(len(body))})
+            self.assertEquals(parser.get(), None)
+
     def test_receiveFrame_multiple_frames_per_read(self):
         body1 = 'boo'
         body2 = 'hoo'
@@ -140,5 +154,18 @@ class StompParserTest(unittest.TestCase):
 
         self.assertEquals(parser.get(), None)
 
+    def test_pending(self):
+        frame = StompFrame('MESSAGE', {'content-length': '10'}, '0123456789')
+        data = str(frame)
+        parser = StompParser()
+        self.assertEquals(parser.pending(), 0)
+        parser.add(data[:10]) # no content-length yet
+        self.assertEquals(parser.pending(), 0)
+        parser.add(data[10:-5])
+        self.assertEquals(parser.pending(), 5)
+        parser.add(data[-5:])
+        self.assertEquals(parser.pending(), 0)
+        self.assertEquals(parser.get(), frame)
+
 if __name__ == '__main__':
     unittest.main()
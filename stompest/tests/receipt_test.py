@@ -0,0 +1,84 @@
+import unittest
+
+from stompest.error import StompProtocolError
+from stompest.protocol import StompReceiptTracker, StompSession
+
+class StompReceiptTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+
+    def _tracker(self, timeout=None, maxSize=None):
+        return StompReceiptTracker(timeout, maxSize, clock=lambda: self.now)
+
+    def test_add_remove(self):
+        tracker = self._tracker()
+        self.assertEquals(tracker.add('4711'), [])
+        self.assertTrue('4711' in tracker)
+        self.assertRaises(StompProtocolError, tracker.add, '4711')
+        self.now = 3
+        self.assertEquals(tracker.remove('4711'), 3)
+        self.assertEquals(len(tracker), 0)
+        self.assertRaises(StompProtocolError, tracker.remove, '4711')
+
+    def test_expire(self):
+        tracker = self._tracker(timeout=5)
+        tracker.add('1')
+        tracker.add('2', timeout=1)
+        tracker.add('3', timeout=10)
+        self.assertEquals(tracker.expire(), [])
+        self.now = 2
+        self.assertEquals(tracker.expire(), ['2'])
+        self.now = 5
+        tracker.add('4')
+        self.assertEquals(list(tracker), ['3', '4'])
+        self.now = 10
+        self.assertEquals(tracker.expire(), ['3', '4'])
+
+    def test_deadline(self):
+        tracker = self._tracker(timeout=1)
+        tracker.add('1')
+        tracker.deadline('1', 10)
+        self.now = 5
+        self.assertEquals(tracker.expire(), [])
+        self.assertRaises(StompProtocolError, tracker.deadline, '2', 1)
+        self.now = 10
+        self.assertEquals(tracker.expire(), ['1'])
+
+    def test_max_size(self):
+        tracker = self._tracker(maxSize=2)
+        tracker.add('1')
+        tracker.add('2')
+        self.assertEquals(tracker.add('3'), ['1'])
+        self.assertEquals(list(tracker), ['2', '3'])
+
+    def test_stale_entries_are_compacted(self):
+        tracker = self._tracker(timeout=1)
+        tracker.add('1')
+        for _ in xrange(1000):
+            tracker.deadline('1', 1)
+        self.assertTrue(len(tracker._heap) < 100)
+
+    def test_statistics(self):
+        tracker = self._tracker()
+        self.assertEquals(tracker.statistics(), {'count': 0, 'oldest': None, 'mean': None})
+        tracker.add('1')
+        self.now = 2
+        tracker.add('2')
+        self.now = 4
+        self.assertEquals(tracker.statistics(), {'count': 2, 'oldest': 4, 'mean': 3.0})
+
+    def test_session(self):
+        session = StompSession(check=False, receiptTimeout=5, maxReceipts=2, clock=lambda: self.now)
+        session.send('/queue/test', receipt='1')
+        session.send('/queue/test', receipt='2')
+        session.send('/queue/test', receipt='3')
+        self.assertEquals(list(session.receipts), ['2', '3'])
+        self.assertEquals(session.droppedReceipts(), ['1'])
+        self.assertEquals(session.droppedReceipts(), [])
+        self.now = 10
+        self.assertEquals(session.receipts.expire(), ['2', '3'])
+        session.close(flush=True)
+        self.assertEquals(session.receipts.timeout, 5)
+
+if __name__ == '__main__':
+    unittest.main()
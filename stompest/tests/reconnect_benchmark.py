@@ -0,0 +1,68 @@
+"""End-to-end reconnect latency of the asynchronous client against local fake brokers. A client is connected to the first of two brokers, which then drops the connection and stops listening. The client reconnects as soon as its :attr:`~.async.client.Stomp.disconnected` :class:`twisted.internet.defer.Deferred` errs back. The benchmark repeats this and reports the distribution of the times between the connection loss and the re-established STOMP session (on the second broker) for several failover options.
+
+.. note :: The clients are measured one at a time, because :meth:`~.async.client.Stomp.connect` is exclusive per process. The behavior of many clients which reconnect at once is the subject of the :mod:`~.tests.failover_simulator`.
+
+Run it with ``python -m stompest.tests.reconnect_benchmark``.
+"""
+from twisted.internet import defer, reactor, task
+from twisted.internet.protocol import Factory
+
+from stompest.async import Stomp
+from stompest.config import StompConfig
+from stompest.tests.broker_simulator import RemoteControlViaFrameStompServer
+from stompest.tests.failover_simulator import summary
+
+N = 100
+
+OPTIONS = ['', 'initialReconnectDelay=0', 'race=true', 'race=true,raceStagger=0']
+
+class _BrokerFactory(Factory):
+    protocol = RemoteControlViaFrameStompServer
+
+    def __init__(self):
+        self.connections = []
+
+    def buildProtocol(self, addr):
+        protocol = Factory.buildProtocol(self, addr)
+        self.connections.append(protocol)
+        return protocol
+
+@defer.inlineCallbacks
+def measure(options, n=N):
+    """Returns **n** reconnect latencies (in s) of a client whose failover URI has the options **options**."""
+    latencies = []
+    for _ in xrange(n):
+        latencies.append((yield _reconnect(options)))
+    defer.returnValue(latencies)
+
+@defer.inlineCallbacks
+def _reconnect(options):
+    factories = [_BrokerFactory(), _BrokerFactory()]
+    ports = [reactor.listenTCP(0, factory, interface='127.0.0.1') for factory in factories] #@UndefinedVariable
+    uri = 'failover:(tcp://127.0.0.1:%d,tcp://127.0.0.1:%d)?randomize=false,startupMaxReconnectAttempts=1' % tuple(port.getHost().port for port in ports)
+    if options:
+        uri += ',' + options
+    client = Stomp(StompConfig(uri, version='1.1'))
+    yield client.connect()
+
+    reconnected = client.disconnected.addErrback(lambda _: client.connect())
+    yield ports[0].stopListening()
+    started = reactor.seconds() #@UndefinedVariable
+    for connection in factories[0].connections:
+        connection.transport.loseConnection()
+    yield reconnected
+    latency = reactor.seconds() - started #@UndefinedVariable
+
+    yield client.disconnect()
+    yield ports[1].stopListening()
+    defer.returnValue(latency)
+
+@defer.inlineCallbacks
+def main(_, n=N):
+    print '%-32s %10s %10s %10s %10s' % ('options', 'min', 'median', 'p90', 'max')
+    for options in OPTIONS:
+        latencies = summary((yield measure(options, n)))
+        print '%-32s %8.1fms %8.1fms %8.1fms %8.1fms' % ((options or 'default',) + tuple(1000 * latencies[k] for k in ('min', 'median', 'p90', 'max')))
+
+if __name__ == '__main__':
+    task.react(main)
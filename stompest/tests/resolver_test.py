@@ -0,0 +1,64 @@
+import socket
+import unittest
+
+from mock import patch
+
+from stompest.protocol import StompFailoverUri, StompSpec, commands, resolver
+from stompest.protocol.resolver import StompHostResolver
+
+class StompHostResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.resolver = StompHostResolver(ttl=10, clock=lambda: self.now)
+
+    @patch('socket.gethostbyaddr')
+    @patch('socket.gethostname')
+    def test_host_name_is_cached(self, gethostname, gethostbyaddr):
+        gethostname.return_value = 'earth'
+        gethostbyaddr.return_value = ('earth.solar-system', [], [])
+        self.assertEquals(self.resolver.hostName(), 'earth.solar-system')
+        self.assertEquals(self.resolver.hostName(), 'earth.solar-system')
+        self.assertEquals(gethostbyaddr.call_count, 1)
+
+        self.now = 9.9
+        self.resolver.hostName()
+        self.assertEquals(gethostbyaddr.call_count, 1)
+
+        self.now = 10
+        gethostbyaddr.return_value = ('mars.solar-system', [], [])
+        self.assertEquals(self.resolver.hostName(), 'mars.solar-system')
+        self.assertEquals(gethostbyaddr.call_count, 2)
+
+        self.resolver.clear()
+        self.resolver.hostName()
+        self.assertEquals(gethostbyaddr.call_count, 3)
+
+    @patch('socket.gethostbyaddr')
+    @patch('socket.gethostname')
+    def test_host_name_falls_back_to_plain_host_name(self, gethostname, gethostbyaddr):
+        gethostname.return_value = 'earth'
+        gethostbyaddr.side_effect = socket.herror('no reverse lookup')
+        self.assertEquals(self.resolver.hostName(), 'earth')
+
+    @patch('socket.getfqdn')
+    @patch('socket.gethostbyname')
+    @patch('socket.gethostname')
+    def test_local_host_names(self, gethostname, gethostbyname, getfqdn):
+        gethostname.return_value = 'earth'
+        gethostbyname.side_effect = socket.gaierror('no lookup')
+        getfqdn.return_value = 'earth.solar-system'
+        self.assertEquals(self.resolver.localHostNames(), frozenset(['localhost', '127.0.0.1', 'earth', 'earth.solar-system']))
+        self.resolver.localHostNames()
+        self.assertEquals(getfqdn.call_count, 1)
+
+    def test_lazy_lookups(self):
+        with patch('stompest.protocol.resolver._resolver') as resolver_:
+            resolver_.hostName.return_value = 'earth'
+            resolver_.localHostNames.return_value = frozenset(['earth'])
+            self.assertEquals(StompFailoverUri.LOCAL_HOST_NAMES, frozenset(['earth']))
+            frame = commands.connect(versions=[StompSpec.VERSION_1_1])
+            self.assertEquals(frame.headers[StompSpec.HOST_HEADER], 'earth')
+        self.assertEquals(resolver.localHostNames(), resolver.localHostNames())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from stompest.error import StompProtocolError
+from stompest.protocol import StompFrame, StompRouter, StompSession, StompSpec
+
+class StompRouterTest(unittest.TestCase):
+    def test_exact(self):
+        router = StompRouter()
+        router.add('/queue/foo.bar', 'a')
+        self.assertEquals(router.match('/queue/foo.bar'), ('a',))
+        self.assertEquals(router.match('/queue/foo'), ())
+        self.assertEquals(router.match('/queue/foo.bar.baz'), ())
+        self.assertEquals(router.match('/topic/foo.bar'), ())
+
+    def test_wildcards(self):
+        router = StompRouter()
+        router.add('/topic/foo.>', 'a')
+        router.add('/topic/foo.*', 'b')
+        router.add('/topic/*.bar', 'c')
+        router.add('/topic/>', 'd')
+        self.assertEquals(router.match('/topic/foo.bar'), ('a', 'b', 'c', 'd'))
+        self.assertEquals(router.match('/topic/foo.baz.bar'), ('a', 'd'))
+        self.assertEquals(router.match('/topic/foo'), ('d',))
+        self.assertEquals(router.match('/queue/foo.bar'), ())
+
+    def test_custom_syntax(self):
+        router = StompRouter(separator='/', anySegment='+', anyChild='#')
+        router.add('/exchange/amq.topic/a/+/c', 'a')
+        router.add('/exchange/amq.topic/a/#', 'b')
+        self.assertEquals(router.match('/exchange/amq.topic/a/b/c'), ('a', 'b'))
+        self.assertEquals(router.match('/exchange/amq.topic/a/b/d'), ('b',))
+
+    def test_remove(self):
+        router = StompRouter()
+        router.add('/topic/foo.>', 'a')
+        router.add('/topic/foo.bar', 'b')
+        self.assertEquals(router.match('/topic/foo.bar'), ('a', 'b'))
+        router.remove('a')
+        self.assertEquals(router.match('/topic/foo.bar'), ('b',))
+        self.assertFalse('a' in router)
+        router.remove('b')
+        self.assertEquals(router._root.children, {})
+        self.assertRaises(KeyError, router.remove, 'b')
+
+    def test_cache(self):
+        router = StompRouter(cacheSize=2)
+        router.add('/topic/>', 'a')
+        for name in ('a', 'b', 'c'):
+            self.assertEquals(router.match('/topic/' + name), ('a',))
+            self.assertTrue(len(router._cache) <= 2)
+        router.add('/topic/c', 'b')
+        self.assertEquals(router.match('/topic/c'), ('a', 'b'))
+
+    def test_session(self):
+        session = StompSession(StompSpec.VERSION_1_0, check=False)
+        _, wildcard = session.subscribe('/topic/foo.>')
+        _, exact = session.subscribe('/topic/foo.bar')
+        message = lambda destination: StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: '4711', StompSpec.DESTINATION_HEADER: destination})
+        self.assertEquals(session.message(message('/topic/foo.bar')), exact)
+        self.assertEquals(session.message(message('/topic/foo.baz')), wildcard)
+        self.assertRaises(StompProtocolError, session.message, message('/topic/bar'))
+        session.unsubscribe(wildcard)
+        self.assertRaises(StompProtocolError, session.message, message('/topic/foo.baz'))
+        self.assertEquals(list(session.replay()), [('/topic/foo.bar', None, None, None)])
+        self.assertRaises(StompProtocolError, session.message, message('/topic/foo.bar'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import logging
+import socket
+import unittest
+
+from stompest.config import StompConfig
+from stompest.error import StompConnectionError
+from stompest.protocol import StompFrame, StompSpec
+from stompest.sync import Stomp, StompSelector
+from stompest.sync.transport import StompFrameTransport
+
+logging.basicConfig(level=logging.DEBUG)
+
+CONFIG = StompConfig('tcp://localhost:61613', version=StompSpec.VERSION_1_1, check=False)
+
+class StompSelectorTest(unittest.TestCase):
+    def _connect(self):
+        broker, client = socket.socketpair()
+        self.addCleanup(broker.close)
+        stomp = Stomp(CONFIG)
+        transport = stomp._transport = StompFrameTransport('localhost', 61613, StompSpec.VERSION_1_1)
+        transport._socket = client
+        stomp.session.connect()
+        stomp.session.connected(StompFrame(StompSpec.CONNECTED, {StompSpec.VERSION_HEADER: StompSpec.VERSION_1_1}))
+        self.addCleanup(stomp.close, False)
+        return stomp, broker
+
+    def _test_select(self, poller):
+        connections = [self._connect() for _ in xrange(3)]
+        selector = StompSelector(poller)
+        self.addCleanup(selector.close)
+        for (client, _) in connections:
+            selector.register(client)
+        self.assertEquals(len(selector), 3)
+        self.assertEquals(selector.select(0), [])
+
+        frames = [StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(i)}, 'hi') for i in xrange(2)]
+        connections[1][1].send(''.join(map(str, frames)))
+        connections[2][1].send(StompSpec.LINE_DELIMITER) # a heart-beat
+        self.assertEquals(selector.select(1), [connections[1][0]])
+        self.assertEquals(connections[1][0].receiveFrame(), frames[0])
+        self.assertEquals(selector.select(), [connections[1][0]]) # the second frame was already read from the wire
+        self.assertEquals(connections[1][0].receiveFrame(), frames[1])
+        self.assertEquals(selector.select(0), [])
+
+        connections[0][1].close()
+        self.assertEquals(selector.select(1), [connections[0][0]])
+        self.assertRaises(StompConnectionError, connections[0][0].receiveFrame)
+        self.assertEquals(len(selector), 2)
+
+        selector.unregister(connections[1][0])
+        self.assertEquals(selector.clients, [connections[2][0]])
+
+    def test_select_partial_frame(self):
+        connections = [self._connect() for _ in xrange(2)]
+        selector = StompSelector()
+        self.addCleanup(selector.close)
+        for (client, _) in connections:
+            selector.register(client)
+
+        frames = [StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(i)}, 'x' * 10000) for i in xrange(2)]
+        data = str(frames[0])
+        connections[0][1].send(data[:1000]) # a slow client: the rest of the frame is not there yet
+        connections[1][1].sendall(str(frames[1]))
+        ready = []
+        while not ready:
+            ready = selector.select(1) # the complete frame may take more than one read
+        self.assertEquals(ready, [connections[1][0]])
+        self.assertEquals(connections[1][0].receiveFrame(), frames[1])
+
+        connections[0][1].sendall(data[1000:])
+        ready = []
+        while not ready:
+            ready = selector.select(1)
+        self.assertEquals(ready, [connections[0][0]])
+        self.assertEquals(connections[0][0].receiveFrame(), frames[0])
+        self.assertEquals(selector.select(0), [])
+
+    def test_select(self):
+        self._test_select(None)
+
+    def test_select_poll(self):
+        self._test_select('poll')
+
+    def test_select_select(self):
+        self._test_select('select')
+
+if __name__ == '__main__':
+    unittest.main()
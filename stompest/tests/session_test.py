@@ -1,5 +1,8 @@
+import json
 import unittest
 
+from mock import MagicMock
+
 from stompest.error import StompProtocolError
 from stompest.protocol import StompSession, StompSpec, commands
 from stompest.protocol.frame import StompFrame
@@ -120,6 +123,41 @@ class StompSessionTest(unittest.TestCase):
         session.disconnect()
         session.close()
 
+    def test_session_lock(self):
+        lock = MagicMock()
+        session = StompSession(check=False, lock=lock)
+        session.send('/queue/test', receipt='4711')
+        session.subscribe('/queue/test')
+        list(session.replay())
+        self.assertEquals(lock.__enter__.call_count, 3)
+        self.assertEquals(lock.__exit__.call_count, 3)
+        session.sent()
+        self.assertEquals(lock.__enter__.call_count, 3)
+
+    def test_session_snapshot(self):
+        session = StompSession(StompSpec.VERSION_1_1, check=False)
+        session.connect(heartBeats=(1, 2))
+        session.connected(StompFrame(StompSpec.CONNECTED, {StompSpec.VERSION_HEADER: StompSpec.VERSION_1_1, StompSpec.HEART_BEAT_HEADER: '2,1'}))
+        headers1 = {StompSpec.ID_HEADER: '1', StompSpec.ACK_HEADER: StompSpec.ACK_CLIENT}
+        headers2 = {StompSpec.ID_HEADER: '2'}
+        session.subscribe('/queue/foo', headers1, context={'bla': 1})
+        session.subscribe('/topic/bar.>', headers2, receipt='4711')
+        snapshot = json.loads(json.dumps(session.snapshot()))
+
+        session = StompSession(StompSpec.VERSION_1_1)
+        session.restore(snapshot)
+        self.assertEquals(session.version, StompSpec.VERSION_1_1)
+        self.assertEquals(session.connect(), commands.connect(versions=[StompSpec.VERSION_1_0, StompSpec.VERSION_1_1], heartBeats=(1, 2)))
+        self.assertEquals(list(session.replay()), [('/queue/foo', headers1, None, {'bla': 1}), ('/topic/bar.>', headers2, '4711', None)])
+        session.connected(StompFrame(StompSpec.CONNECTED, {StompSpec.VERSION_HEADER: StompSpec.VERSION_1_1, StompSpec.HEART_BEAT_HEADER: '2,1'}))
+        session.close()
+        self.assertEquals(session.connect(), commands.connect(versions=[StompSpec.VERSION_1_0, StompSpec.VERSION_1_1])) # the restored heart-beats are only requested once
+
+        self.assertRaises(StompProtocolError, session.restore, snapshot)
+        session = StompSession(StompSpec.VERSION_1_0)
+        self.assertRaises(StompProtocolError, session.restore, snapshot)
+        self.assertRaises(StompProtocolError, session.restore, dict(snapshot, format=0))
+
     def test_session_subscribe(self):
         session = StompSession(check=False)
         headers = {'bla2': 'bla3'}
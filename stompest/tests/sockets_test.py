@@ -0,0 +1,42 @@
+import socket
+import unittest
+
+from stompest.protocol import StompFailoverUri, StompSocketOptions
+
+class StompSocketOptionsTest(unittest.TestCase):
+    def test_defaults(self):
+        options = StompSocketOptions(StompFailoverUri('tcp://remote1:61613').options)
+        self.assertEquals(options.socketOptions, [])
+        self.assertEquals(options.bindAddress, None)
+        self.assertFalse(options)
+
+    def test_options(self):
+        uri = StompFailoverUri('tcp://remote1:61613?receiveBufferSize=65536,sendBufferSize=32768,tcpNoDelay=true,keepAlive=true,keepAliveInterval=500,keepAliveCount=3,localAddress=127.0.0.1:0')
+        options = StompSocketOptions(uri.options)
+        self.assertEquals(options.socketOptions, [
+            ('SOL_SOCKET', 'SO_RCVBUF', 65536),
+            ('SOL_SOCKET', 'SO_SNDBUF', 32768),
+            ('IPPROTO_TCP', 'TCP_NODELAY', 1),
+            ('SOL_SOCKET', 'SO_KEEPALIVE', 1),
+            ('IPPROTO_TCP', 'TCP_KEEPINTVL', 1),
+            ('IPPROTO_TCP', 'TCP_KEEPCNT', 3)
+        ])
+        self.assertEquals(options.bindAddress, ('127.0.0.1', 0))
+        self.assertEquals(StompSocketOptions(uri.options, {'localAddress': 'localhost'}).bindAddress, ('localhost', 0))
+
+    def test_overrides(self):
+        uri = StompFailoverUri('tcp://remote1:61613?tcpNoDelay=true')
+        self.assertEquals(StompSocketOptions(uri.options, {'tcpNoDelay': False, 'sendBufferSize': 8192}).socketOptions, [('SOL_SOCKET', 'SO_SNDBUF', 8192)])
+        self.assertRaises(ValueError, StompSocketOptions, uri.options, {'noDelay': True})
+
+    def test_apply(self):
+        options = StompSocketOptions(StompFailoverUri('tcp://remote1:61613?tcpNoDelay=true,keepAlive=true,localAddress=127.0.0.1:0').options)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.addCleanup(sock.close)
+        options.apply(sock)
+        self.assertTrue(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.assertTrue(sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+        self.assertEquals(sock.getsockname()[0], '127.0.0.1')
+
+if __name__ == '__main__':
+    unittest.main()
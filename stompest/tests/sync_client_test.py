@@ -1,12 +1,17 @@
 import logging
+import socket
+import threading
+import time
 import unittest
 
 from mock import Mock
 
 from stompest.config import StompConfig
 from stompest.error import StompConnectionError, StompProtocolError
-from stompest.protocol import StompFrame, StompSpec, commands
+from stompest.protocol import StompFailoverTransport, StompFrame, StompSpec, commands
+from stompest.protocol.clock import StompCoarseClock
 from stompest.sync import Stomp
+from stompest.sync.transport import StompFrameTransport
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -69,6 +74,24 @@ class SimpleStompTest(unittest.TestCase):
         stomp = self._get_transport_mock()
         self.assertRaises(StompConnectionError, stomp.connect)
 
+    def test_connect_reports_broker_health(self):
+        stomp = self._get_connect_mock(StompFrame('ERROR', body='fake error'))
+        self.assertRaises(StompProtocolError, stomp.connect)
+        self.assertEquals(stomp._failover.statistics({'host': HOST, 'port': PORT})['failures'], 1)
+        stomp._transport = None
+        stomp._transportFactory.return_value.receive.return_value = StompFrame('CONNECTED', {StompSpec.SESSION_HEADER: '4711'})
+        stomp.connect()
+        statistics = stomp._failover.statistics({'host': HOST, 'port': PORT})
+        self.assertEquals(statistics['failures'], 0)
+        self.assertNotEquals(statistics['connectLatency'], None)
+        self.assertNotEquals(statistics['handshakeLatency'], None)
+
+    def test_connect_accepts_advertised_brokers(self):
+        headers = {StompSpec.SESSION_HEADER: '4711', StompFailoverTransport.BROKERS_HEADER: 'tcp://remote1:61615,tcp://remote2:61616'}
+        stomp = self._get_connect_mock(StompFrame('CONNECTED', headers))
+        stomp.connect()
+        self.assertEquals(sorted(broker['host'] for broker in stomp.failover.brokers()), ['remote1', 'remote2'])
+
     def test_connect_writes_correct_frame(self):
         login = 'curious'
         passcode = 'george'
@@ -90,6 +113,17 @@ class SimpleStompTest(unittest.TestCase):
         sentFrame = args[0]
         self.assertEquals(StompFrame('SEND', {StompSpec.DESTINATION_HEADER: destination, 'foo': 'bar', 'fuzz': 'ball'}, message), sentFrame)
 
+    def test_send_ticks_clock(self):
+        now = [1.0]
+        stomp = Stomp(StompConfig('tcp://%s:%s' % (HOST, PORT), version=StompSpec.VERSION_1_1, check=False), clock=StompCoarseClock(lambda: now[0]))
+        stomp._transport = Mock()
+        now[0] = 5.0
+        stomp.send('/queue/foo', 'test message')
+        self.assertEquals(stomp.lastSent, 5.0)
+        now[0] = 7.0
+        stomp.beat()
+        self.assertEquals(stomp.lastSent, 7.0)
+
     def test_subscribe_writes_correct_frame(self):
         destination = '/queue/foo'
         headers = {'foo': 'bar', 'fuzz': 'ball'}
@@ -129,6 +163,179 @@ class SimpleStompTest(unittest.TestCase):
         sentFrame = args[0]
         self.assertEquals(StompFrame('ACK', {StompSpec.MESSAGE_ID_HEADER: id_}), sentFrame)
 
+    def test_resend_unconfirmed_messages(self):
+        config = StompConfig('failover:tcp://%s:%s?trackMessages=true,maxCacheSize=10' % (HOST, PORT), check=False)
+        stomp = self._get_connect_mock(StompFrame('CONNECTED', {StompSpec.SESSION_HEADER: '4711'}), config)
+        stomp.connect()
+        stomp.send('/queue/foo', 'a')
+        stomp.send('/queue/foo', 'b', receipt='4711')
+        stomp.receipt(StompFrame(StompSpec.RECEIPT, {StompSpec.RECEIPT_ID_HEADER: '4711'}))
+        stomp.send('/queue/foo', 'c')
+        stomp.send('/queue/foo', 'd', receipt='4712')
+        stomp.close(flush=False) # the connection was lost
+        stomp.connect()
+        args, _ = stomp._transport.sendFrames.call_args
+        self.assertEquals(args[0], [commands.send('/queue/foo', 'c'), commands.send('/queue/foo', 'd')])
+        self.assertEquals(stomp.session.cache.statistics(), {'count': 2, 'bytes': 2, 'evicted': 0, 'evictedBytes': 0})
+
+    def test_connect_replays_subscriptions_in_one_write(self):
+        stomp = self._get_connect_mock(StompFrame('CONNECTED', {StompSpec.SESSION_HEADER: '4711'}))
+        stomp.session.restore({'format': 1, 'version': StompSpec.VERSION_1_0, 'subscriptions': [
+            {'destination': '/queue/%d' % i, 'headers': {StompSpec.ID_HEADER: str(i)}} for i in xrange(3)
+        ]})
+        stomp.connect()
+        self.assertEquals(stomp._transport.sendFrames.call_count, 1)
+        frames, = stomp._transport.sendFrames.call_args[0]
+        self.assertEquals(frames, [commands.subscribe('/queue/%d' % i, {StompSpec.ID_HEADER: str(i)}, version=StompSpec.VERSION_1_0)[0] for i in xrange(3)])
+        self.assertEquals(len(list(stomp.session.replay())), 3)
+
+    def test_receiveFrame_concurrently(self):
+        frames = [StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(i)}) for i in xrange(50)]
+        wire = list(frames)
+
+        def receive():
+            time.sleep(0.0001)
+            return wire.pop(0)
+
+        stomp = self._get_transport_mock()
+        stomp._transport.receive = receive
+        received, lock = [], threading.Lock()
+
+        def consume():
+            for _ in xrange(10):
+                frame = stomp.receiveFrame()
+                with lock:
+                    received.append(frame)
+
+        threads = [threading.Thread(target=consume) for _ in xrange(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(sorted(received), sorted(frames))
+        self.assertEquals(wire, [])
+
+    def test_receiveFrames(self):
+        broker, client = socket.socketpair()
+        self.addCleanup(broker.close)
+        stomp = Stomp(StompConfig('tcp://%s:%s' % (HOST, PORT), version=StompSpec.VERSION_1_1, check=False))
+        transport = stomp._transport = StompFrameTransport(HOST, PORT, StompSpec.VERSION_1_1)
+        transport._socket = client
+        self.addCleanup(stomp.close, False)
+
+        frames = [StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(i)}, 'hi') for i in xrange(5)]
+        broker.sendall(StompSpec.LINE_DELIMITER + ''.join(map(str, frames)))
+        self.assertEquals(stomp.receiveFrames(3, 1), frames[:3])
+        self.assertEquals(transport.statistics()['reads'], 1)
+        self.assertEquals(stomp.receiveFrames(10, 0), frames[3:])
+        self.assertEquals(transport.statistics()['reads'], 1)
+        self.assertEquals(stomp.receiveFrames(10, 0.01), [])
+
+    def test_max_unacked(self):
+        stomp = Stomp(CONFIG, maxUnacked=2)
+        stomp._transport = Mock()
+        stomp.subscribe('/queue/test', {StompSpec.ACK_HEADER: StompSpec.ACK_CLIENT_INDIVIDUAL})
+        frames = [StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(i), StompSpec.DESTINATION_HEADER: '/queue/test'}) for i in xrange(3)]
+        stomp._transport.receive.side_effect = list(frames)
+        self.assertEquals([stomp.receiveFrame() for _ in xrange(2)], frames[:2])
+        self.assertTrue(stomp.session.unacked.full)
+        self.assertFalse(stomp.canRead(0))
+        self.assertRaises(StompProtocolError, stomp.canRead)
+        self.assertRaises(StompProtocolError, stomp.receiveFrame)
+        stomp.ack(frames[0])
+        self.assertEquals(stomp.receiveFrame(), frames[2])
+        stomp._transport.reset_mock()
+        stomp.ackAll()
+        self.assertEquals(stomp._transport.sendFrames.call_args[0][0], [commands.ack(frame) for frame in frames[1:]])
+        self.assertEquals(len(stomp.session.unacked), 0)
+
+    def test_ack_batched(self):
+        stomp = Stomp(CONFIG, ackWindow={'size': 2})
+        stomp._transport = Mock()
+        token = stomp.subscribe('/queue/foo', {StompSpec.ACK_HEADER: StompSpec.ACK_CLIENT})
+        frames = [StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(i), StompSpec.DESTINATION_HEADER: '/queue/foo'}) for i in xrange(3)]
+        for frame in frames:
+            stomp._transport.receive.return_value = frame
+            self.assertEquals(stomp.receiveFrame(), frame)
+
+        stomp.ack(frames[1])
+        stomp.ack(frames[2])
+        self.assertEquals(stomp._transport.sendFrames.call_count, 0)
+        stomp.ack(frames[0])
+        args, _ = stomp._transport.sendFrames.call_args
+        self.assertEquals(args[0], [StompFrame('ACK', {StompSpec.MESSAGE_ID_HEADER: '2'})])
+
+        frame = StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: '3', StompSpec.DESTINATION_HEADER: '/queue/foo'})
+        stomp.ack(frame)
+        self.assertEquals(stomp._transport.sendFrames.call_count, 1)
+        stomp.ack(frame, receipt='4711')
+        args, _ = stomp._transport.send.call_args
+        self.assertEquals(args[0], StompFrame('ACK', {StompSpec.MESSAGE_ID_HEADER: '3', StompSpec.RECEIPT_HEADER: '4711'}))
+        stomp.unsubscribe(token)
+        self.assertEquals(stomp._transport.sendFrames.call_count, 2)
+        args, _ = stomp._transport.sendFrames.call_args
+        self.assertEquals(args[0], [StompFrame('ACK', {StompSpec.MESSAGE_ID_HEADER: '3'})])
+
+    def test_nack_releases_batched_acks(self):
+        stomp = Stomp(StompConfig('tcp://%s:%s' % (HOST, PORT), version=StompSpec.VERSION_1_1, check=False), ackWindow={'size': 2})
+        stomp._transport = Mock()
+        stomp.subscribe('/queue/foo', {StompSpec.ACK_HEADER: StompSpec.ACK_CLIENT, StompSpec.ID_HEADER: '4711'})
+        frames = [StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: str(i), StompSpec.DESTINATION_HEADER: '/queue/foo', StompSpec.SUBSCRIPTION_HEADER: '4711'}) for i in xrange(3)]
+        for frame in frames:
+            stomp._transport.receive.return_value = frame
+            self.assertEquals(stomp.receiveFrame(), frame)
+
+        stomp.ack(frames[1])
+        stomp.ack(frames[2])
+        self.assertEquals(stomp._transport.sendFrames.call_count, 0)
+        stomp.nack(frames[0])
+        self.assertEquals(stomp._transport.send.call_args[0][0].command, StompSpec.NACK)
+        self.assertEquals(stomp._transport.sendFrames.call_args[0][0], [StompFrame('ACK', {StompSpec.MESSAGE_ID_HEADER: '2', StompSpec.SUBSCRIPTION_HEADER: '4711'})])
+
+    def test_connect_race(self):
+        self._test_connect_race()
+
+    def test_connect_race_buffered(self):
+        self._test_connect_race({'size': 65536})
+
+    def _test_connect_race(self, writeBuffer=None):
+        silent = socket.socket() # accepts TCP connections but never answers
+        silent.bind(('127.0.0.1', 0))
+        silent.listen(5)
+        broker = socket.socket()
+        broker.bind(('127.0.0.1', 0))
+        broker.listen(5)
+
+        def serve():
+            connection, _ = broker.accept()
+            data = ''
+            while not data.endswith('\x00'):
+                data += connection.recv(1024)
+            connection.sendall(StompFrame(StompSpec.CONNECTED, {StompSpec.SESSION_HEADER: '4711'}).render())
+            received.append(data)
+            self.addCleanup(connection.close)
+
+        received = []
+        thread = threading.Thread(target=serve)
+        thread.start()
+        self.addCleanup(silent.close)
+        self.addCleanup(broker.close)
+
+        uri = 'failover:(tcp://127.0.0.1:%d,tcp://127.0.0.1:%d)?race=true,raceStagger=50,randomize=false' % (silent.getsockname()[1], broker.getsockname()[1])
+        stomp = Stomp(StompConfig(uri, check=False), writeBuffer=writeBuffer)
+        started = time.time()
+        stomp.connect(connectedTimeout=5)
+        thread.join(5)
+        self.assertTrue(time.time() - started < 2)
+        self.assertEquals(stomp._transport.port, broker.getsockname()[1])
+        self.assertEquals(stomp.session.id, '4711')
+        self.assertTrue(received[0].startswith('CONNECT'))
+        statistics = stomp._failover.statistics({'host': '127.0.0.1', 'port': broker.getsockname()[1]})
+        self.assertNotEquals(statistics['handshakeLatency'], None)
+        self.assertEquals(statistics['failures'], 0)
+        self.assertEquals(stomp._failover.statistics({'host': '127.0.0.1', 'port': silent.getsockname()[1]})['failures'], 0) # losing the race is no failure
+        stomp._transport.disconnect()
+
     def test_transaction_writes_correct_frames(self):
         transaction = '4711'
         stomp = self._get_transport_mock()
@@ -0,0 +1,56 @@
+"""Throughput of the synchronous client reading **MESSAGE** frames one by one (:meth:`~.sync.client.Stomp.canRead` and :meth:`~.sync.client.Stomp.receiveFrame`) versus in batches (:meth:`~.sync.client.Stomp.receiveFrames`), over a local socket pair whose other end is fed by a thread.
+
+Run it with ``python -m stompest.tests.sync_receive_benchmark``.
+"""
+import socket
+import threading
+import time
+
+from stompest.config import StompConfig
+from stompest.protocol import StompFrame, StompSpec
+from stompest.sync import Stomp
+
+N = 100000
+
+FRAME = str(StompFrame(StompSpec.MESSAGE, {StompSpec.MESSAGE_ID_HEADER: '4711', StompSpec.DESTINATION_HEADER: '/queue/test'}, 'x' * 100))
+
+def _feed(sock, n):
+    chunk = FRAME * 100
+    for _ in xrange(n // 100):
+        sock.sendall(chunk)
+
+def _client(n):
+    broker, client = socket.socketpair()
+    thread = threading.Thread(target=_feed, args=(broker, n))
+    thread.daemon = True
+    thread.start()
+
+    stomp = Stomp(StompConfig('tcp://localhost:61613', version=StompSpec.VERSION_1_1, check=False))
+    transport = stomp._transport = stomp._createTransport({'host': 'localhost', 'port': 61613})
+    transport._socket = client
+    return stomp, broker, thread
+
+def measure(batch, n=N):
+    """Returns the number of frames per second which the client receives one by one (**batch** = :obj:`None`) or in batches of up to **batch** frames."""
+    stomp, broker, thread = _client(n)
+    try:
+        started = time.time()
+        received = 0
+        while received < n:
+            if batch is None:
+                stomp.canRead(1) and stomp.receiveFrame()
+                received += 1
+            else:
+                received += len(stomp.receiveFrames(batch, 1))
+        return n / (time.time() - started)
+    finally:
+        thread.join()
+        stomp.close(flush=False)
+        broker.close()
+
+def main(n=N):
+    for (name, batch) in [('receiveFrame', None), ('receiveFrames(100)', 100), ('receiveFrames(1000)', 1000)]:
+        print '%-32s %10.0f ops/s' % (name, measure(batch, n))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Throughput of :meth:`~.sync.client.Stomp.send` of the synchronous client over a local socket pair whose other end is drained by a thread. Each API command checks that the connection is alive; the benchmark compares a check which costs a system call per command (:attr:`~.sync.client.Stomp.PROBE_INTERVAL` = 0) with the default check, which only peeks at an idle socket, and it compares unbuffered writes (a system call per frame) with a **writeBuffer** and with a :meth:`~.sync.client.Stomp.batch`.
+
+Run it with ``python -m stompest.tests.sync_send_benchmark``.
+"""
+import socket
+import threading
+import time
+
+from stompest.config import StompConfig
+from stompest.protocol import StompFrame, StompSpec
+from stompest.sync import Stomp
+
+N = 100000
+
+BODY = 'x' * 100
+
+def _drain(sock):
+    while sock.recv(65536):
+        pass
+
+def _client(probeInterval, writeBuffer=None):
+    broker, client = socket.socketpair()
+    thread = threading.Thread(target=_drain, args=(broker,))
+    thread.daemon = True
+    thread.start()
+
+    stomp = Stomp(StompConfig('tcp://localhost:61613', version=StompSpec.VERSION_1_1, check=False), writeBuffer=writeBuffer)
+    stomp.PROBE_INTERVAL = probeInterval
+    transport = stomp._transport = stomp._createTransport({'host': 'localhost', 'port': 61613})
+    transport._socket = client
+    session = stomp.session
+    session.connect()
+    session.connected(StompFrame(StompSpec.CONNECTED, {StompSpec.VERSION_HEADER: StompSpec.VERSION_1_1}))
+    return stomp, broker, thread
+
+def measure(probeInterval, n=N, writeBuffer=None, batch=False):
+    """Returns the number of **SEND** frames per second which :meth:`~.sync.client.Stomp.send` writes if the liveness check uses the probe interval **probeInterval** (in s), with the **writeBuffer** of the client, and (if **batch** is set) within one :meth:`~.sync.client.Stomp.batch`."""
+    stomp, broker, thread = _client(probeInterval, writeBuffer)
+    try:
+        started = time.time()
+        if batch:
+            with stomp.batch():
+                for _ in xrange(n):
+                    stomp.send('/queue/test', BODY)
+        else:
+            for _ in xrange(n):
+                stomp.send('/queue/test', BODY)
+            stomp.flush()
+        return n / (time.time() - started)
+    finally:
+        stomp.close(flush=False)
+        thread.join()
+        broker.close()
+
+def main(n=N):
+    for (name, probeInterval, writeBuffer, batch) in [
+        ('probe every send', 0, None, False),
+        ('probe when idle (default)', Stomp.PROBE_INTERVAL, None, False),
+        ('write buffer 64 kB', Stomp.PROBE_INTERVAL, {'size': 65536, 'timeout': 0.01}, False),
+        ('batch', Stomp.PROBE_INTERVAL, None, True)
+    ]:
+        print '%-32s %10.0f ops/s' % (name, measure(probeInterval, n, writeBuffer, batch))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import logging
+import unittest
+
+from mock import Mock
+
+from stompest.protocol import StompFrame, StompSpec
+from stompest.protocol.frame import StompHeartBeat
+from stompest.trace import StompFrameTracer
+
+class StompFrameTracerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.log = Mock()
+        self.log.isEnabledFor.return_value = True
+
+    def _tracer(self, sample=1, rate=None):
+        return StompFrameTracer(sample, rate, self.log, clock=lambda: self.now)
+
+    def _messages(self):
+        return [(args[0] % args[1:]) for (args, _) in self.log.debug.call_args_list]
+
+    def test_lazy_formatting(self):
+        frame = Mock()
+        frame.command = StompSpec.SEND
+        frame.info.return_value = 'SEND frame'
+        tracer = self._tracer()
+        tracer.sending(frame)
+        self.assertEquals(frame.info.call_count, 0)
+        self.assertEquals(self._messages(), ['Sending SEND frame'])
+        self.assertEquals(frame.info.call_count, 1)
+
+        self.log.isEnabledFor.return_value = False
+        tracer.received(frame)
+        self.assertEquals(self.log.debug.call_count, 1)
+
+    def test_sample(self):
+        tracer = self._tracer(sample=3)
+        for _ in xrange(7):
+            tracer.sending(StompFrame(StompSpec.SEND))
+        tracer.received(StompHeartBeat())
+        self.assertEquals(self._messages(), ['Sending SEND frame'] * 3 + ['Received heart-beat'])
+
+    def test_rate(self):
+        tracer = self._tracer(rate=2)
+        for _ in xrange(5):
+            tracer.sending(StompFrame(StompSpec.SEND))
+            tracer.received(StompFrame(StompSpec.MESSAGE))
+        self.assertEquals(self.log.debug.call_count, 4)
+        self.now = 1.0
+        tracer.sending(StompFrame(StompSpec.SEND))
+        self.assertEquals(self._messages()[4:], ['Sending: 3 frames suppressed (rate limit 2/s)', 'Sending SEND frame'])
+
+    def test_default_logger(self):
+        self.assertEquals(StompFrameTracer().log, logging.getLogger('stompest.trace'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,18 @@
 import binascii
+import errno
 import itertools
 import logging
+import socket
+import threading
+import time
 import unittest
 
-from mock import Mock
+from mock import Mock, patch
 
-from stompest.sync.transport import StompFrameTransport
+from stompest.sync.transport import StompFrameTransport, _Write
+from stompest.protocol import StompFailoverUri, StompSocketOptions
 from stompest.protocol.frame import StompFrame
-from stompest.error import StompConnectionError
+from stompest.error import StompConnectionError, StompSendTimeout
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -27,7 +32,7 @@ class StompFrameTransportTest(unittest.TestCase):
         connected.return_value = True
         socket = transport._socket = Mock()
         stream = self._generate_bytes(stream)
-        socket.recv = Mock(wraps=lambda size: ''.join(itertools.islice(stream, size)))
+        socket.recv = Mock(wraps=lambda size, flags=0: ''.join(itertools.islice(stream, size)))
         return transport
 
     def _get_send_mock(self):
@@ -46,6 +51,227 @@ class StompFrameTransportTest(unittest.TestCase):
         args, _ = transport._socket.sendall.call_args
         self.assertEquals(str(frame), args[0])
 
+    def test_send_content_length(self):
+        frame = StompFrame('SEND', {'destination': '/queue/world'}, 'hi')
+
+        transport = self._get_send_mock()
+        transport.contentLength = True
+        transport.send(frame)
+        args, _ = transport._socket.sendall.call_args
+        self.assertEquals(frame.render(contentLength=True), args[0])
+        self.assertTrue('content-length:2\n' in args[0])
+
+    def test_send_concurrently(self):
+        frames = [StompFrame('SEND', {'destination': '/queue/%d' % i}, 'x' * 1000 * i) for i in xrange(20)]
+        written = []
+
+        def sendall(data): # give other threads a chance to queue their frames
+            time.sleep(0.001)
+            written.append(data)
+
+        transport = self._get_send_mock()
+        transport._socket.sendall = sendall
+        threads = [threading.Thread(target=transport.send, args=(frame,)) for frame in frames]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(len(written) <= len(frames))
+        self.assertEquals(sorted(''.join(written).split('\x00')[:-1]), sorted(str(frame)[:-1] for frame in frames))
+
+    def test_send_timeout_spools_remainder(self):
+        frames = [StompFrame('SEND', {'destination': '/queue/test'}, 'x' * 10000000), StompFrame('SEND', {'destination': '/queue/test'}, 'hi')]
+        expected = ''.join(map(str, frames))
+        broker, client = socket.socketpair()
+        self.addCleanup(broker.close)
+        self.addCleanup(client.close)
+
+        transport = StompFrameTransport(HOST, PORT, sendTimeout=0.05)
+        transport._socket = client
+        started = time.time()
+        self.assertRaises(StompSendTimeout, transport.send, frames[0]) # the broker does not read
+        self.assertTrue(time.time() - started < 1)
+        self.assertTrue(transport._pending)
+
+        received = []
+
+        def read():
+            size = 0
+            while size < len(expected):
+                data = broker.recv(65536)
+                received.append(data)
+                size += len(data)
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        transport.sendTimeout = None
+        transport.send(frames[1])
+        thread.join(5)
+        self.assertEquals(''.join(received), expected)
+        self.assertFalse(transport._pending)
+
+    def test_send_timeout_keeps_spooled_writes_pending(self):
+        frames = [StompFrame('SEND', {'destination': '/queue/test'}, 'x' * 10000000), StompFrame('SEND', {'destination': '/queue/test'}, 'hi')]
+        expected = ''.join(map(str, frames))
+        broker, client = socket.socketpair()
+        self.addCleanup(broker.close)
+        self.addCleanup(client.close)
+
+        transport = StompFrameTransport(HOST, PORT, sendTimeout=0.05)
+        transport._socket = client
+        write = _Write(str(frames[0])) # the frame of a thread which is waiting for the write lock
+        transport._pending.append(write)
+        self.assertRaises(StompSendTimeout, transport.send, frames[1]) # only the thread which hit the deadline sees it
+        self.assertFalse(write.done)
+
+        received = []
+
+        def read():
+            size = 0
+            while size < len(expected):
+                data = broker.recv(65536)
+                received.append(data)
+                size += len(data)
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        transport.sendTimeout = None
+        transport._flush(write) # the waiting thread writes the spooled data itself
+        thread.join(5)
+        self.assertTrue(write.done)
+        self.assertEquals(write.error, None)
+        self.assertEquals(''.join(received), expected)
+        self.assertFalse(transport._pending)
+
+    def test_send_timeout_waits_only_if_buffer_full(self):
+        frame = StompFrame('SEND', {'destination': '/queue/test'}, 'hi')
+        broker, client = socket.socketpair()
+        self.addCleanup(broker.close)
+        self.addCleanup(client.close)
+
+        transport = StompFrameTransport(HOST, PORT, sendTimeout=1)
+        transport._socket = client
+        with patch('stompest.sync.transport._writable') as writable:
+            transport.send(frame)
+        self.assertEquals(writable.call_count, 0)
+        self.assertEquals(broker.recv(1000), str(frame))
+
+    def test_probe(self):
+        broker, client = socket.socketpair()
+        self.addCleanup(broker.close)
+
+        transport = StompFrameTransport(HOST, PORT)
+        transport._socket = client
+        transport.probe(1)
+        broker.send(str(StompFrame('MESSAGE')))
+        transport.probe(0) # pending data is not consumed
+        self.assertEquals(transport.receive(), StompFrame('MESSAGE'))
+
+        broker.close()
+        transport.probe(1) # the connection was active within the interval, so there is no system call
+        self.assertRaises(StompConnectionError, transport.probe, 0)
+        self.assertEquals(transport._socket, None)
+
+    def test_send_error_disconnects(self):
+        transport = self._get_send_mock()
+        transport._socket.sendall.side_effect = socket.error('broken pipe')
+        self.assertRaises(StompConnectionError, transport.send, StompFrame('MESSAGE'))
+        self.assertEquals(transport._socket, None)
+
+    def test_send_error_reaches_all_writers(self):
+        transport = self._get_send_mock()
+        transport._socket.sendall.side_effect = socket.error('broken pipe')
+        write = _Write(str(StompFrame('SEND'))) # the frame of a thread which is waiting for the write lock
+        transport._pending.append(write)
+        self.assertRaises(StompConnectionError, transport.send, StompFrame('MESSAGE'))
+        self.assertTrue(write.done)
+        self.assertRaises(StompConnectionError, transport._flush, write)
+
+    def test_send_buffered(self):
+        frames = [StompFrame('SEND', {'destination': '/queue/test'}, 'x' * 100) for _ in xrange(5)]
+        transport = self._get_send_mock()
+        transport.bufferSize = 2 * len(str(frames[0])) + 1
+        for frame in frames[:3]:
+            transport.send(frame)
+        self.assertEquals(transport._socket.sendall.call_count, 1)
+        self.assertEquals(transport._socket.sendall.call_args[0][0], ''.join(map(str, frames[:3])))
+
+        transport.sendFrames(frames[3:])
+        self.assertEquals(transport._socket.sendall.call_count, 1)
+        transport.flush()
+        self.assertEquals(transport._socket.sendall.call_count, 2)
+        self.assertEquals(transport._socket.sendall.call_args[0][0], ''.join(map(str, frames[3:])))
+        transport.flush()
+        self.assertEquals(transport._socket.sendall.call_count, 2)
+
+        transport.send(frames[0])
+        transport._socket.recv.return_value = ''
+        sock = transport._socket
+        self.assertRaises(StompConnectionError, transport.receive)
+        self.assertEquals(sock.sendall.call_count, 3) # the buffer was written before waiting for data
+        self.assertEquals(transport._socket, None)
+
+    def test_disconnect_closes_after_send_timeout(self):
+        transport = self._get_send_mock()
+        transport.bufferSize = 1000000
+        transport.sendTimeout = 0.01
+        transport.send(StompFrame('SEND', {'destination': '/queue/test'}, 'hi'))
+        sock = transport._socket
+        sock.send.side_effect = socket.error(errno.EAGAIN, 'try again')
+        with patch('stompest.sync.transport._writable', return_value=False):
+            transport.disconnect()
+        self.assertEquals(sock.close.call_count, 1)
+        self.assertEquals(transport._socket, None)
+
+    def test_send_buffered_timeout(self):
+        transport = self._get_send_mock()
+        transport.bufferSize = 1000000
+        transport.bufferTimeout = 0.01
+        transport.send(StompFrame('SEND', {'destination': '/queue/test'}, 'hi'))
+        self.assertEquals(transport._socket.sendall.call_count, 0)
+        time.sleep(0.1)
+        self.assertEquals(transport._socket.sendall.call_count, 1)
+
+    def test_batch(self):
+        transport = self._get_send_mock()
+        frames = [StompFrame('SEND', {'destination': '/queue/test'}, str(i)) for i in xrange(3)]
+        with transport.batch():
+            with transport.batch():
+                transport.send(frames[0])
+            transport.send(frames[1])
+            self.assertEquals(transport._socket.sendall.call_count, 0)
+        self.assertEquals(transport._socket.sendall.call_count, 1)
+        self.assertEquals(transport._socket.sendall.call_args[0][0], ''.join(map(str, frames[:2])))
+        transport.send(frames[2]) # no buffering outside of a batch
+        self.assertEquals(transport._socket.sendall.call_count, 2)
+
+    def test_batch_cork(self):
+        if not hasattr(socket, 'TCP_CORK'):
+            return
+        transport = self._get_send_mock()
+        transport.cork = True
+        with transport.batch():
+            transport._socket.setsockopt.assert_called_once_with(socket.IPPROTO_TCP, socket.TCP_CORK, 1)
+            transport.send(StompFrame('SEND', {'destination': '/queue/test'}, 'hi'))
+        transport._socket.setsockopt.assert_called_with(socket.IPPROTO_TCP, socket.TCP_CORK, 0)
+        self.assertEquals(transport._socket.sendall.call_count, 1)
+
+    def test_connect_socket_options(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.addCleanup(server.close)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        options = StompSocketOptions(StompFailoverUri('tcp://localhost:61613?tcpNoDelay=true,keepAlive=true,localAddress=127.0.0.1').options)
+
+        transport = StompFrameTransport('127.0.0.1', server.getsockname()[1], socketOptions=options)
+        transport.connect(timeout=1)
+        self.addCleanup(transport.disconnect)
+        peer, address = server.accept()
+        peer.close()
+        self.assertEquals(transport._socket.getsockname(), address)
+        self.assertTrue(transport._socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.assertTrue(transport._socket.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+
     def test_send_not_connected_raises(self):
         frame = StompFrame('MESSAGE')
 
@@ -101,6 +327,37 @@ class StompFrameTransportTest(unittest.TestCase):
         self.assertRaises(StompConnectionError, transport.receive)
         self.assertEquals(transport._socket, None)
 
+    def test_receive_adaptive_read_size(self):
+        frames = [StompFrame('MESSAGE', {'x': 'y'}, 'x' * 100000), StompFrame('MESSAGE', {'x': 'y'}, 'hi')]
+        transport = self._get_receive_mock(''.join(map(str, frames)))
+        self.assertEquals(transport.receive(), frames[0])
+        self.assertEquals(transport._socket.recv.call_args_list[0][0][0], transport.READ_SIZE)
+        self.assertEquals(transport._socket.recv.call_args_list[1][0][0], 2 * transport.READ_SIZE)
+        self.assertEquals(transport.receive(), frames[1])
+        self.assertTrue(transport.statistics()['readSize'] > transport.READ_SIZE)
+
+        transport = self._get_receive_mock(str(frames[1])) # chatty traffic
+        transport._readSize = 4 * transport.READ_SIZE
+        self.assertEquals(transport.receive(), frames[1])
+        self.assertEquals(transport.statistics(), {'reads': 1, 'bytes': len(str(frames[1])), 'readSize': 2 * transport.READ_SIZE, 'writes': 0})
+
+    def test_receive_content_length(self):
+        body = 'x' * 5000000
+        frame = StompFrame('MESSAGE', {'content-length': str(len(body))}, body)
+        broker, client = socket.socketpair()
+        self.addCleanup(broker.close)
+        thread = threading.Thread(target=broker.sendall, args=(str(frame),))
+        thread.start()
+
+        transport = StompFrameTransport(HOST, PORT)
+        transport._socket = client
+        self.addCleanup(transport.disconnect)
+        self.assertEquals(transport.receive(), frame)
+        thread.join()
+        statistics = transport.statistics()
+        self.assertEquals(statistics['bytes'], len(str(frame)))
+        self.assertTrue(statistics['reads'] < len(body) // transport.READ_SIZE // 10)
+
     def test_receive_multiple_frames_per_read(self):
         body1 = 'boo'
         body2 = 'hoo'
@@ -0,0 +1,83 @@
+"""Wire-level tracing of STOMP frames for both clients. The frames are logged on level :attr:`DEBUG` to a dedicated logger (:attr:`LOG_CATEGORY`), so you can turn frame tracing on and off independently of all other log output of stompest. A log record is only formatted when a handler actually emits it, and the tracer can be told to log only every n-th frame and at most a certain number of frames per second. Sampling and rate limits apply per category, where a category is the direction (sending or receiving) together with the STOMP command.
+
+Example:
+
+>>> import logging
+>>> from stompest.trace import StompFrameTracer
+>>> logging.getLogger('stompest.trace').setLevel(logging.INFO) # turn off frame tracing altogether
+>>> tracer = StompFrameTracer(sample=100, rate=10) # or: log every 100th frame, but no more than 10 frames per second and category
+
+"""
+import logging
+import time
+
+LOG_CATEGORY = __name__
+
+class StompFrameTracer(object):
+    """This object decides which STOMP frames are logged.
+
+    :param sample: Log only one in **sample** frames (per category).
+    :param rate: Log at most **rate** frames per second (per category). If :obj:`None`, there is no such limit. The number of frames which were suppressed by the rate limit will be logged when the limit is lifted.
+    :param log: The logger. The default :obj:`None` means the logger :attr:`LOG_CATEGORY`.
+    :param clock: A callable which returns the current time (in seconds).
+    """
+    SENDING = 'Sending'
+    RECEIVED = 'Received'
+
+    def __init__(self, sample=1, rate=None, log=None, clock=time.time):
+        self.sample = sample
+        self.rate = rate
+        self.log = log or logging.getLogger(LOG_CATEGORY)
+        self._clock = clock
+        self._categories = {}
+
+    def sending(self, frame):
+        """Trace a frame which is about to be sent."""
+        if self.log.isEnabledFor(logging.DEBUG):
+            self._trace(self.SENDING, frame)
+
+    def received(self, frame):
+        """Trace a frame which was received."""
+        if self.log.isEnabledFor(logging.DEBUG):
+            self._trace(self.RECEIVED, frame)
+
+    def _trace(self, direction, frame):
+        key = (direction, getattr(frame, 'command', None))
+        try:
+            category = self._categories[key]
+        except KeyError:
+            category = self._categories[key] = _Category()
+
+        category.seen += 1
+        if (self.sample > 1) and ((category.seen - 1) % self.sample):
+            return
+
+        if self.rate is not None:
+            now = self._clock()
+            if (now - category.since) >= 1.0:
+                if category.suppressed:
+                    self.log.debug('%s: %d frames suppressed (rate limit %s/s)', direction, category.suppressed, self.rate)
+                category.since, category.count, category.suppressed = now, 0, 0
+            if category.count >= self.rate:
+                category.suppressed += 1
+                return
+            category.count += 1
+
+        self.log.debug('%s %s', direction, _Info(frame))
+
+class _Category(object):
+    __slots__ = ('seen', 'since', 'count', 'suppressed')
+
+    def __init__(self):
+        self.seen = self.count = self.suppressed = 0
+        self.since = float('-inf')
+
+class _Info(object):
+    # defer frame.info() until the log record is actually formatted
+    __slots__ = ('frame',)
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def __str__(self):
+        return self.frame.info()